@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+""" Compare the buffered file and the memory mapped backends of the readers
+
+Usage: blender --background --python benchmarks/benchmark_file_read_stream.py -- [--vertices N] [--frames N] [--repeat N]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from miu_mmd_tools.core import pmd
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import vmd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'tests')
+OUTPUT_DIR = os.path.join(TESTS_DIR, 'output')
+
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+import synthetic_data
+from benchmark_utils import best_time
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vertices', type=int, default=300000)
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel('ERROR')
+
+    pmx_path = os.path.join(OUTPUT_DIR, 'benchmark.pmx')
+    pmd_path = os.path.join(OUTPUT_DIR, 'benchmark.pmd')
+    vmd_path = os.path.join(OUTPUT_DIR, 'benchmark.vmd')
+    synthetic_data.save_pmx_model(pmx_path, vertex_count=args.vertices)
+    synthetic_data.save_pmd_model(pmd_path, vertex_count=min(args.vertices, 0xffff))
+    synthetic_data.save_vmd_file(vmd_path, frame_count=args.frames)
+
+    cases = (
+        ('pmx', pmx_path, lambda use_mmap: pmx.load(pmx_path, use_mmap=use_mmap)),
+        ('pmx (vertex_array)', pmx_path, lambda use_mmap: pmx.load(pmx_path, vertex_array=True, use_mmap=use_mmap)),
+        ('pmd', pmd_path, lambda use_mmap: pmd.load(pmd_path, use_mmap=use_mmap)),
+        ('vmd', vmd_path, lambda use_mmap: vmd.File().load(filepath=vmd_path, use_mmap=use_mmap)),
+        )
+
+    print('%-20s %10s %10s %10s %8s'%('format', 'size(MB)', 'file(s)', 'mmap(s)', 'ratio'))
+    for name, path, func in cases:
+        t_file = best_time(lambda: func(False), args.repeat)
+        t_mmap = best_time(lambda: func(True), args.repeat)
+        size = os.path.getsize(path) / (1 << 20)
+        print('%-20s %10.1f %10.3f %10.3f %8.2f'%(name, size, t_file, t_mmap, t_file/t_mmap))
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+""" Track the load time and the allocations of the PMX, PMD and VMD readers
+
+For each format the best load time is measured, then the file is loaded once
+more under tracemalloc to count the memory blocks which are kept by the loaded
+data (live blocks) and the peak of the traced memory.
+
+Save the results by --save FILE, and compare a later run with them by
+--compare FILE to see the regressions.
+
+Usage: blender --background --python benchmarks/benchmark_formats.py -- [--vertices N] [--frames N] [--repeat N] [--save FILE] [--compare FILE]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+from miu_mmd_tools.core import pmd
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import vmd
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'tests')
+OUTPUT_DIR = os.path.join(TESTS_DIR, 'output')
+
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+import synthetic_data
+from benchmark_utils import best_time
+
+
+def load_vmd(path, **args):
+    ret = vmd.File()
+    ret.load(filepath=path, **args)
+    return ret
+
+def trace_allocations(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        data = func()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    stats = snapshot.statistics('filename')
+    del data
+    return sum(x.count for x in stats), current, peak
+
+def run(args):
+    pmx_path = os.path.join(OUTPUT_DIR, 'benchmark.pmx')
+    pmd_path = os.path.join(OUTPUT_DIR, 'benchmark.pmd')
+    vmd_path = os.path.join(OUTPUT_DIR, 'benchmark.vmd')
+    synthetic_data.save_pmx_model(pmx_path, vertex_count=args.vertices)
+    synthetic_data.save_pmd_model(pmd_path, vertex_count=min(args.vertices, 0xffff))
+    synthetic_data.save_vmd_file(vmd_path, frame_count=args.frames)
+
+    cases = (
+        ('pmx', lambda: pmx.load(pmx_path)),
+        ('pmx (vertex_array)', lambda: pmx.load(pmx_path, vertex_array=True)),
+        ('pmd', lambda: pmd.load(pmd_path)),
+        ('vmd', lambda: load_vmd(vmd_path)),
+        ('vmd (use_arrays)', lambda: load_vmd(vmd_path, use_arrays=True)),
+        ('vmd (lazy)', lambda: load_vmd(vmd_path, use_mmap=True, lazy=True)),
+        )
+
+    results = {}
+    for name, func in cases:
+        elapsed = best_time(func, args.repeat)
+        blocks, current, peak = trace_allocations(func)
+        results[name] = {'time':elapsed, 'blocks':blocks, 'memory':current, 'peak':peak}
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vertices', type=int, default=100000)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='save the results to a json file')
+    parser.add_argument('--compare', help='compare the results with a json file saved by --save')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel('ERROR')
+    results = run(args)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    def __delta(name, key):
+        if name not in baseline or not baseline[name][key]:
+            return ''
+        return '(%+.1f%%)'%(100.0*(results[name][key]/baseline[name][key] - 1))
+
+    print('%-20s %18s %22s %18s %18s'%('format', 'load(s)', 'live blocks', 'live(MB)', 'peak(MB)'))
+    for name, r in results.items():
+        print('%-20s %8.3f %9s %12d %9s %8.1f %9s %8.1f %9s'%(
+            name,
+            r['time'], __delta(name, 'time'),
+            r['blocks'], __delta(name, 'blocks'),
+            r['memory']/(1 << 20), __delta(name, 'memory'),
+            r['peak']/(1 << 20), __delta(name, 'peak'),
+            ))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
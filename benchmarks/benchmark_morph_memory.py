@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+""" Compare the peak memory of packed and object vertex/UV morph offsets
+
+Each case loads the model in a new process and reports its peak RSS, which
+is read by resource.getrusage() (Linux/macOS only).
+
+Usage: blender --background --python benchmarks/benchmark_morph_memory.py -- [--vertices N] [--morphs N] [--morph-size N]
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from miu_mmd_tools.core import pmx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TESTS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'tests')
+OUTPUT_DIR = os.path.join(TESTS_DIR, 'output')
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+CASES = ('baseline', 'arrays', 'objects')
+
+
+def peak_rss():
+    ret = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return ret if sys.platform == 'darwin' else ret * 1024
+
+def run_case(path, case):
+    logging.getLogger().setLevel('ERROR')
+    start = time.perf_counter()
+    if case == 'baseline':
+        model = pmx.load(path, sections=[x for x in pmx.Model.SECTIONS if x != 'morphs'])
+    else:
+        model = pmx.load(path)
+    if case == 'objects':
+        # the offsets as lists of VertexMorphOffset/UVMorphOffset objects
+        for m in model.morphs:
+            if isinstance(m.offsets, pmx.MorphOffsetArray):
+                m.offsets = list(m.offsets)
+    elapsed = time.perf_counter() - start
+    offsets = sum(len(m.offsets) for m in model.morphs) if case != 'baseline' else 0
+    print(json.dumps({'case':case, 'offsets':offsets, 'peak_rss':peak_rss(), 'time':elapsed}))
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vertices', type=int, default=100000)
+    parser.add_argument('--morphs', type=int, default=300)
+    parser.add_argument('--morph-size', type=int, default=5000)
+    parser.add_argument('--case', choices=CASES)
+    parser.add_argument('--path')
+    args = parser.parse_args(argv)
+
+    if args.case:
+        run_case(args.path, args.case)
+        return
+
+    logging.getLogger().setLevel('ERROR')
+    path = os.path.join(OUTPUT_DIR, 'benchmark_morph.pmx')
+    synthetic_data.save_pmx_model(path, vertex_count=args.vertices, morph_count=args.morphs, morph_size=args.morph_size)
+
+    python_path = [os.path.dirname(TESTS_DIR)] + [x for x in [os.environ.get('PYTHONPATH')] if x]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(python_path))
+    results = {}
+    for case in CASES:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--', '--case', case, '--path', path],
+                                env=env, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        results[case] = json.loads(output.strip().splitlines()[-1])
+
+    baseline = results['baseline']['peak_rss']
+    print('%-10s %10s %14s %14s %10s'%('case', 'offsets', 'peak RSS(MB)', 'morphs(MB)', 'load(s)'))
+    for case in CASES:
+        r = results[case]
+        print('%-10s %10d %14.1f %14.1f %10.3f'%(case, r['offsets'], r['peak_rss']/(1 << 20), (r['peak_rss'] - baseline)/(1 << 20), r['time']))
+
+if __name__ == '__main__':
+    main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+""" Helpers of the benchmark scripts """
+
+import time
+
+
+def best_time(func, repeat=3):
+    ret = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        ret = elapsed if ret is None else min(ret, elapsed)
+    return ret
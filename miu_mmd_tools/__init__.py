@@ -87,6 +87,17 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
             soft_max=10,
             default=1.5,
             )
+    model_cache_folder = bpy.props.StringProperty(
+            name='Model Cache Folder',
+            description='Path for caching the parsed model files (a folder of the blender user resources is used if empty)',
+            subtype='DIR_PATH',
+            )
+    model_cache_size = bpy.props.IntProperty(
+            name='Model Cache Size (MB)',
+            description='The least recently used model files are removed from the cache above this size',
+            min=0,
+            default=1024,
+            )
 
     def draw(self, context):
         layout = self.layout
@@ -94,6 +105,10 @@ class MMDToolsAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "base_texture_folder")
         layout.prop(self, "dictionary_folder")
         layout.prop(self, "non_collision_threshold")
+        row = layout.row()
+        row.prop(self, "model_cache_folder")
+        row.prop(self, "model_cache_size")
+        row.operator('miu_mmd_tools.clear_model_cache', text='', icon='X')
 
 
 # def menu_func_import(self, context):
@@ -4,10 +4,12 @@ import bpy
 from bpy.types import PoseBone
 
 from math import pi
+import numpy as np
 import math
 from mathutils import Vector, Quaternion, Matrix
 from miu_mmd_tools import bpyutils
 from miu_mmd_tools.bpyutils import TransformConstraintOp
+from miu_mmd_tools.core.quaternions import multiplyQuaternions, canonicalQuaternions
 
 
 def remove_constraint(constraints, name):
@@ -485,12 +487,42 @@ def get_global_x_axis(bone: bpy.types.Bone):
     if bone.name not in DISPLAY_BONE_PAIR:
         return bone.vector.normalized()
 
-    for cbone in bone.children_recursive:
-        if cbone.name in DISPLAY_BONE_PAIR[bone.name]:
-            return (cbone.head - bone.head).normalized()
+    cbone = get_display_pair_bone(bone)
+    if cbone is not None:
+        return (cbone.head - bone.head).normalized()
 
     return bone.vector.normalized()
-    
+
+def _get_bone_collection(bone):
+    if isinstance(bone, PoseBone):
+        return bone.id_data.pose.bones
+    if isinstance(bone, bpy.types.Bone):
+        return bone.id_data.bones
+    if isinstance(bone, bpy.types.EditBone):
+        return bone.id_data.edit_bones
+    return None
+
+# 表示先のペアボーン取得
+def get_display_pair_bone(bone):
+    bones = _get_bone_collection(bone)
+    if bones is None:
+        return next((c for c in bone.children_recursive if c.name in DISPLAY_BONE_PAIR[bone.name]), None)
+
+    # children_recursive の最初のペアボーン（親からの距離、ボーンの順）を、ペアボーンから親をたどって探す
+    candidates = []
+    for name in DISPLAY_BONE_PAIR[bone.name]:
+        cbone = bones.get(name)
+        if cbone is None:
+            continue
+        distance, parent = 1, cbone.parent
+        while parent is not None and parent.name != bone.name:
+            distance, parent = distance + 1, parent.parent
+        if parent is not None:
+            candidates.append((distance, bones.find(name), cbone))
+    if candidates:
+        return min(candidates, key=lambda x: x[:2])[2]
+    return None
+
 # クォータニオンをローカル軸の回転量に分離
 def separate_local_qq(qq: Quaternion, bone: bpy.types.Bone):
     if bone.name.endswith(".R"):
@@ -746,3 +778,67 @@ def separate_local_qq_by_left(qq: Quaternion, bone: bpy.types.Bone):
     x_qq = (mat_z4_r2.inverted() @ mat_z4_r1 @ mat_z4_r3.inverted()).to_quaternion()
 
     return x_qq, y_qq, z_qq
+
+# 配列版のクォータニオン (w, x, y, z) 演算
+def _qq_conj(q):
+    return q*(1, -1, -1, -1)
+
+def _qq_rotate(q, v):
+    # (Matrix.Identity(3).rotate(q)).to_4x4() @ v の正規化
+    t = 2*np.cross(q[..., 1:], v)
+    ret = v + q[..., :1]*t + np.cross(q[..., 1:], t)
+    return ret/np.maximum(np.linalg.norm(ret, axis=-1, keepdims=True), 1e-30)
+
+def _qq_rotation_difference(v0, v1):
+    # Vector.rotation_difference() と同じ結果
+    v0, v1 = np.broadcast_arrays(v0, v1)
+    v0 = v0/np.maximum(np.linalg.norm(v0, axis=-1, keepdims=True), 1e-30)
+    v1 = v1/np.maximum(np.linalg.norm(v1, axis=-1, keepdims=True), 1e-30)
+    axis = np.cross(v0, v1)
+    axis_len = np.linalg.norm(axis, axis=-1, keepdims=True)
+    dot = (v0*v1).sum(axis=-1, keepdims=True)
+    angle = np.where(dot >= 0,
+                     2*np.arcsin(np.minimum(1, np.linalg.norm(v0 - v1, axis=-1, keepdims=True)/2)),
+                     pi - 2*np.arcsin(np.minimum(1, np.linalg.norm(v0 + v1, axis=-1, keepdims=True)/2)))
+    # 平行の場合、同じ向きは無回転、逆向きは直交軸で180度回転
+    dominant = np.argmax(np.abs(v0), axis=-1)[..., None]
+    x, y, z = v0[..., :1], v0[..., 1:2], v0[..., 2:]
+    ortho = np.where(dominant == 0, np.concatenate([-y - z, x, x], axis=-1),
+            np.where(dominant == 1, np.concatenate([y, -x - z, y], axis=-1),
+                                    np.concatenate([z, z, -x - y], axis=-1)))
+    ortho = ortho/np.maximum(np.linalg.norm(ortho, axis=-1, keepdims=True), 1e-30)
+    is_parallel = axis_len <= 1.1920929e-07 # FLT_EPSILON
+    axis = np.where(is_parallel, ortho, axis/np.maximum(axis_len, 1e-30))
+    angle = np.where(is_parallel, np.where(dot > 0, 0.0, pi), angle)
+    return np.concatenate([np.cos(angle/2), axis*np.sin(angle/2)], axis=-1)
+
+# クォータニオンの配列 (w, x, y, z) をローカル軸の回転量に分離 (separate_local_qq と同じ順序で返す)
+def separate_local_qqs(qqs, bone: bpy.types.Bone):
+    qqs = np.asarray(qqs, dtype=np.float64).reshape(-1, 4)
+    local_axis = np.array([1.0, 0.0, 0.0])
+    global_x_axis = np.array(get_global_x_axis(bone))
+    global2local_qq = _qq_rotation_difference(global_x_axis, local_axis)
+    local2global_qq = _qq_rotation_difference(local_axis, global_x_axis)
+    # 左右のボーンは右手系
+    is_right = bone.name.endswith(".R") or bone.name.endswith(".L")
+    flat_index = 0 if is_right else 1
+
+    # ねじれを無視した回転量
+    swing_qq = _qq_rotation_difference(global_x_axis, _qq_rotate(qqs, global_x_axis))
+
+    # 回転からひとつの成分を取り出す
+    vec = _qq_rotate(multiplyQuaternions(global2local_qq, swing_qq), local_axis)
+    vec[:, flat_index] = 0
+    a_qq = canonicalQuaternions(multiplyQuaternions(local2global_qq, _qq_rotation_difference(local_axis, vec)))
+
+    # 残りの成分の捻れをキャンセル
+    b_qq = canonicalQuaternions(multiplyQuaternions(swing_qq, _qq_conj(a_qq)))
+    b_qq = _qq_rotation_difference(global_x_axis, _qq_rotate(b_qq, global_x_axis))
+
+    if is_right:
+        # z, y, x
+        y_qq = canonicalQuaternions(multiplyQuaternions(multiplyQuaternions(qqs, _qq_conj(a_qq)), _qq_conj(b_qq)))
+        return b_qq, y_qq, a_qq
+    # x, y, z
+    z_qq = canonicalQuaternions(multiplyQuaternions(multiplyQuaternions(_qq_conj(a_qq), qqs), _qq_conj(b_qq)))
+    return b_qq, a_qq, z_qq
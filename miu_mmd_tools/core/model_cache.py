@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+""" On-disk cache of parsed MMD models
+
+The value returned by a loader function is stored in a npz file without
+pickle: the numpy arrays, such as the columns of pmx.VertexArray and
+pmx.MorphOffsetArray, are written as the arrays of the file, and the rest of
+the value is a json header of plain values and the states of the pmx
+classes, which are the only classes restored by the cache. Each entry has a
+small json file of metadata. The entries are keyed by the content hash of
+the source file, the loader and its options.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from miu_mmd_tools.core import pmx
+
+CACHE_VERSION = 3
+
+def default_directory():
+    """ Return the cache folder of the current user, in the blender user resource folder if possible """
+    try:
+        import bpy
+        return bpy.utils.user_resource('DATAFILES', path=os.path.join('miu_mmd_tools', 'model_cache'))
+    except (ImportError, AttributeError):
+        return os.path.join(os.path.expanduser('~'), '.cache', 'miu_mmd_tools', 'model_cache')
+
+def _models(value):
+    """ Return the pmx models of a cached value """
+    return [x for x in (value if isinstance(value, (tuple, list)) else (value,)) if isinstance(x, pmx.Model)]
+
+def _loaded_textures(model):
+    # the textures of a lazy section are read from model.filepath later
+    return [x for x in vars(model).get('textures', ()) if x.path]
+
+class _Encoder:
+    """ Encode a value to (json header, arrays) """
+    def __init__(self):
+        self.arrays = {}
+
+    def __array(self, value):
+        name = 'a%d'%len(self.arrays)
+        self.arrays[name] = value
+        return name
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, list):
+            return [self.encode(x) for x in value]
+        if isinstance(value, tuple):
+            return {'tuple': [self.encode(x) for x in value]}
+        if isinstance(value, dict):
+            return {'dict': [[self.encode(k), self.encode(v)] for k, v in value.items()]}
+        if isinstance(value, (set, frozenset)):
+            return {'set': [self.encode(x) for x in value]}
+        if isinstance(value, bytes):
+            return {'bytes': self.__array(np.frombuffer(value, dtype=np.uint8))}
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError('can not cache an object array')
+            return {'array': self.__array(value)}
+        if isinstance(value, np.generic):
+            return {'scalar': self.__array(np.asarray(value))}
+        cls = value if isinstance(value, type) else value.__class__
+        if getattr(pmx, cls.__name__, None) is not cls:
+            raise TypeError('can not cache an object of %s'%cls.__name__)
+        if cls is value:
+            return {'class': cls.__name__}
+        return {'object': cls.__name__, 'state': self.encode(_object_state(value))}
+
+def _object_state(obj):
+    state = dict(getattr(obj, '__dict__', {}))
+    for cls in obj.__class__.__mro__:
+        for name in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                state[name] = getattr(obj, name)
+    return state
+
+def _pmx_class(name):
+    cls = getattr(pmx, name, None)
+    if not isinstance(cls, type) or cls.__module__ != pmx.__name__:
+        raise ValueError('invalid class %s'%name)
+    return cls
+
+def _decode(value, arrays):
+    if isinstance(value, list):
+        return [_decode(x, arrays) for x in value]
+    if not isinstance(value, dict):
+        return value
+    (kind, data), = ((k, v) for k, v in value.items() if k != 'state')
+    if kind == 'tuple':
+        return tuple(_decode(x, arrays) for x in data)
+    if kind == 'dict':
+        return {_decode(k, arrays):_decode(v, arrays) for k, v in data}
+    if kind == 'set':
+        return set(_decode(x, arrays) for x in data)
+    if kind == 'bytes':
+        return arrays[data].tobytes()
+    if kind == 'array':
+        return arrays[data]
+    if kind == 'scalar':
+        return arrays[data][()]
+    if kind == 'class':
+        return _pmx_class(data)
+    if kind == 'object':
+        cls = _pmx_class(data)
+        ret = cls.__new__(cls)
+        for k, v in _decode(value['state'], arrays).items():
+            object.__setattr__(ret, k, v)
+        return ret
+    raise ValueError('invalid value type %s'%kind)
+
+def _normpath(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def _relpath(path, start):
+    if not os.path.isabs(path):
+        return path
+    try:
+        return os.path.relpath(path, start)
+    except ValueError: # on another drive
+        return path
+
+class ModelCache:
+    """ A directory of cached models
+
+    The least recently used entries are removed when the total size of the
+    entries exceeds max_size bytes. The content hash of a file is computed
+    once per file size and mtime.
+    """
+    ENTRY_EXT = '.cache'
+    META_EXT = '.json'
+
+    def __init__(self, directory=None, max_size=1 << 30):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.__hashes = {}
+
+    def __repr__(self):
+        return '<ModelCache %s, max_size %d>'%(self.directory, self.max_size)
+
+    def __path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def __keys(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [x[:-len(self.ENTRY_EXT)] for x in os.listdir(self.directory) if x.endswith(self.ENTRY_EXT)]
+
+    def __remove(self, key):
+        for ext in (self.ENTRY_EXT, self.META_EXT):
+            try:
+                os.remove(self.__path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def file_hash(self, filepath):
+        st = os.stat(filepath)
+        memo_key = (_normpath(filepath), st.st_size, st.st_mtime_ns)
+        ret = self.__hashes.get(memo_key, None)
+        if ret is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+            ret = self.__hashes[memo_key] = h.hexdigest()
+        return ret
+
+    def key(self, filepath, **options):
+        options = json.dumps([CACHE_VERSION, options], sort_keys=True, default=sorted)
+        return '%s-%s'%(self.file_hash(filepath), hashlib.blake2b(options.encode('utf-8'), digest_size=8).hexdigest())
+
+    def get(self, key):
+        """ Return the cached value of key, or None if there is no valid entry """
+        path = self.__path(key, self.ENTRY_EXT)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                header = json.loads(data['header'].tobytes().decode('utf-8'))
+                if header['version'] != CACHE_VERSION:
+                    raise ValueError('cache version %s'%header['version'])
+                ret = _decode(header['value'], {k:data[k] for k in data.files if k != 'header'})
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(' * Removed the broken cache entry "%s": %s', path, e)
+            self.__remove(key)
+            return None
+        os.utime(path) # mark as recently used
+        return ret
+
+    def put(self, key, value, **metadata):
+        encoder = _Encoder()
+        header = json.dumps({'version':CACHE_VERSION, 'value':encoder.encode(value)}).encode('utf-8')
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self.__path(key, self.ENTRY_EXT)
+        temp_path = '%s.%d.tmp'%(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, header=np.frombuffer(header, dtype=np.uint8), **encoder.arrays)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        metadata.update(version=CACHE_VERSION, created=time.time())
+        with open(self.__path(key, self.META_EXT), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, default=sorted)
+        self.evict()
+
+    def load(self, filepath, loader, **options):
+        """ Return loader(filepath, **options), which is cached by the file content and the options """
+        loader_name = '%s.%s'%(loader.__module__, loader.__qualname__)
+        key = self.key(filepath, loader=loader_name, **options)
+        folder = os.path.dirname(os.path.abspath(filepath))
+        ret = self.get(key)
+        if ret is not None:
+            logging.info('Loaded "%s" from the model cache', filepath)
+            # the lazy sections and the texture paths of the cached models are of filepath, which has the same content
+            for model in _models(ret):
+                model.filepath = filepath
+                for texture in _loaded_textures(model):
+                    texture.path = os.path.normpath(os.path.join(folder, texture.path))
+            return ret
+        ret = loader(filepath, **options)
+        st = os.stat(filepath)
+        # the texture paths are cached relative to the folder of the model
+        textures = [x for model in _models(ret) for x in _loaded_textures(model)]
+        texture_paths = [x.path for x in textures]
+        try:
+            for texture in textures:
+                texture.path = _relpath(texture.path, folder)
+            self.put(key, ret, filepath=_normpath(filepath), size=st.st_size, mtime=st.st_mtime,
+                     loader=loader_name, options=options)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(' * Failed to cache "%s": %s', filepath, e)
+            self.__remove(key)
+        finally:
+            for texture, path in zip(textures, texture_paths):
+                texture.path = path
+        return ret
+
+    def entries(self):
+        """ Return a list of (key, metadata, entry size) """
+        ret = []
+        for key in self.__keys():
+            try:
+                with open(self.__path(key, self.META_EXT), encoding='utf-8') as f:
+                    metadata = json.load(f)
+                size = os.path.getsize(self.__path(key, self.ENTRY_EXT))
+            except (OSError, ValueError):
+                continue
+            ret.append((key, metadata, size))
+        return ret
+
+    def size(self):
+        return sum(os.path.getsize(self.__path(key, self.ENTRY_EXT)) for key in self.__keys())
+
+    def invalidate(self, filepath=None):
+        """ Remove the entries of filepath, or all entries if filepath is None """
+        if filepath is None:
+            keys = self.__keys()
+            self.__hashes.clear()
+        else:
+            filepath = _normpath(filepath)
+            keys = [key for key, metadata, size in self.entries() if metadata.get('filepath', None) == filepath]
+            self.__hashes = {k:v for k, v in self.__hashes.items() if k[0] != filepath}
+        for key in keys:
+            self.__remove(key)
+        return len(keys)
+
+    def evict(self):
+        """ Remove the least recently used entries until the total size is not more than max_size """
+        entries = []
+        for key in self.__keys():
+            try:
+                st = os.stat(self.__path(key, self.ENTRY_EXT))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, key))
+        total = sum(x[1] for x in entries)
+        for mtime, size, key in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.__remove(key)
+            total -= size
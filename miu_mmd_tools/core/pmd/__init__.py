@@ -2,6 +2,7 @@
 import struct
 import os
 import re
+import mmap
 import logging
 import collections
 
@@ -41,52 +42,126 @@ class FileStream:
 
 
 class  FileReadStream(FileStream):
-    def __init__(self, path, pmx_header=None):
+    """ Read PMD data from a file
+
+    With use_mmap=True, the file is memory mapped and values are decoded by
+    struct.unpack_from() at a moving offset instead of many small read() calls.
+    """
+    __STRUCTS = {
+        '<b': struct.Struct('<b'),
+        '<h': struct.Struct('<h'),
+        '<i': struct.Struct('<i'),
+        '<B': struct.Struct('<B'),
+        '<H': struct.Struct('<H'),
+        '<I': struct.Struct('<I'),
+        '<f': struct.Struct('<f'),
+        }
+    __VECTORS = {size:struct.Struct('<'+'f'*size) for size in range(1, 5)}
+
+    def __init__(self, path, pmx_header=None, use_mmap=False):
         self.__fin = open(path, 'rb')
         FileStream.__init__(self, path, self.__fin)
+        self.__map = None
+        self.__buffer = None
+        self.__offset = 0
+        self.__unpack = self.__unpackFile
+        if use_mmap:
+            if os.fstat(self.__fin.fileno()).st_size > 0:
+                self.__map = mmap.mmap(self.__fin.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__buffer = memoryview(self.__map)
+            else:
+                self.__buffer = memoryview(b'')
+            self.__unpack = self.__unpackBuffer
+
+    def close(self):
+        if self.__buffer is not None:
+            self.__buffer.release()
+            self.__buffer = None
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError: # still referenced by the decoded data
+                pass
+            self.__map = None
+        FileStream.close(self)
+
+    def __unpackFile(self, st):
+        return st.unpack(self.__fin.read(st.size))
+
+    def __unpackBuffer(self, st):
+        offset = self.__offset
+        self.__offset = offset + st.size
+        return st.unpack_from(self.__buffer, offset)
 
 
     # READ / WRITE methods for general types
     def readInt(self):
-        v, = struct.unpack('<i', self.__fin.read(4))
+        v, = self.__unpack(self.__STRUCTS['<i'])
         return v
 
     def readUnsignedInt(self):
-        v, = struct.unpack('<I', self.__fin.read(4))
+        v, = self.__unpack(self.__STRUCTS['<I'])
         return v
 
     def readShort(self):
-        v, = struct.unpack('<h', self.__fin.read(2))
+        v, = self.__unpack(self.__STRUCTS['<h'])
         return v
 
     def readUnsignedShort(self):
-        v, = struct.unpack('<H', self.__fin.read(2))
+        v, = self.__unpack(self.__STRUCTS['<H'])
         return v
 
     def readStr(self, size):
-        buf = self.__fin.read(size)
+        buf = self.readBytes(size)
         if buf[0] == b'\xfd':
             return ''
         return buf.split(b'\x00')[0].decode('shift_jis', errors='replace')
 
     def readFloat(self):
-        v, = struct.unpack('<f', self.__fin.read(4))
+        v, = self.__unpack(self.__STRUCTS['<f'])
         return v
 
     def readVector(self, size):
-        return struct.unpack('<'+'f'*size, self.__fin.read(4*size))
+        st = self.__VECTORS.get(size, None) or struct.Struct('<'+'f'*size)
+        return self.__unpack(st)
 
     def readByte(self):
-        v, = struct.unpack('<B', self.__fin.read(1))
+        v, = self.__unpack(self.__STRUCTS['<B'])
         return v
 
     def readBytes(self, length):
-        return self.__fin.read(length)
+        return bytes(self.readBuffer(length))
+
+    def readBuffer(self, length):
+        """ Read raw data. It may return a memoryview without copying the data.
+        """
+        if self.__buffer is None:
+            return self.__fin.read(length)
+        offset = self.__offset
+        self.__offset = min(offset + length, len(self.__buffer))
+        return self.__buffer[offset:self.__offset]
 
     def readSignedByte(self):
-        v, = struct.unpack('<b', self.__fin.read(1))
+        v, = self.__unpack(self.__STRUCTS['<b'])
         return v
 
+    def skip(self, length):
+        if self.__buffer is None:
+            self.__fin.seek(length, os.SEEK_CUR)
+        else:
+            self.__offset += length
+
+    def tell(self):
+        if self.__buffer is None:
+            return self.__fin.tell()
+        return self.__offset
+
+    def seek(self, offset):
+        if self.__buffer is None:
+            self.__fin.seek(offset)
+        else:
+            self.__offset = offset
+
 
 class Header:
     PMD_SIGN = b'Pmd'
@@ -110,6 +185,8 @@ class Header:
         self.comment = fs.readStr(256)
 
 class Vertex:
+    __slots__ = ('position', 'normal', 'uv', 'bones', 'weight', 'enable_edge')
+
     def __init__(self):
         self.position = [0.0, 0.0, 0.0]
         self.normal = [1.0, 0.0, 0.0]
@@ -128,6 +205,9 @@ class Vertex:
         self.enable_edge = fs.readByte()
 
 class Material:
+    __slots__ = ('diffuse', 'shininess', 'specular', 'ambient', 'toon_index', 'edge_flag', 'vertex_count',
+                 'texture_path', 'sphere_path', 'sphere_mode')
+
     def __init__(self):
         self.diffuse = []
         self.shininess = 0
@@ -159,6 +239,8 @@ class Material:
                 self.sphere_mode = 2
 
 class Bone:
+    __slots__ = ('name', 'name_e', 'parent', 'tail_bone', 'type', 'ik_bone', 'position')
+
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -184,6 +266,8 @@ class Bone:
         self.position = fs.readVector(3)
 
 class IK:
+    __slots__ = ('bone', 'target_bone', 'ik_chain', 'iterations', 'control_weight', 'ik_child_bones')
+
     def __init__(self):
         self.bone = 0
         self.target_bone = 0
@@ -212,6 +296,8 @@ class IK:
             self.ik_child_bones.append(fs.readUnsignedShort())
 
 class MorphData:
+    __slots__ = ('index', 'offset')
+
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -221,6 +307,8 @@ class MorphData:
         self.offset = fs.readVector(3)
 
 class VertexMorph:
+    __slots__ = ('name', 'name_e', 'type', 'data')
+
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -237,6 +325,10 @@ class VertexMorph:
             self.data.append(t)
 
 class RigidBody:
+    __slots__ = ('name', 'bone', 'collision_group_number', 'collision_group_mask', 'type', 'size', 'location',
+                 'rotation', 'mass', 'velocity_attenuation', 'rotation_attenuation', 'friction', 'bounce',
+                 'mode')
+
     def __init__(self):
         self.name = ''
         self.bone = -1
@@ -272,6 +364,10 @@ class RigidBody:
         self.mode = fs.readByte()
 
 class Joint:
+    __slots__ = ('name', 'src_rigid', 'dest_rigid', 'location', 'rotation', 'maximum_location',
+                 'minimum_location', 'maximum_rotation', 'minimum_rotation', 'spring_constant',
+                 'spring_rotation_constant')
+
     def __init__(self):
         self.name = ''
         self.src_rigid = None
@@ -593,8 +689,8 @@ class Model:
 
         logging.info('finished importing the model.')
 
-def load(path):
-    with FileReadStream(path) as fs:
+def load(path, use_mmap=False):
+    with FileReadStream(path, use_mmap=use_mmap) as fs:
         logging.info('****************************************')
         logging.info(' miu_mmd_tools.pmd module')
         logging.info('----------------------------------------')
@@ -614,3 +710,71 @@ def load(path):
         logging.info(' miu_mmd_tools.pmd module')
         logging.info('****************************************')
         return model
+
+def probe(path, use_mmap=True):
+    """ Return the header information and the number of records of a pmd file
+
+    The records are skipped by their sizes without being decoded.
+    """
+    with FileReadStream(path, use_mmap=use_mmap) as fs:
+        header = Header()
+        header.load(fs)
+        info = {
+            'format': 'pmd',
+            'filepath': path,
+            'version': header.version,
+            'name': header.model_name,
+            'name_e': '',
+            'comment': header.comment,
+            'comment_e': '',
+            'vertices': 0,
+            'faces': 0,
+            'materials': 0,
+            'bones': 0,
+            'iks': 0,
+            'morphs': 0,
+            'rigids': 0,
+            'joints': 0,
+            }
+        try:
+            info['vertices'] = fs.readUnsignedInt()
+            fs.skip(38*info['vertices'])
+            info['faces'] = int(fs.readUnsignedInt()/3)
+            fs.skip(6*info['faces'])
+            info['materials'] = fs.readUnsignedInt()
+            fs.skip(70*info['materials'])
+            info['bones'] = fs.readUnsignedShort()
+            fs.skip(39*info['bones'])
+            info['iks'] = fs.readUnsignedShort()
+            for i in range(info['iks']):
+                fs.skip(4)
+                fs.skip(6 + 2*fs.readByte())
+            info['morphs'] = fs.readUnsignedShort()
+            for i in range(info['morphs']):
+                fs.skip(20)
+                fs.skip(1 + 16*fs.readUnsignedInt())
+
+            fs.skip(2*fs.readByte())
+            bone_disp_count = fs.readByte()
+            fs.skip(50*bone_disp_count)
+            fs.skip(3*fs.readUnsignedInt())
+
+            try:
+                eng_flag = fs.readByte()
+            except struct.error:
+                return info # no extended data sections
+            if eng_flag:
+                info['name_e'] = fs.readStr(20)
+                info['comment_e'] = fs.readStr(256)
+                fs.skip(20*info['bones'] + 20*max(0, info['morphs'] - 1) + 50*bone_disp_count)
+            fs.skip(100*10) # toon textures
+
+            try:
+                info['rigids'] = fs.readUnsignedInt()
+            except struct.error:
+                return info # no physics data
+            fs.skip(83*info['rigids'])
+            info['joints'] = fs.readUnsignedInt()
+        except struct.error as e:
+            logging.error(' * Corrupted file: %s', e)
+        return info
@@ -15,8 +15,18 @@ import miu_mmd_tools.core.pmx as pmx
 from math import radians
 
 class PMDImporter:
+    @classmethod
+    def load(cls, **args):
+        model_cache = args.get('model_cache', None)
+        if model_cache is None:
+            args['pmx'] = import_pmd_to_pmx(args['filepath'])
+        else:
+            args['pmx'] = model_cache.load(args['filepath'], import_pmd_to_pmx)
+        return import_pmx.PMXImporter.load(**args)
+
     def execute(self, **args):
-        args['pmx'] = import_pmd_to_pmx(args['filepath'])
+        if args.get('loaded_model', None) is None:
+            args['loaded_model'] = self.load(**args)
         importer = import_pmx.PMXImporter()
         importer.execute(**args)
 
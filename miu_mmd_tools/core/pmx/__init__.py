@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 import struct
 import os
+import mmap
 import logging
 
+import numpy as np
+
 class InvalidFileError(Exception):
     pass
 class UnsupportedVersionError(Exception):
@@ -38,14 +41,61 @@ class FileStream:
             self.__file_obj = None
 
 class FileReadStream(FileStream):
-    def __init__(self, path, pmx_header=None):
+    """ Read PMX data from a file
+
+    With use_mmap=True, the file is memory mapped and values are decoded by
+    struct.unpack_from() at a moving offset instead of many small read() calls.
+    """
+    __STRUCTS = {
+        '<b': struct.Struct('<b'),
+        '<h': struct.Struct('<h'),
+        '<i': struct.Struct('<i'),
+        '<B': struct.Struct('<B'),
+        '<H': struct.Struct('<H'),
+        '<I': struct.Struct('<I'),
+        '<f': struct.Struct('<f'),
+        }
+    __VECTORS = {size:struct.Struct('<'+'f'*size) for size in range(1, 5)}
+
+    def __init__(self, path, pmx_header=None, use_mmap=False):
         self.__fin = open(path, 'rb')
         FileStream.__init__(self, path, self.__fin, pmx_header)
+        self.__map = None
+        self.__buffer = None
+        self.__offset = 0
+        self.__unpack = self.__unpackFile
+        if use_mmap:
+            if os.fstat(self.__fin.fileno()).st_size > 0:
+                self.__map = mmap.mmap(self.__fin.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__buffer = memoryview(self.__map)
+            else:
+                self.__buffer = memoryview(b'')
+            self.__unpack = self.__unpackBuffer
+
+    def close(self):
+        if self.__buffer is not None:
+            self.__buffer.release()
+            self.__buffer = None
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError: # still referenced by the decoded data
+                pass
+            self.__map = None
+        FileStream.close(self)
+
+    def __unpackFile(self, st):
+        return st.unpack(self.__fin.read(st.size))
+
+    def __unpackBuffer(self, st):
+        offset = self.__offset
+        self.__offset = offset + st.size
+        return st.unpack_from(self.__buffer, offset)
 
     def __readIndex(self, size, typedict):
         index = None
         if size in typedict :
-            index, = struct.unpack(typedict[size], self.__fin.read(size))
+            index, = self.__unpack(self.__STRUCTS[typedict[size]])
         else:
             raise ValueError('invalid data size %s'%str(size))
         return index
@@ -78,48 +128,125 @@ class FileReadStream(FileStream):
 
     # READ / WRITE methods for general types
     def readInt(self):
-        v, = struct.unpack('<i', self.__fin.read(4))
+        v, = self.__unpack(self.__STRUCTS['<i'])
         return v
 
     def readShort(self):
-        v, = struct.unpack('<h', self.__fin.read(2))
+        v, = self.__unpack(self.__STRUCTS['<h'])
         return v
 
     def readUnsignedShort(self):
-        v, = struct.unpack('<H', self.__fin.read(2))
+        v, = self.__unpack(self.__STRUCTS['<H'])
         return v
 
     def readStr(self):
         length = self.readInt()
-        buf, = struct.unpack('<%ds'%length, self.__fin.read(length))
+        if length < 0:
+            raise struct.error('invalid string length %d'%length)
+        buf = self.readBuffer(length)
+        if len(buf) < length:
+            raise struct.error('unpack requires a buffer of %d bytes'%length)
         return str(buf, self.header().encoding.charset, errors='replace')
 
     def readFloat(self):
-        v, = struct.unpack('<f', self.__fin.read(4))
+        v, = self.__unpack(self.__STRUCTS['<f'])
         return v
 
     def readVector(self, size):
-        return struct.unpack('<'+'f'*size, self.__fin.read(4*size))
+        st = self.__VECTORS.get(size, None) or struct.Struct('<'+'f'*size)
+        return self.__unpack(st)
 
     def readByte(self):
-        v, = struct.unpack('<B', self.__fin.read(1))
+        v, = self.__unpack(self.__STRUCTS['<B'])
         return v
 
     def readBytes(self, length):
-        return self.__fin.read(length)
+        return bytes(self.readBuffer(length))
+
+    def readBuffer(self, length):
+        """ Read raw data. It may return a memoryview without copying the data.
+        """
+        if self.__buffer is None:
+            return self.__fin.read(length)
+        offset = self.__offset
+        self.__offset = min(offset + length, len(self.__buffer))
+        return self.__buffer[offset:self.__offset]
 
     def readSignedByte(self):
-        v, = struct.unpack('<b', self.__fin.read(1))
+        v, = self.__unpack(self.__STRUCTS['<b'])
         return v
 
+    # SKIP methods for the records which are not required
+    def skip(self, length):
+        if self.__buffer is None:
+            self.__fin.seek(length, os.SEEK_CUR)
+        else:
+            self.__offset += length
+
+    def skipStr(self):
+        length = self.readInt()
+        if length < 0:
+            raise struct.error('invalid string length %d'%length)
+        self.skip(length)
+
+    def tell(self):
+        if self.__buffer is None:
+            return self.__fin.tell()
+        return self.__offset
+
+    def seek(self, offset):
+        if self.__buffer is None:
+            self.__fin.seek(offset)
+        else:
+            self.__offset = offset
+
 class FileWriteStream(FileStream):
+    """ Write PMX data to a file
+
+    Values are packed by precompiled struct.Struct objects into a buffer,
+    which is written to the file in chunks of FLUSH_SIZE bytes.
+    """
+    FLUSH_SIZE = 1 << 20
+
+    __STRUCTS = {
+        '<b': struct.Struct('<b'),
+        '<h': struct.Struct('<h'),
+        '<i': struct.Struct('<i'),
+        '<B': struct.Struct('<B'),
+        '<H': struct.Struct('<H'),
+        '<I': struct.Struct('<I'),
+        '<f': struct.Struct('<f'),
+        }
+    __VECTORS = {size:struct.Struct('<'+'f'*size) for size in range(1, 5)}
+
     def __init__(self, path, pmx_header=None):
         self.__fout = open(path, 'wb')
         FileStream.__init__(self, path, self.__fout, pmx_header)
+        self.__buffer = bytearray()
+        self.__records = {}
+
+    def setHeader(self, pmx_header):
+        FileStream.setHeader(self, pmx_header)
+        self.__records = {}
+
+    def flush(self):
+        if self.__buffer:
+            self.__fout.write(self.__buffer)
+            del self.__buffer[:]
+
+    def close(self):
+        if self.__fout is not None and not self.__fout.closed:
+            self.flush()
+        FileStream.close(self)
+
+    def __write(self, data):
+        self.__buffer += data
+        if len(self.__buffer) >= self.FLUSH_SIZE:
+            self.flush()
 
     def __writeIndex(self, index, size, typedict):
         if size in typedict :
-            self.__fout.write(struct.pack(typedict[size], int(index)))
+            self.__write(self.__STRUCTS[typedict[size]].pack(int(index)))
         else:
             raise ValueError('invalid data size %s'%str(size))
         return
@@ -130,6 +257,34 @@ class FileWriteStream(FileStream):
     def __writeUnsignedIndex(self, index, size):
         return self.__writeIndex(index, size, { 1 :"<B", 2 :"<H", 4 :"<I"})
 
+    def __recordStruct(self, fmt):
+        header = self.header()
+        signed, unsigned = { 1 :'b', 2 :'h', 4 :'i'}, { 1 :'B', 2 :'H', 4 :'I'}
+        try:
+            return struct.Struct(fmt%{
+                'vertex': unsigned[header.vertex_index_size],
+                'texture': signed[header.texture_index_size],
+                'material': signed[header.material_index_size],
+                'bone': signed[header.bone_index_size],
+                'morph': signed[header.morph_index_size],
+                'rigid': signed[header.rigid_index_size],
+                })
+        except KeyError as e:
+            raise ValueError('invalid data size %s'%str(e))
+
+    # WRITE method for records
+    def writePacked(self, fmt, *values):
+        """ Write values packed by the struct format fmt
+
+        The index types are given by the names vertex, texture, material,
+        bone, morph and rigid, e.g. '<3f%(bone)si'. The compiled struct is
+        cached by fmt.
+        """
+        st = self.__records.get(fmt, None)
+        if st is None:
+            st = self.__records[fmt] = self.__recordStruct(fmt)
+        self.__write(st.pack(*values))
+
     # WRITE methods for indexes
     def writeVertexIndex(self, index):
         return self.__writeUnsignedIndex(index, self.header().vertex_index_size)
@@ -151,33 +306,46 @@ class FileWriteStream(FileStream):
 
 
     def writeInt(self, v):
-        self.__fout.write(struct.pack('<i', int(v)))
+        self.__write(self.__STRUCTS['<i'].pack(int(v)))
 
     def writeShort(self, v):
-        self.__fout.write(struct.pack('<h', int(v)))
+        self.__write(self.__STRUCTS['<h'].pack(int(v)))
 
     def writeUnsignedShort(self, v):
-        self.__fout.write(struct.pack('<H', int(v)))
+        self.__write(self.__STRUCTS['<H'].pack(int(v)))
 
     def writeStr(self, v):
         data = v.encode(self.header().encoding.charset)
         self.writeInt(len(data))
-        self.__fout.write(data)
+        self.__write(data)
 
     def writeFloat(self, v):
-        self.__fout.write(struct.pack('<f', float(v)))
+        self.__write(self.__STRUCTS['<f'].pack(float(v)))
 
     def writeVector(self, v):
-        self.__fout.write(struct.pack('<'+'f'*len(v), *v))
+        st = self.__VECTORS.get(len(v), None) or struct.Struct('<'+'f'*len(v))
+        self.__write(st.pack(*v))
+
+    def writeVectors(self, *vectors):
+        """ Write the vectors in one go, same as calling writeVector() for each vector """
+        values = [x for v in vectors for x in v]
+        st = self.__VECTORS.get(len(values), None)
+        if st is None:
+            st = self.__VECTORS[len(values)] = struct.Struct('<'+'f'*len(values))
+        self.__write(st.pack(*values))
 
     def writeByte(self, v):
-        self.__fout.write(struct.pack('<B', int(v)))
+        self.__write(self.__STRUCTS['<B'].pack(int(v)))
 
     def writeBytes(self, v):
-        self.__fout.write(v)
+        if len(v) < self.FLUSH_SIZE:
+            self.__write(v)
+        else:
+            self.flush()
+            self.__fout.write(v)
 
     def writeSignedByte(self, v):
-        self.__fout.write(struct.pack('<b', int(v)))
+        self.__write(self.__STRUCTS['<b'].pack(int(v)))
 
 class Encoding:
     _MAP = [
@@ -208,6 +376,8 @@ class Encoding:
 
 class Coordinate:
     """ """
+    __slots__ = ('x_axis', 'z_axis')
+
     def __init__(self, xAxis, zAxis):
         self.x_axis = xAxis
         self.z_axis = zAxis
@@ -316,6 +486,13 @@ class Header:
             )
 
 class Model:
+    """ PMX model data
+
+    Model.load() can parse a part of SECTIONS only. The other sections are
+    skipped by their record sizes and loaded from the file on first access.
+    """
+    SECTIONS = ('vertices', 'faces', 'textures', 'materials', 'bones', 'morphs', 'display', 'rigids', 'joints')
+
     def __init__(self):
         self.filepath = ''
         self.header = None
@@ -347,7 +524,7 @@ class Model:
         self.rigids = []
         self.joints = []
 
-    def load(self, fs):
+    def load(self, fs, vertex_array=False, sections=None):
         self.filepath = fs.path()
         self.header = fs.header()
 
@@ -362,18 +539,99 @@ class Model:
         logging.info('Comment:%s', self.comment)
         logging.info('Comment(english):%s', self.comment_e)
 
+        if sections is not None:
+            sections = set(sections)
+            invalid_sections = sections.difference(self.SECTIONS)
+            if invalid_sections:
+                raise ValueError('invalid section(s) %s'%', '.join(sorted(invalid_sections)))
+            self.__lazy_sections = {}
+
+        counts = {}
+        for name in self.SECTIONS:
+            args = {}
+            if name == 'vertices':
+                args['vertex_array'] = vertex_array
+            elif name == 'materials':
+                args['num_textures'] = counts['textures']
+
+            if sections is None or name in sections:
+                counts[name] = self.__sectionLoader(name)(fs, **args)
+            else:
+                logging.info('')
+                logging.info('Skip %s', name)
+                self.__lazy_sections[name] = (fs.tell(), args)
+                del self.__dict__[name]
+                counts[name] = self.skipSection(fs, name)
+
+    def __getattr__(self, name):
+        lazy_sections = self.__dict__.get('_Model__lazy_sections', None)
+        if not lazy_sections or name not in lazy_sections:
+            raise AttributeError("'%s' object has no attribute '%s'"%(self.__class__.__name__, name))
+        offset, args = lazy_sections.pop(name)
+        with FileReadStream(self.filepath, self.header) as fs:
+            fs.seek(offset)
+            try:
+                self.__sectionLoader(name)(fs, **args)
+            except struct.error as e:
+                logging.error(' * Corrupted file: %s', e)
+        if name not in self.__dict__:
+            self.__dict__[name] = getattr(Model(), name)
+        return self.__dict__[name]
+
+    def __sectionLoader(self, name):
+        return {
+            'vertices': self.__loadVertices,
+            'faces': self.__loadFaces,
+            'textures': self.__loadTextures,
+            'materials': self.__loadMaterials,
+            'bones': self.__loadBones,
+            'morphs': self.__loadMorphs,
+            'display': self.__loadDisplay,
+            'rigids': self.__loadRigids,
+            'joints': self.__loadJoints,
+            }[name]
+
+    @staticmethod
+    def skipSection(fs, name):
+        """ Move fs to the end of the section, and return the number of records """
+        num = fs.readInt()
+        if name == 'vertices':
+            VertexArray.skip(fs, num)
+        elif name == 'faces':
+            fs.skip(int(num/3)*3*fs.header().vertex_index_size)
+        else:
+            record_class = {
+                'textures': Texture,
+                'materials': Material,
+                'bones': Bone,
+                'morphs': Morph,
+                'display': Display,
+                'rigids': Rigid,
+                'joints': Joint,
+                }[name]
+            for i in range(num):
+                record_class.skip(fs)
+        return num
+
+    def __loadVertices(self, fs, vertex_array=False):
         logging.info('')
         logging.info('------------------------------')
         logging.info('Load Vertices')
         logging.info('------------------------------')
         num_vertices = fs.readInt()
-        self.vertices = []
-        for i in range(num_vertices):
-            v = Vertex()
-            v.load(fs)
-            self.vertices.append(v)
+        if vertex_array:
+            self.vertices = VertexArray()
+            self.vertices.load(fs, num_vertices)
+        else:
+            self.vertices = []
+            for i in range(num_vertices):
+                v = Vertex()
+                v.load(fs)
+                self.vertices.append(v)
         logging.info('----- Loaded %d vertices', len(self.vertices))
+        return num_vertices
 
+    def __loadFaces(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Faces')
@@ -386,7 +644,9 @@ class Model:
             f3 = fs.readVertexIndex()
             self.faces.append((f3, f2, f1))
         logging.info(' Load %d faces', len(self.faces))
+        return num_faces
 
+    def __loadTextures(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Textures')
@@ -399,7 +659,9 @@ class Model:
             self.textures.append(t)
             logging.info('Texture %d: %s', i, t.path)
         logging.info(' ----- Loaded %d textures', len(self.textures))
+        return num_textures
 
+    def __loadMaterials(self, fs, num_textures):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Materials')
@@ -438,7 +700,9 @@ class Model:
             logging.debug('')
 
         logging.info('----- Loaded %d  materials.', len(self.materials))
+        return num_materials
 
+    def __loadBones(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Bones')
@@ -472,7 +736,9 @@ class Model:
                     logging.debug('    IK Link %d: %d, %s - %s', j, link.target, str(link.minimumAngle), str(link.maximumAngle))
             logging.debug('')
         logging.info('----- Loaded %d bones.', len(self.bones))
+        return num_bones
 
+    def __loadMorphs(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Morphs')
@@ -489,7 +755,9 @@ class Model:
             logging.debug('  Category: %s (%d)', display_categories.get(m.category, '#Invalid'), m.category)
             logging.debug('')
         logging.info('----- Loaded %d morphs.', len(self.morphs))
+        return num_morph
 
+    def __loadDisplay(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Display Items')
@@ -505,7 +773,9 @@ class Model:
             logging.debug('  Name(english): %s', d.name_e)
             logging.debug('')
         logging.info('----- Loaded %d display items.', len(self.display))
+        return num_disp
 
+    def __loadRigids(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Rigid Bodies')
@@ -534,7 +804,9 @@ class Model:
             logging.debug('')
 
         logging.info('----- Loaded %d rigid bodies.', len(self.rigids))
+        return num_rigid
 
+    def __loadJoints(self, fs):
         logging.info('')
         logging.info('------------------------------')
         logging.info(' Load Joints')
@@ -559,6 +831,7 @@ class Model:
             logging.debug('')
 
         logging.info('----- Loaded %d joints.', len(self.joints))
+        return num_joints
 
     def save(self, fs):
         fs.writeStr(self.name)
@@ -578,16 +851,23 @@ comment(english):
 
         logging.info('exporting vertices... %d', len(self.vertices))
         fs.writeInt(len(self.vertices))
-        for i in self.vertices:
-            i.save(fs)
+        if isinstance(self.vertices, VertexArray):
+            self.vertices.save(fs)
+        else:
+            for i in self.vertices:
+                i.save(fs)
         logging.info('finished exporting vertices.')
 
         logging.info('exporting faces... %d', len(self.faces))
         fs.writeInt(len(self.faces)*3)
-        for f3, f2, f1 in self.faces:
-            fs.writeVertexIndex(f1)
-            fs.writeVertexIndex(f2)
-            fs.writeVertexIndex(f3)
+        vertex_index_size = fs.header().vertex_index_size
+        vertex_index_type = {1:'<u1', 2:'<u2', 4:'<u4'}.get(vertex_index_size, None)
+        if vertex_index_type is None:
+            raise ValueError('invalid data size %s'%str(vertex_index_size))
+        faces = np.array(self.faces, dtype=np.int64).reshape(-1, 3)
+        if len(faces) and (faces.min() < 0 or faces.max() >= 1 << 8*vertex_index_size):
+            raise struct.error('vertex index is out of range')
+        fs.writeBytes(faces[:, ::-1].astype(vertex_index_type).tobytes())
         logging.info('finished exporting faces.')
 
         logging.info('exporting textures... %d', len(self.textures))
@@ -644,6 +924,8 @@ comment(english):
             )
 
 class Vertex:
+    __slots__ = ('co', 'normal', 'uv', 'additional_uvs', 'weight', 'edge_scale')
+
     def __init__(self):
         self.co = [0.0, 0.0, 0.0]
         self.normal = [0.0, 0.0, 0.0]
@@ -674,17 +956,16 @@ class Vertex:
         self.edge_scale = fs.readFloat()
 
     def save(self, fs):
-        fs.writeVector(self.co)
-        fs.writeVector(self.normal)
-        fs.writeVector(self.uv)
-        for i in self.additional_uvs:
-            fs.writeVector(i)
+        additional_uvs = list(self.additional_uvs)
         for i in range(fs.header().additional_uvs-len(self.additional_uvs)):
-            fs.writeVector((0,0,0,0))
+            additional_uvs.append((0,0,0,0))
+        fs.writeVectors(self.co, self.normal, self.uv, *additional_uvs)
         self.weight.save(fs)
         fs.writeFloat(self.edge_scale)
 
 class BoneWeightSDEF:
+    __slots__ = ('weight', 'c', 'r0', 'r1')
+
     def __init__(self, weight=0, c=None, r0=None, r1=None):
         self.weight = weight
         self.c = c
@@ -692,6 +973,8 @@ class BoneWeightSDEF:
         self.r1 = r1
 
 class BoneWeight:
+    __slots__ = ('bones', 'weights', 'type')
+
     BDEF1 = 0
     BDEF2 = 1
     BDEF4 = 2
@@ -752,32 +1035,310 @@ class BoneWeight:
             raise ValueError('invalid weight type %s'%str(self.type))
 
     def save(self, fs):
-        fs.writeByte(self.type)
+        bones, weights = self.bones, self.weights
         if self.type == self.BDEF1:
-            fs.writeBoneIndex(self.bones[0])
+            fs.writePacked('<B%(bone)s', self.BDEF1, int(bones[0]))
         elif self.type == self.BDEF2:
-            for i in range(2):
-                fs.writeBoneIndex(self.bones[i])
-            fs.writeFloat(self.weights[0])
+            fs.writePacked('<B2%(bone)sf', self.BDEF2, int(bones[0]), int(bones[1]), float(weights[0]))
         elif self.type == self.BDEF4:
-            for i in range(4):
-                fs.writeBoneIndex(self.bones[i])
-            for i in range(4):
-                fs.writeFloat(self.weights[i])
+            fs.writePacked('<B4%(bone)s4f', self.BDEF4, int(bones[0]), int(bones[1]), int(bones[2]), int(bones[3]),
+                           float(weights[0]), float(weights[1]), float(weights[2]), float(weights[3]))
         elif self.type == self.SDEF:
-            for i in range(2):
-                fs.writeBoneIndex(self.bones[i])
-            if not isinstance(self.weights, BoneWeightSDEF):
+            if not isinstance(weights, BoneWeightSDEF):
                 raise ValueError
-            fs.writeFloat(self.weights.weight)
-            fs.writeVector(self.weights.c)
-            fs.writeVector(self.weights.r0)
-            fs.writeVector(self.weights.r1)
+            fs.writePacked('<B2%(bone)sf', self.SDEF, int(bones[0]), int(bones[1]), float(weights.weight))
+            fs.writeVectors(weights.c, weights.r0, weights.r1)
         else:
             raise ValueError('invalid weight type %s'%str(self.type))
 
+class VertexArray:
+    """ Columnar storage of PMX vertices.
+
+    Each attribute is a contiguous numpy array with one row per vertex, so the
+    data can be passed to foreach_set() directly. The object also behaves as a
+    sequence of Vertex objects, which are created on access.
+    """
+    WEIGHT_COLUMNS = {
+        BoneWeight.BDEF1: (1, 0),
+        BoneWeight.BDEF2: (2, 1),
+        BoneWeight.BDEF4: (4, 4),
+        BoneWeight.SDEF: (2, 1),
+        }
+
+    def __init__(self, count=0, additional_uvs=0):
+        self.co = np.zeros((count, 3), dtype=np.float32)
+        self.normal = np.zeros((count, 3), dtype=np.float32)
+        self.uv = np.zeros((count, 2), dtype=np.float32)
+        self.additional_uvs = np.zeros((count, additional_uvs, 4), dtype=np.float32)
+        self.weight_type = np.zeros(count, dtype=np.uint8)
+        self.bones = np.full((count, 4), -1, dtype=np.int32)
+        self.weights = np.zeros((count, 4), dtype=np.float32)
+        self.sdef_c = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r0 = np.zeros((count, 3), dtype=np.float32)
+        self.sdef_r1 = np.zeros((count, 3), dtype=np.float32)
+        self.edge_scale = np.ones(count, dtype=np.float32)
+
+    def __repr__(self):
+        return '<VertexArray count %d, additional_uvs %d>'%(len(self), self.additional_uvs.shape[1])
+
+    def __len__(self):
+        return len(self.co)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.__createVertex(int(index))
+        ret = VertexArray.__new__(VertexArray)
+        for k, v in self.__dict__.items():
+            setattr(ret, k, v[index])
+        return ret
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.__createVertex(i)
+
+    def __createVertex(self, i):
+        v = Vertex()
+        v.co = tuple(self.co[i].tolist())
+        v.normal = tuple(self.normal[i].tolist())
+        v.uv = tuple(self.uv[i].tolist())
+        v.additional_uvs = [tuple(x) for x in self.additional_uvs[i].tolist()]
+        v.edge_scale = self.edge_scale[i].item()
+
+        w = v.weight = BoneWeight()
+        w.type = int(self.weight_type[i])
+        num_bones, num_weights = self.WEIGHT_COLUMNS[w.type]
+        w.bones = self.bones[i, :num_bones].tolist()
+        if w.type == BoneWeight.SDEF:
+            w.weights = BoneWeightSDEF(
+                self.weights[i, 0].item(),
+                tuple(self.sdef_c[i].tolist()),
+                tuple(self.sdef_r0[i].tolist()),
+                tuple(self.sdef_r1[i].tolist()),
+                )
+        elif w.type == BoneWeight.BDEF4:
+            w.weights = tuple(self.weights[i].tolist())
+        else:
+            w.weights = self.weights[i, :num_weights].tolist()
+        return v
+
+    def load(self, fs, count):
+        header = fs.header()
+        bone_index_size = header.bone_index_size
+        bone_index_type = {1:'<i1', 2:'<i2', 4:'<i4'}.get(bone_index_size, None)
+        if bone_index_type is None:
+            raise ValueError('invalid data size %s'%str(bone_index_size))
+        self.__init__(count, header.additional_uvs)
+
+        fixed_size, record_sizes, buf, starts = self.__scan(fs, count)
+
+        data = np.frombuffer(buf, dtype=np.uint8)
+        starts = np.array(starts, dtype=np.int64)
+
+        values = self.__gather(data, starts, fixed_size).view('<f4')
+        self.co[:] = values[:, 0:3]
+        self.normal[:] = values[:, 3:6]
+        self.uv[:] = values[:, 6:8]
+        self.additional_uvs[:] = values[:, 8:].reshape(count, -1, 4)
+        del values
+
+        self.weight_type[:] = data[starts + fixed_size]
+        record_sizes = np.array(record_sizes, dtype=np.int64)
+        self.edge_scale[:] = self.__gather(data, starts + record_sizes[self.weight_type] - 4, 4).view('<f4')[:, 0]
+
+        for weight_type, (num_bones, num_weights) in self.WEIGHT_COLUMNS.items():
+            rows = np.flatnonzero(self.weight_type == weight_type)
+            if len(rows) < 1:
+                continue
+            block_start = starts[rows] + fixed_size + 1
+            self.bones[rows, :num_bones] = self.__gather(data, block_start, num_bones*bone_index_size).view(bone_index_type)
+            if weight_type == BoneWeight.SDEF:
+                values = self.__gather(data, block_start + num_bones*bone_index_size, 40).view('<f4')
+                self.weights[rows, 0] = values[:, 0]
+                self.sdef_c[rows] = values[:, 1:4]
+                self.sdef_r0[rows] = values[:, 4:7]
+                self.sdef_r1[rows] = values[:, 7:10]
+            elif num_weights:
+                self.weights[rows, :num_weights] = self.__gather(data, block_start + num_bones*bone_index_size, num_weights*4).view('<f4')
+
+    def save(self, fs):
+        header = fs.header()
+        bone_index_size = header.bone_index_size
+        bone_index_type = {1:'<i1', 2:'<i2', 4:'<i4'}.get(bone_index_size, None)
+        if bone_index_type is None:
+            raise ValueError('invalid data size %s'%str(bone_index_size))
+        count = len(self)
+        invalid_types = set(np.unique(self.weight_type).tolist()).difference(self.WEIGHT_COLUMNS)
+        if invalid_types:
+            raise ValueError('invalid weight type %s'%str(min(invalid_types)))
+
+        # the missing additional uvs are filled by zeros
+        additional_uvs = np.zeros((count, header.additional_uvs, 4), dtype=np.float32)
+        num_uvs = min(header.additional_uvs, self.additional_uvs.shape[1])
+        additional_uvs[:, :num_uvs] = self.additional_uvs[:, :num_uvs]
+
+        record_types = {weight_type:self.__recordType(weight_type, header.additional_uvs, bone_index_type) for weight_type in self.WEIGHT_COLUMNS}
+        record_sizes = np.array([record_types[i].itemsize for i in range(len(record_types))], dtype=np.int64)
+        starts = np.cumsum(record_sizes[self.weight_type]) - record_sizes[self.weight_type]
+        data = np.empty(int(record_sizes[self.weight_type].sum()), dtype=np.uint8)
+
+        bone_index_max = 1 << (8*bone_index_size - 1)
+        for weight_type, (num_bones, num_weights) in self.WEIGHT_COLUMNS.items():
+            rows = np.flatnonzero(self.weight_type == weight_type)
+            if len(rows) < 1:
+                continue
+            bones = self.bones[rows, :num_bones]
+            if bones.min() < -bone_index_max or bones.max() >= bone_index_max:
+                raise struct.error('bone index is out of range')
+
+            records = np.empty(len(rows), dtype=record_types[weight_type])
+            records['co'] = self.co[rows]
+            records['normal'] = self.normal[rows]
+            records['uv'] = self.uv[rows]
+            records['additional_uvs'] = additional_uvs[rows]
+            records['weight_type'] = weight_type
+            records['bones'] = bones
+            if weight_type == BoneWeight.SDEF:
+                records['weights'] = self.weights[rows, :1]
+                records['sdef_c'] = self.sdef_c[rows]
+                records['sdef_r0'] = self.sdef_r0[rows]
+                records['sdef_r1'] = self.sdef_r1[rows]
+            elif num_weights:
+                records['weights'] = self.weights[rows, :num_weights]
+            records['edge_scale'] = self.edge_scale[rows]
+
+            records = records.view(np.uint8).reshape(len(rows), -1)
+            if len(rows) == count:
+                data = records.ravel()
+            else:
+                self.__scatter(data, starts[rows], records)
+        fs.writeBytes(data.tobytes())
+
+    @classmethod
+    def fromVertices(cls, vertices, additional_uvs=None):
+        """ Create a VertexArray from a sequence of Vertex objects
+
+        Convert the vertices once to save a model with the bulk encoder.
+        """
+        if additional_uvs is None:
+            additional_uvs = max([len(v.additional_uvs) for v in vertices] or [0])
+        ret = cls(len(vertices), additional_uvs)
+        if len(vertices) < 1:
+            return ret
+
+        def __array(values, dtype=np.float32):
+            return np.array(values, dtype=dtype)
+
+        ret.co[:] = __array([v.co for v in vertices])
+        ret.normal[:] = __array([v.normal for v in vertices])
+        ret.uv[:] = __array([v.uv for v in vertices])
+        if additional_uvs:
+            zeros = [(0, 0, 0, 0)]*additional_uvs
+            ret.additional_uvs[:] = __array([(list(v.additional_uvs) + zeros)[:additional_uvs] for v in vertices])
+        ret.edge_scale[:] = __array([v.edge_scale for v in vertices])
+
+        weight_types, bones, weights, sdef_rows, sdef_values = [], [], [], [], []
+        for i, v in enumerate(vertices):
+            w = v.weight
+            if w.type not in cls.WEIGHT_COLUMNS:
+                raise ValueError('invalid weight type %s'%str(w.type))
+            num_bones, num_weights = cls.WEIGHT_COLUMNS[w.type]
+            weight_types.append(w.type)
+            bones.append((list(w.bones[:num_bones]) + [-1, -1, -1, -1])[:4])
+            if w.type == BoneWeight.SDEF:
+                if not isinstance(w.weights, BoneWeightSDEF):
+                    raise ValueError
+                weights.append((w.weights.weight, 0, 0, 0))
+                sdef_rows.append(i)
+                sdef_values.append(tuple(w.weights.c) + tuple(w.weights.r0) + tuple(w.weights.r1))
+            else:
+                weights.append((list(w.weights[:num_weights]) + [0, 0, 0, 0])[:4])
+        ret.weight_type[:] = __array(weight_types, np.uint8)
+        ret.bones[:] = __array(bones, np.int64)
+        ret.weights[:] = __array(weights)
+        if sdef_rows:
+            sdef_values = __array(sdef_values)
+            ret.sdef_c[sdef_rows] = sdef_values[:, 0:3]
+            ret.sdef_r0[sdef_rows] = sdef_values[:, 3:6]
+            ret.sdef_r1[sdef_rows] = sdef_values[:, 6:9]
+        return ret
+
+    @classmethod
+    def skip(cls, fs, count):
+        cls.__scan(fs, count)
+
+    @staticmethod
+    def __scan(fs, count):
+        """ Find the start of each vertex record, and move fs to the end of vertex data """
+        header = fs.header()
+        bone_index_size = header.bone_index_size
+
+        # co, normal, uv and additional uvs are followed by the weight type
+        fixed_size = 4*(3 + 3 + 2 + 4*header.additional_uvs)
+        record_sizes = [fixed_size + 1 + n*bone_index_size + 4*m + 4 for n, m in (
+            (1, 0), # BDEF1
+            (2, 1), # BDEF2
+            (4, 4), # BDEF4
+            (2, 10), # SDEF
+            )]
+
+        offset = fs.tell()
+        buf = fs.readBuffer(count*max(record_sizes))
+
+        # scan the variable length records once
+        starts = [0] * count
+        pos = 0
+        try:
+            for i in range(count):
+                starts[i] = pos
+                pos += record_sizes[buf[pos + fixed_size]]
+        except IndexError:
+            if pos + fixed_size >= len(buf):
+                raise struct.error('unexpected end of vertex data')
+            raise ValueError('invalid weight type %s'%str(buf[pos + fixed_size]))
+        if pos > len(buf):
+            raise struct.error('unexpected end of vertex data')
+        fs.seek(offset + pos)
+        return fixed_size, record_sizes, buf, starts
+
+    @classmethod
+    def __recordType(cls, weight_type, additional_uvs, bone_index_type):
+        """ Return the numpy structured dtype of a vertex record of the weight type """
+        num_bones, num_weights = cls.WEIGHT_COLUMNS[weight_type]
+        fields = [
+            ('co', '<f4', (3,)),
+            ('normal', '<f4', (3,)),
+            ('uv', '<f4', (2,)),
+            ('additional_uvs', '<f4', (additional_uvs, 4)),
+            ('weight_type', 'u1'),
+            ('bones', bone_index_type, (num_bones,)),
+            ]
+        if weight_type == BoneWeight.SDEF:
+            fields += [('weights', '<f4', (1,)), ('sdef_c', '<f4', (3,)), ('sdef_r0', '<f4', (3,)), ('sdef_r1', '<f4', (3,))]
+        elif num_weights:
+            fields.append(('weights', '<f4', (num_weights,)))
+        fields.append(('edge_scale', '<f4'))
+        return np.dtype(fields)
+
+    @staticmethod
+    def __scatter(data, starts, values, chunk_size=65536):
+        """ Copy each row of values to data[start:start+values.shape[1]] """
+        columns = np.arange(values.shape[1], dtype=np.int64)
+        for i in range(0, len(starts), chunk_size):
+            data[starts[i:i+chunk_size, None] + columns] = values[i:i+chunk_size]
+
+    @staticmethod
+    def __gather(data, starts, size, chunk_size=65536):
+        """ Return a (len(starts), size) uint8 array of the bytes data[start:start+size] """
+        ret = np.empty((len(starts), size), dtype=np.uint8)
+        columns = np.arange(size, dtype=np.int64)
+        for i in range(0, len(starts), chunk_size):
+            ret[i:i+chunk_size] = data[starts[i:i+chunk_size, None] + columns]
+        return ret
+
 
 class Texture:
+    __slots__ = ('path',)
+
     def __init__(self):
         self.path = ''
 
@@ -790,6 +1351,10 @@ class Texture:
         if not os.path.isabs(self.path):
             self.path = os.path.normpath(os.path.join(os.path.dirname(fs.path()), self.path))
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+
     def save(self, fs):
         try:
             relPath = os.path.relpath(self.path, os.path.dirname(fs.path()))
@@ -800,11 +1365,18 @@ class Texture:
         fs.writeStr(relPath)
 
 class SharedTexture(Texture):
+    __slots__ = ('number', 'prefix')
+
     def __init__(self):
         self.number = 0
         self.prefix = ''
 
 class Material:
+    __slots__ = ('name', 'name_e', 'diffuse', 'specular', 'shininess', 'ambient', 'is_double_sided',
+                 'enabled_drop_shadow', 'enabled_self_shadow_map', 'enabled_self_shadow', 'enabled_toon_edge',
+                 'edge_color', 'edge_size', 'texture', 'sphere_texture', 'sphere_texture_mode',
+                 'is_shared_toon_texture', 'toon_texture', 'comment', 'vertex_count')
+
     SPHERE_MODE_OFF = 0
     SPHERE_MODE_MULT = 1
     SPHERE_MODE_ADD = 2
@@ -893,42 +1465,52 @@ class Material:
         self.comment = fs.readStr()
         self.vertex_count = fs.readInt()
 
+    @staticmethod
+    def skip(fs):
+        texture_index_size = fs.header().texture_index_size
+        fs.skipStr()
+        fs.skipStr()
+        # diffuse, specular, shininess, ambient, flags, edge color, edge size, textures and sphere mode
+        fs.skip(16 + 12 + 4 + 12 + 1 + 16 + 4 + 2*texture_index_size + 1)
+        if fs.readSignedByte() == 1:
+            fs.skip(1)
+        else:
+            fs.skip(texture_index_size)
+        fs.skipStr()
+        fs.skip(4)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeVector(self.diffuse)
-        fs.writeVector(self.specular)
-        fs.writeFloat(self.shininess)
-        fs.writeVector(self.ambient)
-
         flags = 0
         flags |= int(self.is_double_sided)
         flags |= int(self.enabled_drop_shadow) << 1
         flags |= int(self.enabled_self_shadow_map) << 2
         flags |= int(self.enabled_self_shadow) << 3
         flags |= int(self.enabled_toon_edge) << 4
-        fs.writeByte(flags)
 
-        fs.writeVector(self.edge_color)
-        fs.writeFloat(self.edge_size)
-
-        fs.writeTextureIndex(self.texture)
-        fs.writeTextureIndex(self.sphere_texture)
-        fs.writeSignedByte(self.sphere_texture_mode)
+        fs.writeVectors(self.diffuse, self.specular, (self.shininess,), self.ambient)
+        fs.writeByte(flags)
+        fs.writeVectors(self.edge_color, (self.edge_size,))
 
         if self.is_shared_toon_texture:
-            fs.writeSignedByte(1)
-            fs.writeSignedByte(self.toon_texture)
+            fs.writePacked('<2%(texture)s3b', int(self.texture), int(self.sphere_texture), int(self.sphere_texture_mode),
+                           1, int(self.toon_texture))
         else:
-            fs.writeSignedByte(0)
-            fs.writeTextureIndex(self.toon_texture)
+            fs.writePacked('<2%(texture)s2b%(texture)s', int(self.texture), int(self.sphere_texture), int(self.sphere_texture_mode),
+                           0, int(self.toon_texture))
 
         fs.writeStr(self.comment)
         fs.writeInt(self.vertex_count)
 
 
 class Bone:
+    __slots__ = ('name', 'name_e', 'location', 'parent', 'transform_order', 'displayConnection', 'isRotatable',
+                 'isMovable', 'visible', 'isControllable', 'isIK', 'hasAdditionalRotate',
+                 'hasAdditionalLocation', 'additionalTransform', 'axis', 'localCoordinate', 'transAfterPhis',
+                 'externalTransKey', 'target', 'loopCount', 'rotationConstraint', 'ik_links')
+
     def __init__(self):
         self.name = ''
         self.name_e = ''
@@ -1045,14 +1627,35 @@ class Bone:
                 link.load(fs)
                 self.ik_links.append(link)
 
+    @staticmethod
+    def skip(fs):
+        bone_index_size = fs.header().bone_index_size
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(12 + bone_index_size + 4)
+
+        flags = fs.readShort()
+        if flags & 0x0001:
+            fs.skip(bone_index_size)
+        else:
+            fs.skip(12)
+        if flags & (0x0100 | 0x0200):
+            fs.skip(bone_index_size + 4)
+        if flags & 0x0400:
+            fs.skip(12)
+        if flags & 0x0800:
+            fs.skip(24)
+        if flags & 0x2000:
+            fs.skip(4)
+        if flags & 0x0020:
+            fs.skip(bone_index_size + 8)
+            for i in range(fs.readInt()):
+                IKLink.skip(fs)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeVector(self.location)
-        fs.writeBoneIndex(-1 if self.parent is None else self.parent)
-        fs.writeInt(self.transform_order)
-
         flags = 0
         flags |= int(isinstance(self.displayConnection, int))
         flags |= int(self.isRotatable) << 1
@@ -1069,7 +1672,8 @@ class Bone:
         flags |= int(self.transAfterPhis) << 12
         flags |= int(self.externalTransKey is not None) << 13
 
-        fs.writeShort(flags)
+        fs.writeVector(self.location)
+        fs.writePacked('<%(bone)sih', -1 if self.parent is None else int(self.parent), int(self.transform_order), flags)
 
         if flags & 0x0001:
             fs.writeBoneIndex(self.displayConnection)
@@ -1091,16 +1695,14 @@ class Bone:
             fs.writeInt(self.externalTransKey)
 
         if self.isIK:
-            fs.writeBoneIndex(self.target)
-            fs.writeInt(self.loopCount)
-            fs.writeFloat(self.rotationConstraint)
-
-            fs.writeInt(len(self.ik_links))
+            fs.writePacked('<%(bone)sifi', int(self.target), int(self.loopCount), float(self.rotationConstraint), len(self.ik_links))
             for i in self.ik_links:
                 i.save(fs)
 
 
 class IKLink:
+    __slots__ = ('target', 'maximumAngle', 'minimumAngle')
+
     def __init__(self):
         self.target = None
         self.maximumAngle = None
@@ -1119,14 +1721,18 @@ class IKLink:
             self.minimumAngle = None
             self.maximumAngle = None
 
+    @staticmethod
+    def skip(fs):
+        fs.skip(fs.header().bone_index_size)
+        if fs.readByte() == 1:
+            fs.skip(24)
+
     def save(self, fs):
-        fs.writeBoneIndex(self.target)
         if isinstance(self.minimumAngle, (tuple, list)) and isinstance(self.maximumAngle, (tuple, list)):
-            fs.writeByte(1)
-            fs.writeVector(self.minimumAngle)
-            fs.writeVector(self.maximumAngle)
+            fs.writePacked('<%(bone)sB', int(self.target), 1)
+            fs.writeVectors(self.minimumAngle, self.maximumAngle)
         else:
-            fs.writeByte(0)
+            fs.writePacked('<%(bone)sB', int(self.target), 0)
 
 class Morph:
     CATEGORY_SYSTEM = 0
@@ -1135,6 +1741,21 @@ class Morph:
     CATEGORY_MOUTH = 3
     CATEGORY_OHTER = 4
 
+    # type index -> (the index size of the header, the size of the other data) of an offset
+    OFFSET_SIZES = {
+        0: ('morph_index_size', 4), # group
+        1: ('vertex_index_size', 12), # vertex
+        2: ('bone_index_size', 28), # bone
+        3: ('vertex_index_size', 16), # uv
+        4: ('vertex_index_size', 16), # additional uv 1-4
+        5: ('vertex_index_size', 16),
+        6: ('vertex_index_size', 16),
+        7: ('vertex_index_size', 16),
+        8: ('material_index_size', 113), # material
+        9: ('morph_index_size', 4), # flip (PMX 2.1)
+        10: ('rigid_index_size', 25), # impulse (PMX 2.1)
+        }
+
     def __init__(self, name, name_e, category, **kwargs):
         self.offsets = []
         self.name = name
@@ -1170,6 +1791,17 @@ class Morph:
         ret.load(fs)
         return ret
 
+    @classmethod
+    def skip(cls, fs):
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(1)
+        type_index = fs.readSignedByte()
+        if type_index not in cls.OFFSET_SIZES:
+            raise InvalidFileError('invalid morph type: %d'%type_index)
+        index_size, data_size = cls.OFFSET_SIZES[type_index]
+        fs.skip(fs.readInt()*(getattr(fs.header(), index_size) + data_size))
+
     def load(self, fs):
         """ Implement for loading morph data.
         """
@@ -1178,27 +1810,118 @@ class Morph:
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
-        fs.writeSignedByte(self.category)
-        fs.writeSignedByte(self.type_index())
-        fs.writeInt(len(self.offsets))
+        fs.writePacked('<bbi', int(self.category), int(self.type_index()), len(self.offsets))
+        if isinstance(self.offsets, MorphOffsetArray):
+            self.offsets.save(fs)
+            return
         for i in self.offsets:
             i.save(fs)
 
+class MorphOffsetArray:
+    """ Packed storage of vertex/UV morph offsets.
+
+    The vertex indices and the offsets are kept in an int32 array and a float32
+    (N, size) array. The object also behaves as a sequence of offset objects,
+    which are created on access, and appended offsets are copied into the arrays.
+    """
+    def __init__(self, offset_class, size, count=0):
+        self.__offset_class = offset_class
+        self.__index = np.zeros(count, dtype=np.int32)
+        self.__offset = np.zeros((count, size), dtype=np.float32)
+        self.__count = count
+
+    def __repr__(self):
+        return '<MorphOffsetArray %s count %d>'%(self.__offset_class.__name__, len(self))
+
+    @property
+    def index(self):
+        return self.__index[:self.__count]
+
+    @property
+    def offset(self):
+        return self.__offset[:self.__count]
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += self.__count
+            if not 0 <= index < self.__count:
+                raise IndexError('offset index out of range')
+            return self.__createOffset(int(index))
+        ret = MorphOffsetArray(self.__offset_class, self.__offset.shape[1])
+        ret.__index = self.index[index].copy()
+        ret.__offset = self.offset[index].copy()
+        ret.__count = len(ret.__index)
+        return ret
+
+    def __iter__(self):
+        for i in range(self.__count):
+            yield self.__createOffset(i)
+
+    def __createOffset(self, i):
+        ret = self.__offset_class()
+        ret.index = int(self.__index[i])
+        ret.offset = tuple(self.__offset[i].tolist())
+        return ret
+
+    def append(self, offset):
+        count = self.__count
+        if count >= len(self.__index):
+            capacity = max(16, 2*count)
+            self.__index = np.resize(self.__index, capacity)
+            self.__offset = np.resize(self.__offset, (capacity, self.__offset.shape[1]))
+        self.__index[count] = offset.index
+        self.__offset[count] = offset.offset
+        self.__count = count + 1
+
+    def extend(self, offsets):
+        for i in offsets:
+            self.append(i)
+
+    def __recordType(self, header):
+        index_type = {1:'<u1', 2:'<u2', 4:'<u4'}.get(header.vertex_index_size, None)
+        if index_type is None:
+            raise ValueError('invalid data size %s'%str(header.vertex_index_size))
+        return np.dtype([('index', index_type), ('offset', '<f4', (self.__offset.shape[1],))])
+
+    def load(self, fs, count):
+        record_type = self.__recordType(fs.header())
+        buf = fs.readBuffer(count*record_type.itemsize)
+        if len(buf) < count*record_type.itemsize:
+            raise struct.error('unexpected end of morph data')
+        records = np.frombuffer(buf, dtype=record_type, count=count)
+        self.__index = records['index'].astype(np.int32)
+        self.__offset = records['offset'].astype(np.float32)
+        self.__count = count
+
+    def save(self, fs):
+        record_type = self.__recordType(fs.header())
+        index = self.index
+        if len(index) and (index.min() < 0 or index.max() >= 1 << (8*record_type['index'].itemsize)):
+            raise struct.error('vertex index is out of range')
+        records = np.empty(self.__count, dtype=record_type)
+        records['index'] = index
+        records['offset'] = self.offset
+        fs.writeBytes(records.tobytes())
+
 class VertexMorph(Morph):
     def __init__(self, *args, **kwargs):
         Morph.__init__(self, *args, **kwargs)
+        self.offsets = MorphOffsetArray(VertexMorphOffset, 3)
 
     def type_index(self):
         return 1
 
     def load(self, fs):
-        num = fs.readInt()
-        for i in range(num):
-            t = VertexMorphOffset()
-            t.load(fs)
-            self.offsets.append(t)
+        self.offsets = MorphOffsetArray(VertexMorphOffset, 3)
+        self.offsets.load(fs, fs.readInt())
 
 class VertexMorphOffset:
+    __slots__ = ('index', 'offset')
+
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -1208,26 +1931,25 @@ class VertexMorphOffset:
         self.offset = fs.readVector(3)
 
     def save(self, fs):
-        fs.writeVertexIndex(self.index)
+        fs.writePacked('<%(vertex)s', int(self.index))
         fs.writeVector(self.offset)
 
 class UVMorph(Morph):
     def __init__(self, *args, **kwargs):
         self.uv_index = kwargs.get('type_index', 3) - 3
         Morph.__init__(self, *args, **kwargs)
+        self.offsets = MorphOffsetArray(UVMorphOffset, 4)
 
     def type_index(self):
         return self.uv_index + 3
 
     def load(self, fs):
-        self.offsets = []
-        num = fs.readInt()
-        for i in range(num):
-            t = UVMorphOffset()
-            t.load(fs)
-            self.offsets.append(t)
+        self.offsets = MorphOffsetArray(UVMorphOffset, 4)
+        self.offsets.load(fs, fs.readInt())
 
 class UVMorphOffset:
+    __slots__ = ('index', 'offset')
+
     def __init__(self):
         self.index = 0
         self.offset = []
@@ -1237,7 +1959,7 @@ class UVMorphOffset:
         self.offset = fs.readVector(4)
 
     def save(self, fs):
-        fs.writeVertexIndex(self.index)
+        fs.writePacked('<%(vertex)s', int(self.index))
         fs.writeVector(self.offset)
 
 class BoneMorph(Morph):
@@ -1256,6 +1978,8 @@ class BoneMorph(Morph):
             self.offsets.append(t)
 
 class BoneMorphOffset:
+    __slots__ = ('index', 'location_offset', 'rotation_offset')
+
     def __init__(self):
         self.index = None
         self.location_offset = []
@@ -1270,8 +1994,7 @@ class BoneMorphOffset:
 
     def save(self, fs):
         fs.writeBoneIndex(self.index)
-        fs.writeVector(self.location_offset)
-        fs.writeVector(self.rotation_offset)
+        fs.writeVectors(self.location_offset, self.rotation_offset)
 
 class MaterialMorph(Morph):
     def __init__(self, *args, **kwargs):
@@ -1289,6 +2012,10 @@ class MaterialMorph(Morph):
             self.offsets.append(t)
 
 class MaterialMorphOffset:
+    __slots__ = ('index', 'offset_type', 'diffuse_offset', 'specular_offset', 'shininess_offset',
+                 'ambient_offset', 'edge_color_offset', 'edge_size_offset', 'texture_factor',
+                 'sphere_texture_factor', 'toon_texture_factor')
+
     TYPE_MULT = 0
     TYPE_ADD = 1
 
@@ -1319,17 +2046,10 @@ class MaterialMorphOffset:
         self.toon_texture_factor = fs.readVector(4)
 
     def save(self, fs):
-        fs.writeMaterialIndex(self.index)
-        fs.writeSignedByte(self.offset_type)
-        fs.writeVector(self.diffuse_offset)
-        fs.writeVector(self.specular_offset)
-        fs.writeFloat(self.shininess_offset)
-        fs.writeVector(self.ambient_offset)
-        fs.writeVector(self.edge_color_offset)
-        fs.writeFloat(self.edge_size_offset)
-        fs.writeVector(self.texture_factor)
-        fs.writeVector(self.sphere_texture_factor)
-        fs.writeVector(self.toon_texture_factor)
+        fs.writePacked('<%(material)sb', int(self.index), int(self.offset_type))
+        fs.writeVectors(self.diffuse_offset, self.specular_offset, (self.shininess_offset,), self.ambient_offset,
+                        self.edge_color_offset, (self.edge_size_offset,),
+                        self.texture_factor, self.sphere_texture_factor, self.toon_texture_factor)
 
 class GroupMorph(Morph):
     def __init__(self, *args, **kwargs):
@@ -1347,6 +2067,8 @@ class GroupMorph(Morph):
             self.offsets.append(t)
 
 class GroupMorphOffset:
+    __slots__ = ('morph', 'factor')
+
     def __init__(self):
         self.morph = None
         self.factor = 0.0
@@ -1356,8 +2078,7 @@ class GroupMorphOffset:
         self.factor = fs.readFloat()
 
     def save(self, fs):
-        fs.writeMorphIndex(self.morph)
-        fs.writeFloat(self.factor)
+        fs.writePacked('<%(morph)sf', int(self.morph), float(self.factor))
 
 
 class Display:
@@ -1394,6 +2115,21 @@ class Display:
             self.data.append((disp_type, index))
         logging.debug('the number of display elements: %d', len(self.data))
 
+    @staticmethod
+    def skip(fs):
+        header = fs.header()
+        fs.skipStr()
+        fs.skipStr()
+        fs.skip(1)
+        for i in range(fs.readInt()):
+            disp_type = fs.readByte()
+            if disp_type == 0:
+                fs.skip(header.bone_index_size)
+            elif disp_type == 1:
+                fs.skip(header.morph_index_size)
+            else:
+                raise Exception('invalid value.')
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
@@ -1411,6 +2147,10 @@ class Display:
                 raise Exception('invalid value.')
 
 class Rigid:
+    __slots__ = ('name', 'name_e', 'bone', 'collision_group_number', 'collision_group_mask', 'type', 'size',
+                 'location', 'rotation', 'mass', 'velocity_attenuation', 'rotation_attenuation', 'bounce',
+                 'friction', 'mode')
+
     TYPE_SPHERE = 0
     TYPE_BOX = 1
     TYPE_CAPSULE = 2
@@ -1473,33 +2213,28 @@ class Rigid:
 
         self.mode = fs.readSignedByte()
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+        fs.skipStr()
+        # collision group, shape, location, rotation, physics parameters and mode
+        fs.skip(fs.header().bone_index_size + 1 + 2 + 1 + 12 + 24 + 20 + 1)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        if self.bone is None:
-            fs.writeBoneIndex(-1)
-        else:
-            fs.writeBoneIndex(self.bone)
-
-        fs.writeSignedByte(self.collision_group_number)
-        fs.writeUnsignedShort(self.collision_group_mask)
-
-        fs.writeSignedByte(self.type)
-        fs.writeVector(self.size)
-
-        fs.writeVector(self.location)
-        fs.writeVector(self.rotation)
-
-        fs.writeFloat(self.mass)
-        fs.writeFloat(self.velocity_attenuation)
-        fs.writeFloat(self.rotation_attenuation)
-        fs.writeFloat(self.bounce)
-        fs.writeFloat(self.friction)
-
+        fs.writePacked('<%(bone)sbHb', -1 if self.bone is None else int(self.bone),
+                       int(self.collision_group_number), int(self.collision_group_mask), int(self.type))
+        fs.writeVectors(self.size, self.location, self.rotation,
+                        (self.mass, self.velocity_attenuation, self.rotation_attenuation, self.bounce, self.friction))
         fs.writeSignedByte(self.mode)
 
 class Joint:
+    __slots__ = ('name', 'name_e', 'mode', 'src_rigid', 'dest_rigid', 'location', 'rotation', 'maximum_location',
+                 'minimum_location', 'maximum_rotation', 'minimum_rotation', 'spring_constant',
+                 'spring_rotation_constant')
+
     MODE_SPRING6DOF = 0
     def __init__(self):
         self.name = ''
@@ -1558,36 +2293,29 @@ class Joint:
         self.spring_constant = fs.readVector(3)
         self.spring_rotation_constant = fs.readVector(3)
 
+    @staticmethod
+    def skip(fs):
+        fs.skipStr()
+        fs.skipStr()
+        # mode, rigid bodies, location, rotation, limits and springs
+        fs.skip(1 + 2*fs.header().rigid_index_size + 24 + 48 + 24)
+
     def save(self, fs):
         fs.writeStr(self.name)
         fs.writeStr(self.name_e)
 
-        fs.writeSignedByte(self.mode)
-
-        if self.src_rigid is not None:
-            fs.writeRigidIndex(self.src_rigid)
-        else:
-            fs.writeRigidIndex(-1)
-        if self.dest_rigid is not None:
-            fs.writeRigidIndex(self.dest_rigid)
-        else:
-            fs.writeRigidIndex(-1)
-
-        fs.writeVector(self.location)
-        fs.writeVector(self.rotation)
-
-        fs.writeVector(self.minimum_location)
-        fs.writeVector(self.maximum_location)
-        fs.writeVector(self.minimum_rotation)
-        fs.writeVector(self.maximum_rotation)
+        fs.writePacked('<b2%(rigid)s', int(self.mode),
+                       -1 if self.src_rigid is None else int(self.src_rigid),
+                       -1 if self.dest_rigid is None else int(self.dest_rigid))
 
-        fs.writeVector(self.spring_constant)
-        fs.writeVector(self.spring_rotation_constant)
+        fs.writeVectors(self.location, self.rotation,
+                        self.minimum_location, self.maximum_location, self.minimum_rotation, self.maximum_rotation,
+                        self.spring_constant, self.spring_rotation_constant)
 
 
 
-def load(path):
-    with FileReadStream(path) as fs:
+def load(path, vertex_array=False, use_mmap=False, sections=None):
+    with FileReadStream(path, use_mmap=use_mmap) as fs:
         logging.info('****************************************')
         logging.info(' miu_mmd_tools.pmx module')
         logging.info('----------------------------------------')
@@ -1599,7 +2327,7 @@ def load(path):
         fs.setHeader(header)
         model = Model()
         try:
-            model.load(fs)
+            model.load(fs, vertex_array, sections)
         except struct.error as e:
             logging.error(' * Corrupted file: %s', e)
             #raise
@@ -1609,6 +2337,43 @@ def load(path):
         logging.info('****************************************')
         return model
 
+def probe(path, use_mmap=True):
+    """ Return the header information and the number of records of a pmx file
+
+    The records are skipped by their sizes without being decoded.
+    """
+    with FileReadStream(path, use_mmap=use_mmap) as fs:
+        header = Header()
+        header.load(fs)
+        fs.setHeader(header)
+        info = {
+            'format': 'pmx',
+            'filepath': path,
+            'version': header.version,
+            'encoding': header.encoding.charset,
+            'additional_uvs': header.additional_uvs,
+            'vertex_index_size': header.vertex_index_size,
+            'texture_index_size': header.texture_index_size,
+            'material_index_size': header.material_index_size,
+            'bone_index_size': header.bone_index_size,
+            'morph_index_size': header.morph_index_size,
+            'rigid_index_size': header.rigid_index_size,
+            'name': '',
+            'name_e': '',
+            'comment': '',
+            'comment_e': '',
+            }
+        info.update((name, 0) for name in Model.SECTIONS)
+        try:
+            for key in ('name', 'name_e', 'comment', 'comment_e'):
+                info[key] = fs.readStr()
+            for name in Model.SECTIONS:
+                info[name] = Model.skipSection(fs, name)
+        except struct.error as e:
+            logging.error(' * Corrupted file: %s', e)
+        info['faces'] = int(info['faces']/3)
+        return info
+
 def save(path, model, add_uv_count=0):
     with FileWriteStream(path) as fs:
         header = Header(model)
@@ -5,6 +5,7 @@ import logging
 import time
 
 import bpy
+import numpy as np
 from mathutils import Vector, Matrix
 
 import miu_mmd_tools.core.model as mmd_model
@@ -37,6 +38,14 @@ class PMXImporter:
         7: 'uv_morphs',
         8: 'material_morphs',
         }
+    # the other sections are loaded on demand
+    TYPE_SECTIONS = {
+        'MESH': ('vertices', 'faces', 'textures', 'materials', 'bones'),
+        'ARMATURE': ('bones',),
+        'PHYSICS': ('bones', 'rigids', 'joints'),
+        'DISPLAY': ('bones', 'morphs', 'display'),
+        'MORPHS': ('vertices', 'materials', 'bones', 'morphs'),
+        }
 
     def __init__(self):
         self.__model = None
@@ -121,11 +130,18 @@ class PMXImporter:
         vertex_map = self.__vertex_map
         if vertex_map:
             indices = collections.OrderedDict(vertex_map).keys()
-            pmx_vertices = tuple(pmxModel.vertices[x] for x in indices)
+            if isinstance(pmx_vertices, pmx.VertexArray):
+                pmx_vertices = pmx_vertices[list(indices)]
+            else:
+                pmx_vertices = tuple(pmxModel.vertices[x] for x in indices)
             vertex_count = len(indices)
         if vertex_count < 1:
             return
 
+        if isinstance(pmx_vertices, pmx.VertexArray):
+            self.__importVertexArray(pmx_vertices)
+            return
+
         mesh = self.__meshObj.data
         mesh.vertices.add(count=vertex_count)
         mesh.vertices.foreach_set('co', tuple(i for pv in pmx_vertices for i in (Vector(pv.co).xzy * self.__scale)))
@@ -163,6 +179,66 @@ class PMXImporter:
         vg_edge_scale.lock_weight = True
         vg_vertex_order.lock_weight = True
 
+    @staticmethod
+    def __addGroupedWeights(vertex_group, indices, weights, type):
+        order = np.argsort(weights, kind='stable')
+        weights, indices = weights[order], indices[order]
+        splits = np.flatnonzero(weights[1:] != weights[:-1]) + 1
+        for w, idx in zip(weights[np.r_[0, splits]].tolist(), np.split(indices, splits)):
+            vertex_group.add(index=idx.tolist(), weight=w, type=type)
+
+    def __importVertexArray(self, pmx_vertices):
+        vertex_count = len(pmx_vertices)
+        mesh = self.__meshObj.data
+        mesh.vertices.add(count=vertex_count)
+        mesh.vertices.foreach_set('co', (pmx_vertices.co[:, (0, 2, 1)] * self.__scale).ravel())
+
+        vertex_group_table = self.__vertexGroupTable
+        vg_edge_scale = self.__meshObj.vertex_groups.new(name='mmd_edge_scale')
+        vg_vertex_order = self.__meshObj.vertex_groups.new(name='mmd_vertex_order')
+        self.__addGroupedWeights(vg_edge_scale, np.arange(vertex_count), pmx_vertices.edge_scale, 'REPLACE')
+        for i in range(vertex_count):
+            vg_vertex_order.add(index=(i,), weight=i/vertex_count, type='REPLACE')
+
+        weight_type = pmx_vertices.weight_type
+        bones, weights = pmx_vertices.bones, pmx_vertices.weights.astype(np.float64)
+
+        sdef_indices = np.flatnonzero(weight_type == pmx.BoneWeight.SDEF)
+        swapped = sdef_indices[bones[sdef_indices, 0] > bones[sdef_indices, 1]]
+        if len(swapped):
+            bones[swapped, :2] = bones[swapped, 1::-1]
+            weights[swapped, 0] = 1.0 - weights[swapped, 0]
+            pmx_vertices.weights[swapped, 0] = weights[swapped, 0]
+            pmx_vertices.sdef_r0[swapped], pmx_vertices.sdef_r1[swapped] = pmx_vertices.sdef_r1[swapped], pmx_vertices.sdef_r0[swapped].copy()
+
+        # columns of (bone index, weight) for each deform type
+        is_bdef1 = weight_type == pmx.BoneWeight.BDEF1
+        is_bdef4 = weight_type == pmx.BoneWeight.BDEF4
+        is_two_bones = ~(is_bdef1 | is_bdef4)
+        weights[is_bdef1, 0] = 1.0
+        weights[is_two_bones, 1] = 1.0 - weights[is_two_bones, 0]
+        valid = np.zeros(bones.shape, dtype=bool)
+        valid[is_bdef1, 0] = bones[is_bdef1, 0] >= 0
+        valid[is_two_bones, :2] = True
+        valid[is_bdef4] = True
+
+        for c in range(4):
+            indices = np.flatnonzero(valid[:, c])
+            if len(indices) < 1:
+                continue
+            column_bones = bones[indices, c]
+            order = np.argsort(column_bones, kind='stable')
+            indices, column_bones = indices[order], column_bones[order]
+            splits = np.flatnonzero(column_bones[1:] != column_bones[:-1]) + 1
+            for bone_index, idx in zip(column_bones[np.r_[0, splits]].tolist(), np.split(indices, splits)):
+                self.__addGroupedWeights(vertex_group_table[bone_index], idx, weights[idx, c], 'ADD')
+
+        for i in sdef_indices.tolist():
+            self.__sdefVertices[i] = pmx_vertices[i]
+
+        vg_edge_scale.lock_weight = True
+        vg_vertex_order.lock_weight = True
+
     def __storeVerticesSDEF(self):
         if len(self.__sdefVertices) < 1:
             return
@@ -601,14 +677,38 @@ class PMXImporter:
         uv_textures, uv_layers = getattr(mesh, 'uv_textures', mesh.uv_layers), mesh.uv_layers
         uv_tex = uv_textures.new()
         uv_layer = uv_layers[uv_tex.name]
-        uv_table = {vi:self.flipUV_V(v.uv) for vi, v in enumerate(pmxModel.vertices)}
-        uv_layer.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i]))
+        if isinstance(pmxModel.vertices, pmx.VertexArray):
+            uv_layer.data.foreach_set('uv', self.__flipUVArray(pmxModel.vertices.uv)[list(loop_indices_orig)].ravel())
+        else:
+            uv_table = {vi:self.flipUV_V(v.uv) for vi, v in enumerate(pmxModel.vertices)}
+            uv_layer.data.foreach_set('uv', tuple(v for i in loop_indices_orig for v in uv_table[i]))
 
         if hasattr(mesh, 'uv_textures'):
             for bf, mi in zip(uv_tex.data, material_indices):
                 bf.image = self.__imageTable.get(mi, None)
 
-        if pmxModel.header and pmxModel.header.additional_uvs:
+        if pmxModel.header and pmxModel.header.additional_uvs and isinstance(pmxModel.vertices, pmx.VertexArray):
+            logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
+            loop_vertices = list(loop_indices_orig)
+            zw_data_map = collections.OrderedDict()
+            for i in range(pmxModel.header.additional_uvs):
+                add_uv = uv_layers[uv_textures.new(name='UV'+str(i+1)).name]
+                logging.info(' - %s...(uv channels)', add_uv.name)
+                uvzw = pmxModel.vertices.additional_uvs[:, i]
+                add_uv.data.foreach_set('uv', self.__flipUVArray(uvzw[:, :2])[loop_vertices].ravel())
+                if not uvzw[:, 2:].any():
+                    logging.info('\t- zw are all zeros: %s', add_uv.name)
+                else:
+                    zw_data_map['_'+add_uv.name] = self.__flipUVArray(uvzw[:, 2:])
+            for name, zw_data in zw_data_map.items():
+                logging.info(' - %s...(zw channels of %s)', name, name[1:])
+                add_zw = uv_textures.new(name=name)
+                if add_zw is None:
+                    logging.warning('\t* Lost zw channels')
+                    continue
+                add_zw = uv_layers[add_zw.name]
+                add_zw.data.foreach_set('uv', zw_data[loop_vertices].ravel())
+        elif pmxModel.header and pmxModel.header.additional_uvs:
             logging.info('Importing %d additional uvs', pmxModel.header.additional_uvs)
             zw_data_map = collections.OrderedDict()
             split_uvzw = lambda uvi: (self.flipUV_V(uvi[:2]), uvi[2:])
@@ -633,6 +733,12 @@ class PMXImporter:
         if bpy.app.version >= (2, 80, 0):
             self.__fixOverlappingFaceMaterials(mesh.materials, mesh.vertices, loop_indices, material_indices)
 
+    @staticmethod
+    def __flipUVArray(uv):
+        uv = uv.astype(np.float64)
+        uv[:, 1] = 1.0 - uv[:, 1]
+        return uv.astype(np.float32)
+
     def __fixOverlappingFaceMaterials(self, materials, vertices, loop_indices, material_indices):
         # This is not the best way to setup blend_method, might just work for some common cases. And FnMaterial.update_alpha() is still using 'HASHED'.
         # For EEVEE, basically users should know which blend_method is best for each material of their models.
@@ -663,10 +769,20 @@ class PMXImporter:
             vtx_morph.name = morph.name
             vtx_morph.name_e = morph.name_e
             vtx_morph.category = categories.get(morph.category, 'OTHER')
+            if isinstance(morph.offsets, pmx.MorphOffsetArray):
+                self.__addShapeKeyOffsets(shapeKey, morph.offsets)
+                continue
             for md in morph.offsets:
                 shapeKeyPoint = shapeKey.data[md.index]
                 shapeKeyPoint.co += Vector(md.offset).xzy * self.__scale
 
+    def __addShapeKeyOffsets(self, shapeKey, offsets):
+        co = np.empty(len(shapeKey.data)*3, dtype=np.float64)
+        shapeKey.data.foreach_get('co', co)
+        co = co.reshape(-1, 3)
+        np.add.at(co, offsets.index, offsets.offset[:, (0, 2, 1)].astype(np.float64) * self.__scale)
+        shapeKey.data.foreach_set('co', co.ravel())
+
     def __importMaterialMorphs(self):
         mmd_root = self.__root.mmd_root
         categories = self.CATEGORIES
@@ -721,7 +837,10 @@ class PMXImporter:
             uv_morph.category = categories.get(morph.category, 'OTHER')
             uv_morph.uv_index = morph.uv_index
 
-            offsets = (__OffsetData(d.index, __convert_offset(d.offset)) for d in morph.offsets)
+            if isinstance(morph.offsets, pmx.MorphOffsetArray):
+                offsets = (__OffsetData(*d) for d in zip(morph.offsets.index.tolist(), (morph.offsets.offset * (1, -1, 1, -1)).tolist()))
+            else:
+                offsets = (__OffsetData(d.index, __convert_offset(d.offset)) for d in morph.offsets)
             FnMorph.store_uv_morph_data(self.__meshObj, uv_morph, offsets, '')
             uv_morph.data_type = 'VERTEX_GROUP'
 
@@ -782,7 +901,15 @@ class PMXImporter:
             logging.info(' * No support for custom normals!!')
             return
         logging.info('Setting custom normals...')
-        if self.__vertex_map:
+        if isinstance(self.__model.vertices, pmx.VertexArray):
+            normals = self.__model.vertices.normal[:, (0, 2, 1)].astype(np.float64)
+            lengths = np.linalg.norm(normals, axis=1)
+            normals[lengths > 0] /= lengths[lengths > 0, None]
+            if self.__vertex_map:
+                mesh.normals_split_custom_set(normals[[i for f in self.__model.faces for i in f]].tolist())
+            else:
+                mesh.normals_split_custom_set_from_vertices(normals.tolist())
+        elif self.__vertex_map:
             verts, faces = self.__model.vertices, self.__model.faces
             custom_normals = [(Vector(verts[i].normal).xzy).normalized() for f in faces for i in f]
             mesh.normals_split_custom_set(custom_normals)
@@ -809,16 +936,38 @@ class PMXImporter:
             m.name = utils.uniqueName(m.name or 'Morph', used_names)
             used_names.add(m.name)
 
-    def execute(self, **args):
+    @classmethod
+    def load(cls, **args):
+        """ Return (model, vertex_map) for execute()
+
+        This doesn't touch bpy data, so it can run in a worker thread and the
+        result is passed to execute() by the 'loaded_model' argument.
+        """
+        types = args.get('types', set())
+        clean_options = {
+            'clean_model': 'MESH' in types and args.get('clean_model', False),
+            'remove_doubles': 'MESH' in types and args.get('remove_doubles', False),
+            'mesh_only': 'MORPHS' not in types,
+            }
         if 'pmx' in args:
-            self.__model = args['pmx']
-        else:
-            self.__model = pmx.load(args['filepath'])
-        self.__fixRepeatedMorphName()
+            return clean_pmx_model(args['pmx'], **clean_options)
+        sections = set()
+        for t in types:
+            sections.update(cls.TYPE_SECTIONS.get(t, ()))
+        model_cache = args.get('model_cache', None)
+        if model_cache is None:
+            return load_model(args['filepath'], sections, **clean_options)
+        return model_cache.load(args['filepath'], load_model, sections=sections, **clean_options)
 
+    def execute(self, **args):
         types = args.get('types', set())
-        clean_model = args.get('clean_model', False)
-        remove_doubles = args.get('remove_doubles', False)
+        if args.get('loaded_model', None) is not None:
+            self.__model, self.__vertex_map = args['loaded_model']
+        else:
+            self.__model, self.__vertex_map = self.load(**args)
+        if 'MORPHS' in types or 'DISPLAY' in types:
+            self.__fixRepeatedMorphName()
+
         self.__scale = args.get('scale', 1.0)
         self.__use_mipmap = args.get('use_mipmap', True)
         self.__sph_blend_factor = args.get('sph_blend_factor', 1.0)
@@ -839,10 +988,6 @@ class PMXImporter:
         self.__createObjects()
 
         if 'MESH' in types:
-            if clean_model:
-                _PMXCleaner.clean(self.__model, 'MORPHS' not in types)
-            if remove_doubles:
-                self.__vertex_map = _PMXCleaner.remove_doubles(self.__model, 'MORPHS' not in types)
             self.__createMeshObject()
             self.__importVertices()
             self.__importMaterials()
@@ -914,6 +1059,15 @@ class _PMXCleaner:
         is_index_clean = len(index_map) == len(pmx_vertices)
         if is_index_clean:
             logging.info('   (vertices is clean)')
+        elif isinstance(pmx_vertices, pmx.VertexArray):
+            used_vertices = sorted(index_map)
+            index_map = {v:i for i, v in enumerate(used_vertices)}
+            logging.warning('   - removed %d vertices', len(pmx_vertices)-len(used_vertices))
+            pmx_model.vertices = pmx_vertices[used_vertices]
+
+            # update vertex indices of faces
+            for f in pmx_faces:
+                f[:] = [index_map[v] for v in f]
         else:
             new_vertex_count = 0
             for v in sorted(index_map):
@@ -937,7 +1091,9 @@ class _PMXCleaner:
             def __update_index(x):
                 x.index = index_map.get(x.index, None)
                 return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            index_table = np.full(max(index_map)+1 if index_map else 0, -1, dtype=np.int64)
+            index_table[list(index_map.keys())] = list(index_map.values())
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index, index_table)
         logging.info('   - Done!!')
 
     @classmethod
@@ -947,12 +1103,22 @@ class _PMXCleaner:
 
         vertex_map = [None] * len(pmx_vertices)
         # gather vertex data
-        for i, v in enumerate(pmx_vertices):
-            vertex_map[i] = [tuple(v.co)]
+        if isinstance(pmx_vertices, pmx.VertexArray):
+            vertex_uvs = [tuple(uv) for uv in pmx_vertices.uv.tolist()]
+            for i, co in enumerate(pmx_vertices.co.tolist()):
+                vertex_map[i] = [tuple(co)]
+        else:
+            vertex_uvs = [tuple(v.uv) for v in pmx_vertices]
+            for i, v in enumerate(pmx_vertices):
+                vertex_map[i] = [tuple(v.co)]
         if not mesh_only:
             for m in pmx_model.morphs:
                 if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
                     continue
+                if isinstance(m.offsets, pmx.MorphOffsetArray):
+                    for index, offset in zip(m.offsets.index.tolist(), m.offsets.offset.tolist()):
+                        vertex_map[index].append(tuple(offset))
+                    continue
                 for x in m.offsets:
                     vertex_map[x.index].append(tuple(x.offset))
         # generate vertex merging table
@@ -973,7 +1139,7 @@ class _PMXCleaner:
 
         # clean face
         #face_key_func = lambda f: frozenset(vertex_map[x][0] for x in f)
-        face_key_func = lambda f: frozenset({vertex_map[x][0]:tuple(pmx_vertices[x].uv) for x in f}.items())
+        face_key_func = lambda f: frozenset({vertex_map[x][0]:vertex_uvs[x] for x in f}.items())
         cls.__clean_pmx_faces(pmx_model.faces, pmx_model.materials, face_key_func)
 
         if mesh_only:
@@ -984,7 +1150,8 @@ class _PMXCleaner:
                 indices = vertex_map[x.index]
                 x.index = indices[1] if x.index == indices[0] else None
                 return x.index is not None
-            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index)
+            index_table = np.array([b if a == i else -1 for i, (a, b) in enumerate(vertex_map)], dtype=np.int64)
+            cls.__clean_pmx_morphs(pmx_model.morphs, __update_index, index_table)
             logging.info('   - Done!!')
         return vertex_map
 
@@ -1016,13 +1183,34 @@ class _PMXCleaner:
             del pmx_faces[new_face_count:]
 
     @staticmethod
-    def __clean_pmx_morphs(pmx_morphs, index_update_func):
+    def __clean_pmx_morphs(pmx_morphs, index_update_func, index_table):
+        """ index_table maps the old vertex indices to the new ones, or -1 for removed vertices """
         for m in pmx_morphs:
             if not isinstance(m, pmx.VertexMorph) and not isinstance(m, pmx.UVMorph):
                 continue
             old_len = len(m.offsets)
-            m.offsets = [x for x in m.offsets if index_update_func(x)]
+            if isinstance(m.offsets, pmx.MorphOffsetArray):
+                indices = np.full(old_len, -1, dtype=np.int64)
+                valid = (m.offsets.index >= 0) & (m.offsets.index < len(index_table))
+                indices[valid] = index_table[m.offsets.index[valid]]
+                m.offsets = m.offsets[indices >= 0]
+                m.offsets.index[:] = indices[indices >= 0]
+            else:
+                m.offsets = [x for x in m.offsets if index_update_func(x)]
             counts = old_len - len(m.offsets)
             if counts:
                 logging.warning('   - removed %d (of %d) offsets of "%s"', counts, old_len, m.name)
 
+
+def clean_pmx_model(model, clean_model=False, remove_doubles=False, mesh_only=False):
+    """ Clean the pmx model in place, and return (model, vertex_map of remove_doubles) """
+    vertex_map = None
+    if clean_model:
+        _PMXCleaner.clean(model, mesh_only)
+    if remove_doubles:
+        vertex_map = _PMXCleaner.remove_doubles(model, mesh_only)
+    return model, vertex_map
+
+def load_model(filepath, sections=None, **clean_options):
+    """ Load and clean a pmx file for PMXImporter, the result can be cached by core.model_cache """
+    return clean_pmx_model(pmx.load(filepath, vertex_array=True, sections=sections), **clean_options)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+""" Load files in worker threads ahead of the main thread
+
+The file readers of core.pmx, core.pmd, core.vmd and core.vpd don't touch
+bpy data, so the files can be read and decoded in worker threads while the
+main thread imports the previous ones into Blender. The numpy decoders and
+the file I/O release the GIL, so the workers overlap with each other and with
+the main thread.
+"""
+
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def prefetch(func, items, max_workers=None, max_pending=None):
+    """ Yield (item, func(item)) in the order of items
+
+    func(item) is called in worker threads, and at most max_pending results
+    are kept ahead of the consumer, so the memory is capped even if the
+    consumer is slower than the workers. An exception of func(item) is raised
+    when the item is reached, and the pending items are cancelled.
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = min(len(items), os.cpu_count() or 1)
+    max_workers = max(max_workers, 1)
+    if max_pending is None:
+        max_pending = max_workers + 1
+    max_pending = max(max_pending, 1)
+
+    if max_workers == 1 and max_pending == 1 or len(items) < 2:
+        for item in items:
+            yield item, func(item)
+        return
+
+    pending = collections.deque()
+    remaining = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in remaining:
+                pending.append((item, executor.submit(func, item)))
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                item, future = pending.popleft()
+                result = future.result()
+                for next_item in remaining:
+                    pending.append((next_item, executor.submit(func, next_item)))
+                    break
+                yield item, result
+        finally:
+            for item, future in pending:
+                future.cancel()
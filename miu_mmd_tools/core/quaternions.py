@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+""" Functions of the arrays of quaternions (w, x, y, z) """
+
+import numpy as np
+
+def toQuaternions(rotations_xyzw):
+    """ Convert an array of (N, 4) rotations (x, y, z, w) to normalized quaternions (w, x, y, z) """
+    q = np.asarray(rotations_xyzw, dtype=np.float64).reshape(-1, 4)[:, (3, 0, 1, 2)]
+    return q/np.maximum(np.linalg.norm(q, axis=1), 1e-12)[:, None]
+
+def multiplyQuaternions(q0, q1):
+    """ Return the products of the quaternions (w, x, y, z), as matmul(q0, q1) """
+    w0, x0, y0, z0 = np.moveaxis(q0, -1, 0)
+    w1, x1, y1, z1 = np.moveaxis(q1, -1, 0)
+    return np.stack([
+        w0*w1 - x0*x1 - y0*y1 - z0*z1,
+        w0*x1 + x0*w1 + y0*z1 - z0*y1,
+        w0*y1 - x0*z1 + y0*w1 + z0*x1,
+        w0*z1 + x0*y1 - y0*x1 + z0*w1,
+        ], axis=-1)
+
+def canonicalQuaternions(q):
+    """ Flip the quaternions (w, x, y, z) to w >= 0, as Matrix.to_quaternion() """
+    return q*np.where(q[:, :1] < 0, -1.0, 1.0)
+
+def compatibleQuaternions(rotations, prev_rot=None, fixed=None):
+    """ Flip the quaternions (w, x, y, z) to be compatible with prev_rot and the previous ones,
+    the quaternions of the fixed mask are kept as they are
+    """
+    rotations = np.array(rotations, dtype=np.float64).reshape(-1, 4)
+    if prev_rot is not None:
+        rotations = np.concatenate([[tuple(prev_rot)], rotations])
+    if len(rotations) > 1:
+        signs = np.cumprod(np.where((rotations[1:]*rotations[:-1]).sum(axis=1) < 0, -1.0, 1.0))
+        if fixed is not None:
+            fixed = np.asarray(fixed, dtype=bool).reshape(-1)[(0 if prev_rot is not None else 1):]
+            last_fixed = np.maximum.accumulate(np.where(fixed, np.arange(len(fixed)), -1))
+            signs /= np.where(last_fixed < 0, 1.0, signs[last_fixed])
+        rotations[1:] *= signs[:, None]
+    return rotations if prev_rot is None else rotations[1:]
+
+def matrixQuaternions(matrices):
+    """ Return the quaternions (w, x, y, z) of the (N, 3, 3) matrices without the scales, as Matrix.to_quaternion() """
+    m = np.asarray(matrices, dtype=np.float64).reshape(-1, 3, 3)
+    m = m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12) # normalize the axes
+    m00, m01, m02, m10, m11, m12, m20, m21, m22 = m.reshape(-1, 9).T
+    candidates = np.array([ # 4w*q, 4x*q, 4y*q, 4z*q
+        (1 + m00 + m11 + m22, m21 - m12, m02 - m20, m10 - m01),
+        (m21 - m12, 1 + m00 - m11 - m22, m01 + m10, m02 + m20),
+        (m02 - m20, m01 + m10, 1 - m00 + m11 - m22, m12 + m21),
+        (m10 - m01, m02 + m20, m12 + m21, 1 - m00 - m11 + m22),
+        ]).transpose(2, 0, 1)
+    # the largest of w, x, y, z is the most accurate
+    q = candidates[np.arange(len(m)), np.argmax(np.stack([m00 + m11 + m22, m00, m11, m22], axis=1), axis=1)]
+    q /= np.maximum(np.linalg.norm(q, axis=1), 1e-12)[:, None]
+    return canonicalQuaternions(q)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+""" Scan directories of MMD files by the probe() functions of pmx, pmd and vmd modules """
+
+import logging
+import os
+from concurrent import futures
+
+from miu_mmd_tools.core import pmd
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import vmd
+
+PROBE_FUNCTIONS = {
+    '.pmx': pmx.probe,
+    '.pmd': pmd.probe,
+    '.vmd': vmd.probe,
+    }
+
+def probe(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in PROBE_FUNCTIONS:
+        raise ValueError('unsupported file type: %s'%path)
+    return PROBE_FUNCTIONS[ext](path)
+
+def iter_files(directory, recursive=True, extensions=None):
+    extensions = set(x.lower() for x in (extensions or PROBE_FUNCTIONS.keys()))
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+
+def _probe_files(paths):
+    ret = []
+    for path in paths:
+        try:
+            ret.append((path, probe(path), None))
+        except Exception as e:
+            ret.append((path, None, e))
+    return ret
+
+def scan_directory(directory, recursive=True, extensions=None, max_workers=None, chunk_size=16, use_threads=False):
+    """ Probe the files in a directory, and yield (path, info, error) as the results arrive
+
+    The files are probed in a process pool by chunks of chunk_size files.
+    Use use_threads=True where worker processes can not import this module
+    (e.g. inside Blender on platforms which spawn the workers).
+    """
+    paths = list(iter_files(directory, recursive, extensions))
+    executor_class = futures.ThreadPoolExecutor if use_threads else futures.ProcessPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        jobs = [executor.submit(_probe_files, paths[i:i+chunk_size]) for i in range(0, len(paths), chunk_size)]
+        try:
+            for job in futures.as_completed(jobs):
+                for path, info, error in job.result():
+                    if error is not None:
+                        logging.warning('failed to probe %s: %s', path, error)
+                    yield path, info, error
+        finally:
+            for job in jobs: # the scanning is stopped by the caller
+                job.cancel()
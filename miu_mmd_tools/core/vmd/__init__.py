@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import struct
 import collections
+import mmap
+import os
+
+import numpy as np
 
 class InvalidFileError(Exception):
     pass
@@ -12,6 +16,62 @@ def _toShiftJisString(byteString):
 def _toShiftJisBytes(string):
     return string.encode('shift_jis', errors='replace')
 
+def _frameNumbers(values):
+    """ Return the array of the frame numbers, which must be in the range of '<L' as struct.pack() """
+    ret = np.asarray(values)
+    if len(ret) and (ret.min() < 0 or ret.max() > 0xFFFFFFFF):
+        raise struct.error('frame number %s is out of range'%(ret.min() if ret.min() < 0 else ret.max()))
+    return ret
+
+
+class _MappedFile:
+    """ Read-only file object of a memory mapped file
+
+    read() returns memoryview slices of the mapped file, so struct.unpack()
+    decodes the data without copying it.
+    """
+    def __init__(self, path):
+        self.__map = None
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__buffer = memoryview(self.__map if self.__map is not None else b'')
+        self.__offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, size=-1):
+        offset = self.__offset
+        if size < 0:
+            self.__offset = len(self.__buffer)
+        else:
+            self.__offset = min(offset + size, len(self.__buffer))
+        return self.__buffer[offset:self.__offset]
+
+    def tell(self):
+        return self.__offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.__offset
+        elif whence == os.SEEK_END:
+            offset += len(self.__buffer)
+        self.__offset = max(0, offset)
+        return self.__offset
+
+    def close(self):
+        self.__buffer.release()
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError: # still referenced by the decoded data
+                pass
+            self.__map = None
+
 
 class Header:
     VMD_SIGN = b'Vocaloid Motion Data 0002'
@@ -33,7 +93,20 @@ class Header:
         return '<Header model_name %s>'%(self.model_name)
 
 
+# record layouts of the frame keys
+_BONE_KEY_DTYPE = np.dtype([('name', 'S15'), ('frame_number', '<u4'), ('location', '<f4', (3,)), ('rotation', '<f4', (4,)), ('interp', 'i1', (64,))])
+_SHAPE_KEY_DTYPE = np.dtype([('name', 'S15'), ('frame_number', '<u4'), ('weight', '<f4')])
+_CAMERA_KEY_DTYPE = np.dtype([('frame_number', '<u4'), ('distance', '<f4'), ('location', '<f4', (3,)), ('rotation', '<f4', (3,)),
+                              ('interp', 'i1', (24,)), ('angle', '<u4'), ('persp', 'i1')])
+_LAMP_KEY_DTYPE = np.dtype([('frame_number', '<u4'), ('color', '<f4', (3,)), ('direction', '<f4', (3,))])
+_SELF_SHADOW_KEY_DTYPE = np.dtype([('frame_number', '<u4'), ('mode', 'i1'), ('distance', '<f4')])
+
+
 class BoneFrameKey:
+    __slots__ = ('frame_number', 'location', 'rotation', 'interp')
+    __STRUCT = struct.Struct('<L3f4f64b')
+    __INTERP_STRUCT = struct.Struct('<64b')
+
     def __init__(self):
         self.frame_number = 0
         self.location = []
@@ -41,12 +114,36 @@ class BoneFrameKey:
         self.interp = []
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.location = list(struct.unpack('<fff', fin.read(4*3)))
-        self.rotation = list(struct.unpack('<ffff', fin.read(4*4)))
+        values = self.__STRUCT.unpack(fin.read(self.__STRUCT.size))
+        self.frame_number = values[0]
+        self.location = values[1:4]
+        self.rotation = values[4:8]
         if not any(self.rotation):
             self.rotation = (0, 0, 0, 1)
-        self.interp = list(struct.unpack('<64b', fin.read(64)))
+        self.interp = values[8:]
+
+    @classmethod
+    def fromRecords(cls, records):
+        ret = []
+        for values in zip(*(records[x].tolist() for x in ('frame_number', 'location', 'rotation', 'interp'))):
+            frameKey = cls()
+            frameKey.frame_number = values[0]
+            frameKey.location = tuple(values[1])
+            frameKey.rotation = tuple(values[2])
+            frameKey.interp = tuple(values[3])
+            ret.append(frameKey)
+        return ret
+
+    @staticmethod
+    def toRecords(frameKeys):
+        records = np.zeros(len(frameKeys), dtype=_BONE_KEY_DTYPE)
+        if len(records):
+            records['frame_number'] = _frameNumbers([x.frame_number for x in frameKeys])
+            records['location'] = [x.location for x in frameKeys]
+            records['rotation'] = [x.rotation for x in frameKeys]
+            pack = BoneFrameKey.__INTERP_STRUCT.pack # faster than converting the lists of 64 integers
+            records['interp'] = np.frombuffer(b''.join([pack(*x.interp) for x in frameKeys]), dtype='i1').reshape(-1, 64)
+        return records
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -63,13 +160,32 @@ class BoneFrameKey:
 
 
 class ShapeKeyFrameKey:
+    __slots__ = ('frame_number', 'weight')
+    __STRUCT = struct.Struct('<Lf')
+
     def __init__(self):
         self.frame_number = 0
         self.weight = 0.0
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.weight, = struct.unpack('<f', fin.read(4))
+        self.frame_number, self.weight = self.__STRUCT.unpack(fin.read(self.__STRUCT.size))
+
+    @classmethod
+    def fromRecords(cls, records):
+        ret = []
+        for values in zip(records['frame_number'].tolist(), records['weight'].tolist()):
+            frameKey = cls()
+            frameKey.frame_number, frameKey.weight = values
+            ret.append(frameKey)
+        return ret
+
+    @staticmethod
+    def toRecords(frameKeys):
+        records = np.zeros(len(frameKeys), dtype=_SHAPE_KEY_DTYPE)
+        if len(records):
+            records['frame_number'] = _frameNumbers([x.frame_number for x in frameKeys])
+            records['weight'] = [x.weight for x in frameKeys]
+        return records
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -83,6 +199,9 @@ class ShapeKeyFrameKey:
 
 
 class CameraKeyFrameKey:
+    __slots__ = ('frame_number', 'distance', 'location', 'rotation', 'interp', 'angle', 'persp')
+    __STRUCT = struct.Struct('<Lf3f3f24bLb')
+
     def __init__(self):
         self.frame_number = 0
         self.distance = 0.0
@@ -93,14 +212,40 @@ class CameraKeyFrameKey:
         self.persp = True
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.distance, = struct.unpack('<f', fin.read(4))
-        self.location = list(struct.unpack('<fff', fin.read(4*3)))
-        self.rotation = list(struct.unpack('<fff', fin.read(4*3)))
-        self.interp = list(struct.unpack('<24b', fin.read(24)))
-        self.angle, = struct.unpack('<L', fin.read(4))
-        self.persp, = struct.unpack('<b', fin.read(1))
-        self.persp = (self.persp == 0)
+        values = self.__STRUCT.unpack(fin.read(self.__STRUCT.size))
+        self.frame_number, self.distance = values[0:2]
+        self.location = values[2:5]
+        self.rotation = values[5:8]
+        self.interp = values[8:32]
+        self.angle = values[32]
+        self.persp = (values[33] == 0)
+
+    @classmethod
+    def fromRecords(cls, records):
+        ret = []
+        for values in zip(*(records[x].tolist() for x in ('frame_number', 'distance', 'location', 'rotation', 'interp', 'angle', 'persp'))):
+            frameKey = cls()
+            frameKey.frame_number, frameKey.distance = values[0:2]
+            frameKey.location = tuple(values[2])
+            frameKey.rotation = tuple(values[3])
+            frameKey.interp = tuple(values[4])
+            frameKey.angle = values[5]
+            frameKey.persp = (values[6] == 0)
+            ret.append(frameKey)
+        return ret
+
+    @staticmethod
+    def toRecords(frameKeys):
+        records = np.zeros(len(frameKeys), dtype=_CAMERA_KEY_DTYPE)
+        if len(records):
+            records['frame_number'] = _frameNumbers([x.frame_number for x in frameKeys])
+            records['distance'] = [x.distance for x in frameKeys]
+            records['location'] = [x.location for x in frameKeys]
+            records['rotation'] = [x.rotation for x in frameKeys]
+            records['interp'] = [x.interp for x in frameKeys]
+            records['angle'] = [x.angle for x in frameKeys]
+            records['persp'] = [0 if x.persp else 1 for x in frameKeys]
+        return records
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -123,15 +268,39 @@ class CameraKeyFrameKey:
 
 
 class LampKeyFrameKey:
+    __slots__ = ('frame_number', 'color', 'direction')
+    __STRUCT = struct.Struct('<L3f3f')
+
     def __init__(self):
         self.frame_number = 0
         self.color = []
         self.direction = []
 
     def load(self, fin):
-        self.frame_number, = struct.unpack('<L', fin.read(4))
-        self.color = list(struct.unpack('<fff', fin.read(4*3)))
-        self.direction = list(struct.unpack('<fff', fin.read(4*3)))
+        values = self.__STRUCT.unpack(fin.read(self.__STRUCT.size))
+        self.frame_number = values[0]
+        self.color = values[1:4]
+        self.direction = values[4:7]
+
+    @classmethod
+    def fromRecords(cls, records):
+        ret = []
+        for values in zip(*(records[x].tolist() for x in ('frame_number', 'color', 'direction'))):
+            frameKey = cls()
+            frameKey.frame_number = values[0]
+            frameKey.color = tuple(values[1])
+            frameKey.direction = tuple(values[2])
+            ret.append(frameKey)
+        return ret
+
+    @staticmethod
+    def toRecords(frameKeys):
+        records = np.zeros(len(frameKeys), dtype=_LAMP_KEY_DTYPE)
+        if len(records):
+            records['frame_number'] = _frameNumbers([x.frame_number for x in frameKeys])
+            records['color'] = [x.color for x in frameKeys]
+            records['direction'] = [x.direction for x in frameKeys]
+        return records
 
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
@@ -147,6 +316,8 @@ class LampKeyFrameKey:
 
 
 class SelfShadowFrameKey:
+    __slots__ = ('frame_number', 'mode', 'distance')
+
     def __init__(self):
         self.frame_number = 0
         self.mode = 0 # 0: none, 1: mode1, 2: mode2
@@ -162,6 +333,27 @@ class SelfShadowFrameKey:
         self.distance = 10000 - distance*100000
         print('    ', self)
 
+    @classmethod
+    def fromRecords(cls, records):
+        ret = []
+        for values in zip(*(records[x].tolist() for x in ('frame_number', 'mode', 'distance'))):
+            frameKey = cls()
+            frameKey.frame_number, frameKey.mode, distance = values
+            if frameKey.mode not in range(3):
+                raise struct.error('invalid self shadow mode %d at frame %d'%(frameKey.mode, frameKey.frame_number))
+            frameKey.distance = 10000 - distance*100000
+            ret.append(frameKey)
+        return ret
+
+    @staticmethod
+    def toRecords(frameKeys):
+        records = np.zeros(len(frameKeys), dtype=_SELF_SHADOW_KEY_DTYPE)
+        if len(records):
+            records['frame_number'] = _frameNumbers([x.frame_number for x in frameKeys])
+            records['mode'] = [x.mode for x in frameKeys]
+            records['distance'] = [(10000 - x.distance)/100000 for x in frameKeys]
+        return records
+
     def save(self, fin):
         fin.write(struct.pack('<L', self.frame_number))
         fin.write(struct.pack('<b', self.mode))
@@ -177,6 +369,8 @@ class SelfShadowFrameKey:
 
 
 class PropertyFrameKey:
+    __slots__ = ('frame_number', 'visible', 'ik_states')
+
     def __init__(self):
         self.frame_number = 0
         self.visible = True
@@ -207,6 +401,88 @@ class PropertyFrameKey:
             )
 
 
+def _readRecords(fin, dtype, count):
+    data = fin.read(count*dtype.itemsize)
+    if len(data) < count*dtype.itemsize:
+        raise struct.error('unexpected end of frame keys')
+    return np.frombuffer(data, dtype=dtype)
+
+
+def _fixRecords(records):
+    if 'rotation' in records.dtype.names:
+        records['rotation'][~records['rotation'].any(axis=1)] = (0, 0, 0, 1)
+    return records
+
+
+class _TrackTable:
+    """ The frame keys of a track in a structured array
+
+    It works as a read-only list of frame key objects, which are created when
+    the items are accessed, and table[column] returns a column of the records,
+    such as table['frame_number'] or table['location'].
+
+    A lazy table refers to the rows of the records of the whole section, and
+    copies them when the records are accessed at first.
+    """
+    __slots__ = ('frameClass', '__records', '__source', '__rows')
+
+    def __init__(self, frame_class, records=None, source=None, rows=None):
+        self.frameClass = frame_class
+        self.__records = records
+        self.__source = source
+        self.__rows = rows
+
+    @property
+    def records(self):
+        if self.__records is None:
+            self.__records = _fixRecords(self.__source[self.__rows])
+            self.__source = self.__rows = None
+        return self.__records
+
+    @records.setter
+    def records(self, value):
+        self.__records = value
+        self.__source = self.__rows = None
+
+    @property
+    def loaded(self):
+        return self.__records is not None
+
+    def readRecords(self):
+        """ Return the records, which are not kept by a lazy table """
+        if self.__records is None:
+            return _fixRecords(self.__source[self.__rows])
+        return self.__records
+
+    def __len__(self):
+        if self.__records is None:
+            return len(self.__rows)
+        return len(self.__records)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.records[index]
+        if isinstance(index, slice):
+            return self.frameClass.fromRecords(self.records[index])
+        return self.frameClass.fromRecords(self.records[[index]])[0]
+
+    def __iter__(self):
+        return iter(self.frameClass.fromRecords(self.records))
+
+    def sort(self, key=None, reverse=False):
+        """ Sort the records by key(frame_key), or by the frame numbers if key is None """
+        if key is None and not reverse:
+            order = np.argsort(self.records['frame_number'], kind='stable')
+        else:
+            frameKeys = list(self)
+            key = key or (lambda x: x.frame_number)
+            order = sorted(range(len(frameKeys)), key=lambda i: key(frameKeys[i]), reverse=reverse)
+        self.records = self.records[order]
+
+    def __repr__(self):
+        return '<_TrackTable %s, %d keys>'%(self.frameClass.__name__, len(self))
+
+
 class _AnimationBase(collections.defaultdict):
     def __init__(self):
         collections.defaultdict.__init__(self, list)
@@ -215,9 +491,16 @@ class _AnimationBase(collections.defaultdict):
     def frameClass():
         raise NotImplementedError
 
-    def load(self, fin):
+    @staticmethod
+    def frameDType():
+        raise NotImplementedError
+
+    def load(self, fin, use_arrays=False, lazy=False):
         count, = struct.unpack('<L', fin.read(4))
         print('loading %s... %d'%(self.__class__.__name__, count))
+        if use_arrays or lazy:
+            self.__loadTables(fin, count, lazy)
+            return
         for i in range(count):
             name = _toShiftJisString(struct.unpack('<15s', fin.read(15))[0])
             cls = self.frameClass()
@@ -225,14 +508,57 @@ class _AnimationBase(collections.defaultdict):
             frameKey.load(fin)
             self[name].append(frameKey)
 
+    def __loadTables(self, fin, count, lazy=False):
+        """ Load the frame keys into a _TrackTable of each name
+
+        Only the names are read to index the rows of each track by a stable
+        argsort, so the rows of a track are in the order of the file. The rows
+        of a lazy table are copied from the file buffer at first access.
+        """
+        records = _readRecords(fin, self.frameDType(), count)
+        order = np.argsort(records['name'], kind='stable')
+        unique_names, starts = np.unique(records['name'][order], return_index=True)
+        ends = np.append(starts[1:], count)
+        tracks = collections.defaultdict(list)
+        first_rows = order[starts].tolist()
+        for i in sorted(range(len(starts)), key=first_rows.__getitem__): # in the order of the file
+            # different names may be decoded to the same string
+            tracks[_toShiftJisString(unique_names[i])].append(order[starts[i]:ends[i]])
+        frame_class = self.frameClass()
+        for name, rows in tracks.items():
+            rows = rows[0] if len(rows) == 1 else np.sort(np.concatenate(rows))
+            table = _TrackTable(frame_class, source=records, rows=rows)
+            if not lazy:
+                table.records # copy the rows, which don't refer to the file buffer
+            self[name] = table
+
+    def setTrack(self, name, **columns):
+        """ Set the frame keys of name by the arrays of the record columns
+
+        e.g. setTrack(name, frame_number=frames, location=locations, ...),
+        and the missing columns are zeros.
+        """
+        count = len(next(iter(columns.values()))) if columns else 0
+        records = np.zeros(count, dtype=self.frameDType())
+        if count > 0:
+            for column, values in columns.items():
+                records[column] = _frameNumbers(values) if column == 'frame_number' else values
+        self[name] = _TrackTable(self.frameClass(), _fixRecords(records))
+        return self[name]
+
     def save(self, fin):
-        count = sum([len(i) for i in self.values()])
-        fin.write(struct.pack('<L', count))
+        """ Write the records of all tracks by one tobytes(), each name is encoded once """
+        sections = []
         for name, frameKeys in self.items():
-            name_data = struct.pack('<15s', _toShiftJisBytes(name))
-            for frameKey in frameKeys:
-                fin.write(name_data)
-                frameKey.save(fin)
+            if isinstance(frameKeys, _TrackTable):
+                records = frameKeys.records.copy()
+            else:
+                records = self.frameClass().toRecords(frameKeys)
+            records['name'] = _toShiftJisBytes(name)
+            sections.append(records)
+        records = np.concatenate(sections) if sections else np.zeros(0, dtype=self.frameDType())
+        fin.write(struct.pack('<L', len(records)))
+        fin.write(records.tobytes())
 
 
 class _AnimationListBase(list):
@@ -243,9 +569,17 @@ class _AnimationListBase(list):
     def frameClass():
         raise NotImplementedError
 
-    def load(self, fin):
+    @staticmethod
+    def frameDType():
+        raise NotImplementedError
+
+    def load(self, fin, use_arrays=False):
         count, = struct.unpack('<L', fin.read(4))
         print('loading %s... %d'%(self.__class__.__name__, count))
+        dtype = self.frameDType()
+        if use_arrays and dtype is not None:
+            self.extend(self.frameClass().fromRecords(_readRecords(fin, dtype, count)))
+            return
         for i in range(count):
             cls = self.frameClass()
             frameKey = cls()
@@ -254,6 +588,9 @@ class _AnimationListBase(list):
 
     def save(self, fin):
         fin.write(struct.pack('<L', len(self)))
+        if self.frameDType() is not None:
+            fin.write(self.frameClass().toRecords(self).tobytes())
+            return
         for frameKey in self:
             frameKey.save(fin)
 
@@ -266,6 +603,10 @@ class BoneAnimation(_AnimationBase):
     def frameClass():
         return BoneFrameKey
 
+    @staticmethod
+    def frameDType():
+        return _BONE_KEY_DTYPE
+
 
 class ShapeKeyAnimation(_AnimationBase):
     def __init__(self):
@@ -275,6 +616,10 @@ class ShapeKeyAnimation(_AnimationBase):
     def frameClass():
         return ShapeKeyFrameKey
 
+    @staticmethod
+    def frameDType():
+        return _SHAPE_KEY_DTYPE
+
 
 class CameraAnimation(_AnimationListBase):
     def __init__(self):
@@ -284,6 +629,10 @@ class CameraAnimation(_AnimationListBase):
     def frameClass():
         return CameraKeyFrameKey
 
+    @staticmethod
+    def frameDType():
+        return _CAMERA_KEY_DTYPE
+
 
 class LampAnimation(_AnimationListBase):
     def __init__(self):
@@ -293,6 +642,10 @@ class LampAnimation(_AnimationListBase):
     def frameClass():
         return LampKeyFrameKey
 
+    @staticmethod
+    def frameDType():
+        return _LAMP_KEY_DTYPE
+
 
 class SelfShadowAnimation(_AnimationListBase):
     def __init__(self):
@@ -302,6 +655,10 @@ class SelfShadowAnimation(_AnimationListBase):
     def frameClass():
         return SelfShadowFrameKey
 
+    @staticmethod
+    def frameDType():
+        return _SELF_SHADOW_KEY_DTYPE
+
 
 class PropertyAnimation(_AnimationListBase):
     def __init__(self):
@@ -311,6 +668,10 @@ class PropertyAnimation(_AnimationListBase):
     def frameClass():
         return PropertyFrameKey
 
+    @staticmethod
+    def frameDType():
+        return None
+
 
 class File:
     def __init__(self):
@@ -325,8 +686,11 @@ class File:
 
     def load(self, **args):
         path = args['filepath']
+        use_mmap = args.get('use_mmap', False)
+        use_arrays = args.get('use_arrays', False)
+        lazy = args.get('lazy', False)
 
-        with open(path, 'rb') as fin:
+        with (_MappedFile(path) if use_mmap else open(path, 'rb')) as fin:
             self.filepath = path
             self.header = Header()
             self.boneAnimation = BoneAnimation()
@@ -338,11 +702,11 @@ class File:
 
             self.header.load(fin)
             try:
-                self.boneAnimation.load(fin)
-                self.shapeKeyAnimation.load(fin)
-                self.cameraAnimation.load(fin)
-                self.lampAnimation.load(fin)
-                self.selfShadowAnimation.load(fin)
+                self.boneAnimation.load(fin, use_arrays, lazy)
+                self.shapeKeyAnimation.load(fin, use_arrays, lazy)
+                self.cameraAnimation.load(fin, use_arrays)
+                self.lampAnimation.load(fin, use_arrays)
+                self.selfShadowAnimation.load(fin, use_arrays)
                 self.propertyAnimation.load(fin)
             except struct.error:
                 pass # no valid camera/lamp data
@@ -367,3 +731,64 @@ class File:
             selfShadowAnimation.save(fin)
             propertyAnimation.save(fin)
 
+
+def _probeKeys(fin, dtype):
+    """ Return (count, frame range, name set) of a fixed size frame key section """
+    count, = struct.unpack('<L', fin.read(4))
+    keys = _readRecords(fin, dtype, count)
+    frame_range = None
+    if count > 0:
+        frame_range = (int(keys['frame_number'].min()), int(keys['frame_number'].max()))
+    names = set()
+    if 'name' in dtype.names:
+        names = {_toShiftJisString(x) for x in np.unique(keys['name'])}
+    del keys
+    return count, frame_range, names
+
+def probe(path, use_mmap=True):
+    """ Return the model name, the number of frame keys, the frame range and
+    the bone/morph names of a vmd file without creating the frame keys.
+    """
+    with (_MappedFile(path) if use_mmap else open(path, 'rb')) as fin:
+        header = Header()
+        header.load(fin)
+        info = {
+            'format': 'vmd',
+            'filepath': path,
+            'model_name': header.model_name,
+            'bone_keys': 0,
+            'shape_keys': 0,
+            'camera_keys': 0,
+            'lamp_keys': 0,
+            'self_shadow_keys': 0,
+            'property_keys': 0,
+            'frame_range': None,
+            'bone_names': set(),
+            'shape_key_names': set(),
+            }
+        frame_ranges = []
+        try:
+            info['bone_keys'], frame_range, info['bone_names'] = _probeKeys(fin, _BONE_KEY_DTYPE)
+            frame_ranges.append(frame_range)
+            info['shape_keys'], frame_range, info['shape_key_names'] = _probeKeys(fin, _SHAPE_KEY_DTYPE)
+            frame_ranges.append(frame_range)
+            info['camera_keys'], frame_range, _ = _probeKeys(fin, _CAMERA_KEY_DTYPE)
+            frame_ranges.append(frame_range)
+            info['lamp_keys'], frame_range, _ = _probeKeys(fin, _LAMP_KEY_DTYPE)
+            frame_ranges.append(frame_range)
+            info['self_shadow_keys'], frame_range, _ = _probeKeys(fin, _SELF_SHADOW_KEY_DTYPE)
+            frame_ranges.append(frame_range)
+
+            count, = struct.unpack('<L', fin.read(4))
+            for i in range(count):
+                frame_number, visible, ik_count = struct.unpack('<LbL', fin.read(9))
+                fin.seek(21*ik_count, os.SEEK_CUR)
+                frame_ranges.append((frame_number, frame_number))
+                info['property_keys'] += 1
+        except struct.error:
+            pass # no valid camera/lamp data
+
+        frame_ranges = [x for x in frame_ranges if x is not None]
+        if frame_ranges:
+            info['frame_range'] = (min(x[0] for x in frame_ranges), max(x[1] for x in frame_ranges))
+        return info
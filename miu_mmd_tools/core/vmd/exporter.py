@@ -7,47 +7,145 @@ import os
 import bpy
 import math
 import mathutils
+import numpy as np
 from mathutils import Vector, Quaternion
 
+from miu_mmd_tools.core import quaternions
 from miu_mmd_tools.core import vmd
-from miu_mmd_tools.core.bone import separate_local_qq
+from miu_mmd_tools.core.bone import separate_local_qqs
 from miu_mmd_tools.bpyutils import matmul
 from miu_mmd_tools.core.camera import MMDCamera
 from miu_mmd_tools.core.lamp import MMDLamp
 
-from miu_mmd_tools.core.vmd.importer import _FnBezier
-
+from miu_mmd_tools.core.vmd.importer import _FnBezier, _KEYFRAME_ENUM_NAMES
+
+
+def _fcurveBezierPoints(co, handle_right, handle_left):
+    """ Return the arrays (p0, p1, p2, p3) of the bezier curves from the keys co[i] to co[i+1],
+    corrected as _FnBezier.from_fcurve()
+    """
+    p0, p1, p2, p3 = co[:-1], handle_right[:-1], handle_left[1:], co[1:]
+    if not (bpy.app.version < (2, 91, 0)): # the F-Curve can become near-vertical
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = ((p3[:, 0] - p0[:, 0]) / (p1[:, 0] - p0[:, 0]))[:, None]
+            p1 = np.where(p1[:, :1] > p3[:, :1], (1-t)*p0 + p1*t, p1)
+            t = ((p3[:, 0] - p0[:, 0]) / (p3[:, 0] - p2[:, 0]))[:, None]
+            p2 = np.where(p0[:, :1] > p2[:, :1], (1-t)*p3 + p2*t, p2)
+    else: # legacy F-Curve correction
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = ((p3[:, 0] - p0[:, 0]) / (p1[:, 0] - p0[:, 0] + p3[:, 0] - p2[:, 0]))[:, None]
+            is_legacy = p1[:, :1] > p2[:, :1]
+            p1, p2 = np.where(is_legacy, (1-t)*p0 + p1*t, p1), np.where(is_legacy, (1-t)*p3 + p2*t, p2)
+    return p0, p1, p2, p3
+
+def _vmdControlPoints(p0, p1, p2, p3):
+    """ Return the (N, 4) VMD control points (x1, y1, x2, y2) of the (N, 2) bezier points arrays """
+    dx, dy = (p3 - p0).T
+    is_linear = (np.abs(dy) < 1e-6) | (np.abs(dx) < 1.5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        points = np.concatenate([p1 - p0, p2 - p0], axis=1) * 127.0 / np.stack([dx, dy, dx, dy], axis=1)
+    points = np.clip(np.trunc(0.5 + np.nan_to_num(points)), 0, 127).astype(np.uint8)
+    points[is_linear] = (20, 20, 107, 107)
+    return points
+
+def _vmdBoneInterpolations(control_points):
+    """ Return the (N, 64) interpolation blocks of the (N, 4, 4) control points (x1, y1, x2, y2) of
+    the x, y, z and rotation channels
+
+    The first row of 16 bytes is (x1 of x, y, z, r), (y1 of x, y, z, r), (x2 ...), (y2 ...), and each
+    next row is the previous one shifted by one byte, indices in [2, 3, 31, 46, 47, 61, 62, 63] are unclear.
+    The minimum acceptable data is the first byte of each 4 bytes in the first row.
+    """
+    control_points = np.asarray(control_points, dtype=np.uint8).reshape(-1, 4, 4)
+    row = control_points.transpose(0, 2, 1).reshape(-1, 16)
+    ret = np.zeros((len(row), 64), dtype=np.uint8)
+    for i in range(4):
+        ret[:, 16*i:16*(i+1)-i] = row[:, i:]
+    return ret
+
+
+def _poseBasisMatrices(matrices, rest_matrices, parents):
+    """ Return the (F, B, 4, 4) basis matrices of the bones from the (F, B, 4, 4) armature space pose matrices,
+    the (B, 4, 4) rest matrices (bone.matrix_local) and the parent indices (-1 for the root bones)
+    """
+    parents = np.asarray(parents, dtype=np.int64).reshape(-1)
+    has_parent = (parents >= 0)[:, None, None]
+    rest_matrices = np.asarray(rest_matrices, dtype=np.float64)
+    # the rest matrices relative to the parents
+    rest_matrices = np.where(has_parent, np.linalg.inv(rest_matrices[parents]) @ rest_matrices, rest_matrices)
+    parent_matrices = np.where(has_parent, matrices[:, parents], np.identity(4))
+    return np.linalg.inv(rest_matrices) @ np.linalg.inv(parent_matrices) @ matrices
+
+
+class _KeyFrame:
+    """ A snapshot of a keyframe point for _FnBezier.from_fcurve() """
+
+    def __init__(self, co, handle_left, handle_right, interpolation):
+        self.co = Vector(co)
+        self.handle_left = Vector(handle_left)
+        self.handle_right = Vector(handle_right)
+        self.interpolation = interpolation
+
+
+_INTERPOLATION_NAMES = _KEYFRAME_ENUM_NAMES['interpolation']
+_INTERPOLATION_VALUES = {v:k for k, v in _INTERPOLATION_NAMES.items()}
 
 class _FCurve:
 
     def __init__(self, default_value):
         self.__default_value = default_value
         self.__fcurve = None
+        self.__keys = None
+        self.__control_points = None
 
     def setFCurve(self, fcurve):
         assert(fcurve.is_valid and self.__fcurve is None)
         self.__fcurve = fcurve
 
-    @staticmethod
-    def __get_keys(keyframe_points):
-        kp0 = None
-        for kp1 in sorted(keyframe_points, key=lambda x: x.co[0]):
-            yield int(kp1.co[0]+0.5)
-            if kp0 and kp0.interpolation != 'LINEAR' and kp1.co.x - kp0.co.x > 2.5:
-                if kp0.interpolation == 'CONSTANT':
-                    yield int(kp1.co[0]-0.5)
-                elif kp0.interpolation == 'BEZIER':
-                    bz = _FnBezier.from_fcurve(kp0, kp1)
-                    for t in bz.find_critical():
-                        yield int(bz.evaluate(t).x+0.5)
-            kp0 = kp1
+    def __get_keys(self):
+        """ Return the arrays (frame_numbers, co, handle_left, handle_right, interpolation) of the keyframe points sorted by frame """
+        if self.__keys is None:
+            keyframe_points = self.__fcurve.keyframe_points
+            count = len(keyframe_points)
+            co, handle_left, handle_right = (np.empty(count*2, dtype=np.float64) for _ in range(3))
+            interpolation = np.empty(count, dtype=np.int32)
+            keyframe_points.foreach_get('co', co)
+            keyframe_points.foreach_get('handle_left', handle_left)
+            keyframe_points.foreach_get('handle_right', handle_right)
+            keyframe_points.foreach_get('interpolation', interpolation)
+            co, handle_left, handle_right = co.reshape(-1, 2), handle_left.reshape(-1, 2), handle_right.reshape(-1, 2)
+            order = np.argsort(co[:, 0], kind='stable')
+            co, handle_left, handle_right, interpolation = co[order], handle_left[order], handle_right[order], interpolation[order]
+            frame_numbers = np.trunc(co[:, 0] + 0.5).astype(np.int64)
+            self.__keys = (frame_numbers, co, handle_left, handle_right, interpolation)
+        return self.__keys
+
+    def __keyframe(self, index):
+        _, co, handle_left, handle_right, interpolation = self.__get_keys()
+        return _KeyFrame(co[index], handle_left[index], handle_right[index], _INTERPOLATION_NAMES[interpolation[index]])
+
+    def __controlPoints(self, index):
+        """ Return the VMD control points from the key index to the next key """
+        if self.__control_points is None:
+            _, co, handle_left, handle_right, interpolation = self.__get_keys()
+            points = _vmdControlPoints(*_fcurveBezierPoints(co, handle_right, handle_left))
+            points[interpolation[:-1] != _INTERPOLATION_VALUES['BEZIER']] = (20, 20, 107, 107)
+            self.__control_points = [((x1, y1), (x2, y2)) for x1, y1, x2, y2 in points.tolist()]
+        return self.__control_points[index]
 
     def frameNumbers(self):
+        """ Return the sorted array of the frame numbers to export """
         if self.__fcurve is None:
-            return set()
-        #return {int(kp.co[0]+0.5) for kp in self.__fcurve.keyframe_points}
-        return set(self.__get_keys(self.__fcurve.keyframe_points))
-        # return set(range(0, max(sorted(self.__fcurve.keyframe_points, key=lambda x: x.co[0]))))
+            return np.empty(0, dtype=np.int64)
+        frame_numbers, co, _, _, interpolation = self.__get_keys()
+        x = co[:, 0]
+        segments = (interpolation[:-1] != _INTERPOLATION_VALUES['LINEAR']) & (x[1:] - x[:-1] > 2.5)
+        constant_frames = np.trunc(x[1:][segments & (interpolation[:-1] == _INTERPOLATION_VALUES['CONSTANT'])] - 0.5)
+        bezier_frames = []
+        for i in np.flatnonzero(segments & (interpolation[:-1] == _INTERPOLATION_VALUES['BEZIER'])).tolist():
+            bz = _FnBezier.from_fcurve(self.__keyframe(i), self.__keyframe(i+1))
+            bezier_frames.extend(int(bz.evaluate(t).x+0.5) for t in bz.find_critical())
+        return np.unique(np.concatenate([frame_numbers, constant_frames.astype(np.int64), np.array(bezier_frames, dtype=np.int64)]))
 
     @staticmethod
     def getVMDControlPoints(kp0, kp1):
@@ -79,41 +177,40 @@ class _FCurve:
                 yield [self.__default_value, ((20, 20), (107, 107))]
             return
 
+        key_frames, co, _, _, interpolation = self.__get_keys()
+        values = co[:, 1].tolist()
+        # the first key of the same frame number is sampled, and the last one starts the next curve
+        firsts = np.flatnonzero(np.diff(key_frames, prepend=key_frames[0]-1))
+        lasts = np.append(firsts[1:] - 1, len(key_frames) - 1)
+        frame_numbers = list(frame_numbers)
+        ends = np.searchsorted(frame_numbers, key_frames[firsts])
+        assert((ends < len(frame_numbers)).all() and (np.take(frame_numbers, ends, mode='clip') == key_frames[firsts]).all())
+
         evaluate = fcurve.evaluate
-        frame_iter = iter(frame_numbers)
-        prev_kp = None
-        prev_i = None
-        for kp in sorted(fcurve.keyframe_points, key=lambda x: x.co[0]):
-            i = int(kp.co[0]+0.5)
-            if i == prev_i:
-                prev_kp = kp
-                continue
-            prev_i = i
-            frames = []
-            while True:
-                frame = next(frame_iter)
-                frames.append(frame)
-                if frame >= i:
-                    break
-            assert(len(frames) >= 1 and frames[-1] == i)
-            if prev_kp is None:
+        bezier = _INTERPOLATION_VALUES['BEZIER']
+        start, prev = 0, None
+        for first, last, end in zip(firsts.tolist(), lasts.tolist(), ends.tolist()):
+            frames = frame_numbers[start:end+1]
+            if prev is None:
                 for f in frames: # starting key frames
-                    yield [kp.co[1], ((20, 20), (107, 107))]
+                    yield [values[first], ((20, 20), (107, 107))]
             elif len(frames) == 1:
-                yield [kp.co[1], self.getVMDControlPoints(prev_kp, kp)]
-            elif prev_kp.interpolation == 'BEZIER':
-                bz = _FnBezier.from_fcurve(prev_kp, kp)
-                for f in frames[:-1]:
-                    b1, bz, pt = bz.split_by_x(f)
+                yield [values[first], self.__controlPoints(prev)] # prev + 1 == first
+            elif interpolation[prev] == bezier:
+                bz = _FnBezier.from_fcurve(self.__keyframe(prev), self.__keyframe(first))
+                prev_t = 0.0
+                for t in bz.axis_to_ts(frames[:-1]).tolist(): # the rest of the curve starts at prev_t
+                    b1, bz, pt = bz.split((t - prev_t)/(1 - prev_t))
+                    prev_t = t
                     yield [pt.y, self.__toVMDControlPoints(b1)]
                 yield [bz.points[-1].y, self.__toVMDControlPoints(bz)]
             else:
                 for f in frames:
                     yield [evaluate(f), ((20, 20), (107, 107))]
-            prev_kp = kp
+            start, prev = end + 1, last
 
-        for f in frame_iter: # ending key frames
-            yield [prev_kp.co[1], ((20, 20), (107, 107))]
+        for f in frame_numbers[start:]: # ending key frames
+            yield [values[prev], ((20, 20), (107, 107))]
 
 
 class VMDExporter:
@@ -126,29 +223,26 @@ class VMDExporter:
         self.__ik_fcurves = {}
 
     def __allFrameKeys(self, curves, is_full=False):
-        all_frames = set()
-        for i in curves:
-            all_frames |= i.frameNumbers()
+        all_frames = np.unique(np.concatenate([i.frameNumbers() for i in curves]))
 
         if len(all_frames) < 1:
             return
 
-        frame_start = min(all_frames)
+        frame_start = all_frames[0]
         if frame_start < self.__frame_start:
             frame_start = self.__frame_start
-            all_frames.add(frame_start)
+            all_frames = np.union1d(all_frames, [frame_start])
 
-        frame_end = max(all_frames)
+        frame_end = all_frames[-1]
         if frame_end > self.__frame_end:
             frame_end = self.__frame_end
-            all_frames.add(frame_end)
+            all_frames = np.union1d(all_frames, [frame_end])
         
         if is_full:
             # 全打ちの場合、全キーフレ
-            for n in range(frame_start, frame_end):
-                all_frames.add(n)
+            all_frames = np.union1d(all_frames, np.arange(frame_start, frame_end))
 
-        all_frames = sorted(all_frames)
+        all_frames = all_frames.tolist()
         all_keys = [i.sampleFrames(all_frames) for i in curves]
         #return zip(all_frames, *all_keys)
         for data in zip(all_frames, *all_keys):
@@ -167,29 +261,6 @@ class VMDExporter:
         #t2 = prev_q.rotation_difference(-curr_q).angle
         return -curr_q if t2 < t1 else curr_q
 
-    @staticmethod
-    def __getVMDBoneInterpolation(x_axis, y_axis, z_axis, rotation):
-        x_x1, x_y1 = x_axis[0]
-        x_x2, x_y2 = x_axis[1]
-        y_x1, y_y1 = y_axis[0]
-        y_x2, y_y2 = y_axis[1]
-        z_x1, z_y1 = z_axis[0]
-        z_x2, z_y2 = z_axis[1]
-        r_x1, r_y1 = rotation[0]
-        r_x2, r_y2 = rotation[1]
-        #return [ # minimum acceptable data
-        #    x_x1, 0, 0, 0, x_y1, 0, 0, 0, x_x2, 0, 0, 0, x_y2, 0, 0, 0,
-        #    y_x1, 0, 0, 0, y_y1, 0, 0, 0, y_x2, 0, 0, 0, y_y2, 0, 0, 0,
-        #    z_x1, 0, 0, 0, z_y1, 0, 0, 0, z_x2, 0, 0, 0, z_y2, 0, 0, 0,
-        #    r_x1, 0, 0, 0, r_y1, 0, 0, 0, r_x2, 0, 0, 0, r_y2, 0, 0, 0,
-        #    ]
-        return [ # full data, indices in [2, 3, 31, 46, 47, 61, 62, 63] are unclear
-            x_x1, y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,
-            y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,
-            z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,
-            r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,    0,
-            ]
-
     @staticmethod
     def __pickRotationInterpolation(rotation_interps):
         for ir in rotation_interps:
@@ -265,188 +336,72 @@ class VMDExporter:
 
         for bone, bone_curves in anim_bones.items():
             if bone.is_target_multi_bone:
-                # 多段出力対象
-
-                # MX ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}MX'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
-
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
-                for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([x[0], 0, 0])
-                    curr_rot = mathutils.Quaternion()
-                    key.rotation = curr_rot[1:] + curr_rot[0:1]
-                    ix, iy, iz = converter.convert_interpolation([x[1], ((20, 20), (107, 107)), ((20, 20), (107, 107))])
-                    key.interp = self.__getVMDBoneInterpolation(ix, ((20, 20), (107, 107)), ((20, 20), (107, 107)), ((20, 20), (107, 107)))
-                    frame_keys.append(key)
-
-                logging.info(f'[MX] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
-
-                # MY ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}MY'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
-
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
-                for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([0, y[0], 0])
-                    curr_rot = mathutils.Quaternion()
-                    key.rotation = curr_rot[1:] + curr_rot[0:1]
-                    ix, iy, iz = converter.convert_interpolation([((20, 20), (107, 107)), y[1], ((20, 20), (107, 107))])
-                    key.interp = self.__getVMDBoneInterpolation(((20, 20), (107, 107)), iy, ((20, 20), (107, 107)), ((20, 20), (107, 107)))
-                    frame_keys.append(key)
-
-                logging.info(f'[MY] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
-
-                # MZ ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}MZ'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
+                # 多段出力対象 (MX, MY, MZ, RX, RY, RZ)
+                frame_numbers, locations, rotations, interps = [], [], [], []
 
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
-                for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([0, 0, z[0]])
-                    curr_rot = mathutils.Quaternion()
-                    key.rotation = curr_rot[1:] + curr_rot[0:1]
-                    ix, iy, iz = converter.convert_interpolation([((20, 20), (107, 107)), ((20, 20), (107, 107)), z[1]])
-                    key.interp = self.__getVMDBoneInterpolation(((20, 20), (107, 107)), ((20, 20), (107, 107)), iz, ((20, 20), (107, 107)))
-                    frame_keys.append(key)
-
-                logging.info(f'[MZ] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
-
-                # RX ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}RX'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
-
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
                 converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
+                default_interp = ((20, 20), (107, 107))
                 for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([0, 0, 0])
-
-                    rot = mathutils.Quaternion([rw[0], rx[0], ry[0], rz[0]])
-                    if rot != mathutils.Quaternion():
-                        rot = converter.convert_rotation_from_qq(rot)
-                        x_qq, y_qq, z_qq = separate_local_qq(rot, bone)
-                        curr_rot = x_qq
-                        if prev_rot is not None:
-                            curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                        prev_rot = curr_rot
+                    frame_numbers.append(frame_number - self.__frame_start)
+                    locations.append((x[0], y[0], z[0]))
+                    rotations.append((rx[0], ry[0], rz[0], rw[0]))
+                    ix, _, _ = converter.convert_interpolation([x[1], default_interp, default_interp])
+                    _, iy, _ = converter.convert_interpolation([default_interp, y[1], default_interp])
+                    _, _, iz = converter.convert_interpolation([default_interp, default_interp, z[1]])
+                    interps.append((ix, iy, iz, rx[1], ry[1], rz[1]))
+
+                count = len(frame_numbers)
+                locations = np.array(locations, dtype=np.float64).reshape(-1, 3)
+                rotations = np.array(rotations, dtype=np.float64).reshape(-1, 4)
+                # 回転のないキーは分離せず、そのまま出力する
+                is_identity = (rotations == (0, 0, 0, 1)).all(axis=1)
+                local_rotations = separate_local_qqs(converter.convert_rotations(rotations), bone)
+                no_locations = converter.convert_locations(np.zeros((count, 3)))
+                no_rotations = np.tile((0.0, 0.0, 0.0, 1.0), (count, 1))
+                interps = np.array(interps, dtype=np.uint8).reshape(count, 6, 4)
+
+                for i, suffix in enumerate(('MX', 'MY', 'MZ', 'RX', 'RY', 'RZ')):
+                    key_name = bone.mmd_bone.name_j or bone.name
+                    key_name = f'{key_name}{suffix}'
+                    assert(key_name not in vmd_bone_anim) # VMD bone name collision
+
+                    if i < 3:
+                        axis_locations = np.zeros((count, 3))
+                        axis_locations[:, i] = locations[:, i]
+                        axis_locations = converter.convert_locations(axis_locations)
+                        axis_rotations = no_rotations
                     else:
-                        curr_rot = rot
-                        prev_rot = curr_rot
-                    
-                    key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
-                    key.interp = self.__getVMDBoneInterpolation(((20, 20), (107, 107)), ((20, 20), (107, 107)), ((20, 20), (107, 107)), rx[1])
-                    frame_keys.append(key)
+                        axis_locations = no_locations
+                        axis_rotations = np.where(is_identity[:, None], (1.0, 0.0, 0.0, 0.0), local_rotations[i - 3])
+                        axis_rotations = quaternions.compatibleQuaternions(axis_rotations, fixed=is_identity)
+                        axis_rotations = axis_rotations[:, (1, 2, 3, 0)] # (w, x, y, z) to (x, y, z, w)
 
-                logging.info(f'[RX] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
+                    axis_interps = np.tile(np.uint8((20, 20, 107, 107)), (count, 4, 1))
+                    axis_interps[:, min(i, 3)] = interps[:, i]
+                    axis_interps = _vmdBoneInterpolations(axis_interps)
+                    frame_keys = vmd_bone_anim.setTrack(key_name, frame_number=frame_numbers, location=axis_locations, rotation=axis_rotations, interp=axis_interps)
 
-                # RY ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}RY'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
-
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
-                for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([0, 0, 0])
-
-                    rot = mathutils.Quaternion([rw[0], rx[0], ry[0], rz[0]])
-                    if rot != mathutils.Quaternion():
-                        rot = converter.convert_rotation_from_qq(rot)
-                        x_qq, y_qq, z_qq = separate_local_qq(rot, bone)
-                        curr_rot = y_qq
-                        if prev_rot is not None:
-                            curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                        prev_rot = curr_rot
-                    else:
-                        curr_rot = rot
-                        prev_rot = curr_rot
-                    
-                    key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
-                    key.interp = self.__getVMDBoneInterpolation(((20, 20), (107, 107)), ((20, 20), (107, 107)), ((20, 20), (107, 107)), ry[1])
-                    frame_keys.append(key)
-
-                logging.info(f'[RY] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
-
-                # RZ ------------------------------------
-                key_name = bone.mmd_bone.name_j or bone.name
-                key_name = f'{key_name}RZ'
-                assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
-
-                get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
-                converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
-                for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves, is_full):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([0, 0, 0])
-
-                    rot = mathutils.Quaternion([rw[0], rx[0], ry[0], rz[0]])
-                    if rot != mathutils.Quaternion():
-                        rot = converter.convert_rotation_from_qq(rot)
-                        x_qq, y_qq, z_qq = separate_local_qq(rot, bone)
-                        curr_rot = z_qq
-                        if prev_rot is not None:
-                            curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                        prev_rot = curr_rot
-                    else:
-                        curr_rot = rot
-                        prev_rot = curr_rot
-                    
-                    key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
-                    key.interp = self.__getVMDBoneInterpolation(((20, 20), (107, 107)), ((20, 20), (107, 107)), ((20, 20), (107, 107)), rz[1])
-                    frame_keys.append(key)
-
-                logging.info(f'[RZ] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
+                    logging.info(f'[{suffix}] (bone) frames:%5d  name: %s', len(frame_keys), key_name)
             else:
                 key_name = bone.mmd_bone.name_j or bone.name
                 assert(key_name not in vmd_bone_anim) # VMD bone name collision
-                frame_keys = vmd_bone_anim[key_name]
+                frame_numbers, locations, rotations, interps = [], [], [], []
 
                 get_xyzw = self.__xyzw_from_rotation_mode(bone.rotation_mode)
                 converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
-                prev_rot = None
                 for frame_number, x, y, z, rw, rx, ry, rz in self.__allFrameKeys(bone_curves):
-                    key = vmd.BoneFrameKey()
-                    key.frame_number = frame_number - self.__frame_start
-                    key.location = converter.convert_location([x[0], y[0], z[0]])
-                    curr_rot = converter.convert_rotation(get_xyzw([rx[0], ry[0], rz[0], rw[0]]))
-                    if prev_rot is not None:
-                        curr_rot = self.__minRotationDiff(prev_rot, curr_rot)
-                    prev_rot = curr_rot
-                    key.rotation = curr_rot[1:] + curr_rot[0:1] # (w, x, y, z) to (x, y, z, w)
+                    frame_numbers.append(frame_number - self.__frame_start)
+                    locations.append((x[0], y[0], z[0]))
+                    rotations.append(get_xyzw([rx[0], ry[0], rz[0], rw[0]]))
                     #FIXME we can only choose one interpolation from (rw, rx, ry, rz) for bone's rotation
                     ir = self.__pickRotationInterpolation([rw[1], rx[1], ry[1], rz[1]])
                     ix, iy, iz = converter.convert_interpolation([x[1], y[1], z[1]])
-                    key.interp = self.__getVMDBoneInterpolation(ix, iy, iz, ir)
-                    frame_keys.append(key)
+                    interps.append((ix, iy, iz, ir))
+                locations = converter.convert_locations(locations)
+                rotations = quaternions.compatibleQuaternions(converter.convert_rotations(rotations))
+                rotations = rotations[:, (1, 2, 3, 0)] # (w, x, y, z) to (x, y, z, w)
+                interps = _vmdBoneInterpolations(interps)
+                frame_keys = vmd_bone_anim.setTrack(key_name, frame_number=frame_numbers, location=locations, rotation=rotations, interp=interps)
             logging.info('(bone) frames:%5d  name: %s', len(frame_keys), key_name)
         logging.info('---- bone animations:%5d  source: %s', len(vmd_bone_anim), armObj.name)
 
@@ -462,6 +417,55 @@ class VMDExporter:
         return vmd_bone_anim
 
 
+    def __exportBakedBoneAnimation(self, armObj):
+        """ Export the evaluated pose of each frame, which includes the constraints, drivers and IK """
+        if armObj is None:
+            return None
+
+        vmd_bone_anim = vmd.BoneAnimation()
+
+        scene = bpy.context.scene
+        frames = range(max(scene.frame_start, self.__frame_start), min(scene.frame_end, self.__frame_end) + 1)
+        pose_bones = armObj.pose.bones
+        bone_indices = {b.name:i for i, b in enumerate(pose_bones)}
+        parents = [bone_indices[b.parent.name] if b.parent else -1 for b in pose_bones]
+        rest_matrices = np.array([b.bone.matrix_local for b in pose_bones], dtype=np.float64).reshape(-1, 4, 4)
+
+        matrices = np.empty((len(frames), len(pose_bones)*16), dtype=np.float32)
+        frame_current = scene.frame_current
+        try:
+            for i, frame in enumerate(frames):
+                scene.frame_set(frame)
+                evaluated = armObj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+                evaluated.pose.bones.foreach_get('matrix', matrices[i])
+        finally:
+            scene.frame_set(frame_current)
+        # foreach_get() returns the matrices in column major order
+        matrices = matrices.reshape(len(frames), -1, 4, 4).transpose(0, 1, 3, 2).astype(np.float64)
+        matrices = _poseBasisMatrices(matrices, rest_matrices, parents)
+
+        frame_numbers = [frame - self.__frame_start for frame in frames]
+        interps = _vmdBoneInterpolations(np.tile(np.uint8((20, 20, 107, 107)), (len(frames), 4, 1)))
+        for bone in pose_bones:
+            if bone.is_mmd_shadow_bone:
+                continue
+            basis = matrices[:, bone_indices[bone.name]]
+            locations = basis[:, :3, 3]
+            rotations = quaternions.matrixQuaternions(basis[:, :3, :3])
+            if np.abs(locations).max(initial=0) < 1e-6 and np.abs(rotations[:, 0] - 1).max(initial=0) < 1e-6:
+                continue # the bone stays at the rest pose
+
+            key_name = bone.mmd_bone.name_j or bone.name
+            assert(key_name not in vmd_bone_anim) # VMD bone name collision
+            converter = self.__bone_converter_cls(bone, self.__scale, invert=True)
+            locations = converter.convert_locations(locations)
+            rotations = quaternions.compatibleQuaternions(converter.convert_rotations(rotations[:, (1, 2, 3, 0)]))
+            rotations = rotations[:, (1, 2, 3, 0)] # (w, x, y, z) to (x, y, z, w)
+            frame_keys = vmd_bone_anim.setTrack(key_name, frame_number=frame_numbers, location=locations, rotation=rotations, interp=interps)
+            logging.info('(bone) frames:%5d  name: %s', len(frame_keys), key_name)
+        logging.info('---- baked bone animations:%5d  source: %s', len(vmd_bone_anim), armObj.name)
+        return vmd_bone_anim
+
     def __exportMorphAnimation(self, meshObj):
         if meshObj is None:
             return None
@@ -498,16 +502,15 @@ class VMDExporter:
 
             key_name = kb.name
             assert(key_name not in vmd_morph_anim)
-            anim = vmd_morph_anim[key_name]
 
             curve = _FCurve(kb.value)
             curve.setFCurve(fcurve)
 
+            frame_numbers, weights = [], []
             for frame_number, weight in self.__allFrameKeys([curve]):
-                key = vmd.ShapeKeyFrameKey()
-                key.frame_number = frame_number - self.__frame_start
-                key.weight = weight[0]
-                anim.append(key)
+                frame_numbers.append(frame_number - self.__frame_start)
+                weights.append(weight[0])
+            anim = vmd_morph_anim.setTrack(key_name, frame_number=frame_numbers, weight=weights)
             logging.info('(mesh) frames:%5d  name: %s', len(anim), key_name)
         logging.info('---- morph animations:%5d  source: %s', len(vmd_morph_anim), meshObj.name)
         return vmd_morph_anim
@@ -657,6 +660,7 @@ class VMDExporter:
         filepath = args.get('filepath', '')
 
         self.__scale = args.get('scale', 1.0)
+        reducer = args.get('reducer', None) # vmd.reducer.KeyframeReducer
 
         if args.get('use_frame_range', False):
             self.__frame_start = bpy.context.scene.frame_start
@@ -669,9 +673,15 @@ class VMDExporter:
             vmdFile = vmd.File()
             vmdFile.header = vmd.Header()
             vmdFile.header.model_name = args.get('model_name', '')
-            vmdFile.boneAnimation = self.__exportBoneAnimation(armature, is_full)
+            if args.get('use_evaluated_pose', False):
+                vmdFile.boneAnimation = self.__exportBakedBoneAnimation(armature)
+            else:
+                vmdFile.boneAnimation = self.__exportBoneAnimation(armature, is_full)
             vmdFile.shapeKeyAnimation = self.__exportMorphAnimation(mesh)
             vmdFile.propertyAnimation = self.__exportPropertyAnimation(armature)
+            if reducer:
+                reducer.reduceAnimation(vmdFile.boneAnimation)
+                reducer.reduceAnimation(vmdFile.shapeKeyAnimation)
             vmdFile.save(filepath=filepath)
 
         elif camera or lamp:
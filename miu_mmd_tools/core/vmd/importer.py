@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
 import os
 
 import bpy
 import math
+import numpy as np
 from mathutils import Vector, Quaternion
 
 from miu_mmd_tools import utils
 from miu_mmd_tools.bpyutils import matmul
+from miu_mmd_tools.core import quaternions
 from miu_mmd_tools.core import vmd
 from miu_mmd_tools.core.camera import MMDCamera
 from miu_mmd_tools.core.lamp import MMDLamp
@@ -16,12 +19,17 @@ from miu_mmd_tools.core.lamp import MMDLamp
 
 class _MirrorMapper:
     def __init__(self, data_map=None):
-        from miu_mmd_tools.operators.view import FlipPose
         self.__data_map = data_map
-        self.__flip_name = FlipPose.flip_name
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096) # the bone and shape key names of a few models
+    def flip_name(name):
+        """ Return the flipped name, or '' if the name has no L/R part """
+        from miu_mmd_tools.operators.view import FlipPose
+        return FlipPose.flip_name(name)
 
     def get(self, name, default=None):
-        return self.__data_map.get(self.__flip_name(name), None) or self.__data_map.get(name, default)
+        return self.__data_map.get(self.flip_name(name), None) or self.__data_map.get(name, default)
 
     @staticmethod
     def get_location(location):
@@ -35,25 +43,59 @@ class _MirrorMapper:
     def get_rotation3(rotation_xyz):
         return (rotation_xyz[0], -rotation_xyz[1], -rotation_xyz[2])
 
+    @staticmethod
+    def get_locations(locations):
+        return locations*(-1, 1, 1)
+
+    @staticmethod
+    def get_rotations(rotations_xyzw):
+        return rotations_xyzw*(1, -1, -1, 1)
+
 
 class RenamedBoneMapper:
+    # the translated names of each (rename options, dictionary), which are shared by the mappers
+    # of all imports, a changed dictionary makes a new table
+    __name_tables = {}
+    __MAX_NAME_TABLES = 8
+
     def __init__(self, armObj=None, rename_LR_bones=True, use_underscore=False, translator=None):
         self.__pose_bones = armObj.pose.bones if armObj else None
         self.__rename_LR_bones = rename_LR_bones
         self.__use_underscore = use_underscore
         self.__translator = translator
+        self.__name_table = self.__nameTable((rename_LR_bones, use_underscore, tuple(translator.csv_tuples) if translator else None))
+
+    @classmethod
+    def __nameTable(cls, key):
+        name_tables = cls.__name_tables
+        ret = name_tables.pop(key, None)
+        if ret is None:
+            ret = {}
+            while len(name_tables) >= cls.__MAX_NAME_TABLES:
+                del name_tables[next(iter(name_tables))] # the least recently used
+        name_tables[key] = ret
+        return ret
 
     def init(self, armObj):
         self.__pose_bones = armObj.pose.bones
         return self
 
-    def get(self, bone_name, default=None):
+    def translate(self, bone_name):
+        bl_bone_name = self.__name_table.get(bone_name, None)
+        if bl_bone_name is None:
+            bl_bone_name = self.__name_table[bone_name] = self.__translate(bone_name)
+        return bl_bone_name
+
+    def __translate(self, bone_name):
         bl_bone_name = bone_name
         if self.__rename_LR_bones:
             bl_bone_name = utils.convertNameToLR(bl_bone_name, self.__use_underscore)
         if self.__translator:
             bl_bone_name = self.__translator.translate(bl_bone_name)
-        return self.__pose_bones.get(bl_bone_name, default)
+        return bl_bone_name
+
+    def get(self, bone_name, default=None):
+        return self.__pose_bones.get(self.translate(bone_name), default)
 
 
 class _InterpolationHelper:
@@ -71,6 +113,17 @@ class _InterpolationHelper:
     def convert(self, interpolation_xyz):
         return (interpolation_xyz[i] for i in self.__indices)
 
+def _convertQuaternionAxes(q, mat):
+    """ Return Quaternion(matmul(mat, q.axis) * -1, q.angle).normalized() of the quaternions (w, x, y, z) """
+    q = quaternions.canonicalQuaternions(q) # the angle of -pi to pi makes w positive
+    axes = np.dot(q[:, 1:], np.array(mat).T) * -1
+    norms = np.linalg.norm(axes, axis=1)[:, None]
+    ret = np.empty_like(q)
+    ret[:, 0] = q[:, 0]
+    ret[:, 1:] = np.where(norms > 1e-12, axes/np.maximum(norms, 1e-12), 0) * np.sqrt(np.maximum(0, 1 - q[:, :1]**2))
+    return ret/np.linalg.norm(ret, axis=1)[:, None]
+
+
 class BoneConverter:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.bone.matrix_local.to_3x3()
@@ -95,6 +148,14 @@ class BoneConverter:
     def convert_rotation_from_qq(self, qq):
         return Quaternion(matmul(self.__mat, qq.axis) * -1, qq.angle).normalized()
 
+    def convert_locations(self, locations):
+        """ Convert an array of (N, 3) locations """
+        return np.dot(np.asarray(locations, dtype=np.float64).reshape(-1, 3), np.array(self.__mat).T) * self.__scale
+
+    def convert_rotations(self, rotations_xyzw):
+        """ Convert an array of (N, 4) rotations to an array of (N, 4) quaternions (w, x, y, z) """
+        return _convertQuaternionAxes(quaternions.toQuaternions(rotations_xyzw), self.__mat)
+
 class BoneConverterPoseMode:
     def __init__(self, pose_bone, scale, invert=False):
         mat = pose_bone.matrix.to_3x3()
@@ -106,12 +167,17 @@ class BoneConverterPoseMode:
         self.__offset = pose_bone.location.copy()
         self.convert_location = self._convert_location
         self.convert_rotation = self._convert_rotation
+        self.convert_locations = self._convert_locations
+        self.convert_rotations = self._convert_rotations
         if invert:
             self.__mat.invert()
             self.__mat_rot.invert()
             self.__mat_loc.invert()
             self.convert_location = self._convert_location_inverted
             self.convert_rotation = self._convert_rotation_inverted
+            self.convert_locations = self._convert_locations_inverted
+            self.convert_rotations = self._convert_rotations_inverted
+        self.__qq_rot = np.array(self.__mat_rot.to_quaternion())
         self.convert_interpolation = _InterpolationHelper(self.__mat_loc).convert
 
     def _convert_location(self, location):
@@ -132,6 +198,25 @@ class BoneConverterPoseMode:
         rot = matmul(self.__mat_rot, rot.to_matrix()).to_quaternion()
         return Quaternion(matmul(self.__mat, rot.axis) * -1, rot.angle).normalized()
 
+    def _convert_locations(self, locations):
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        return np.array(self.__offset) + np.dot(locations, np.array(self.__mat_loc).T) * self.__scale
+
+    def _convert_rotations(self, rotations_xyzw):
+        rotations = _convertQuaternionAxes(quaternions.toQuaternions(rotations_xyzw), self.__mat)
+        return quaternions.canonicalQuaternions(quaternions.multiplyQuaternions(self.__qq_rot, rotations))
+
+    def _convert_locations_inverted(self, locations):
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3) - np.array(self.__offset)
+        return np.dot(locations, np.array(self.__mat_loc).T) * self.__scale
+
+    def _convert_rotations_inverted(self, rotations_xyzw):
+        rotations = quaternions.canonicalQuaternions(quaternions.multiplyQuaternions(self.__qq_rot, quaternions.toQuaternions(rotations_xyzw)))
+        return _convertQuaternionAxes(rotations, self.__mat)
+
+
+_BEZIER_BISECTIONS = 12
+_BEZIER_NEWTON_STEPS = 5
 
 class _FnBezier:
 
@@ -187,6 +272,8 @@ class _FnBezier:
         return self.evaluate(self.axis_to_t(x))
 
     def axis_to_t(self, val, axis=0):
+        if axis == 0: # monotonic in x
+            return float(self.axis_to_ts((val,))[0])
         p0, p1, p2, p3 = self._p0[axis], self._p1[axis], self._p2[axis], self._p3[axis]
         a = p3 - p0 + 3 * (p1 - p2)
         b = 3 * (p0 - 2*p1 + p2)
@@ -194,6 +281,47 @@ class _FnBezier:
         d = p0 - val
         return next(self.__find_roots(a, b, c, d))
 
+    def axis_to_ts(self, vals):
+        """ Return the array of t at the x values, which is axis_to_t() of the arrays """
+        p0, p1, p2, p3 = self._p0[0], self._p1[0], self._p2[0], self._p3[0]
+        vals = np.asarray(vals, dtype=np.float64)
+        dx = p3 - p0
+        if dx == 0:
+            return np.zeros(vals.shape)
+        t, _ = self.solve((p1 - p0)/dx, 0, (p2 - p0)/dx, 0, (vals - p0)/dx)
+        return t
+
+    @staticmethod
+    def solve(x1, y1, x2, y2, x):
+        """ Return the arrays of (t, y) of the beziers (0, 0), (x1, y1), (x2, y2), (1, 1) at x
+
+        The arguments are broadcast together, e.g. VMD's curves of 0-127 divided by 127.
+        The curves are monotonic in x for 0 <= x1, x2 <= 1. The bisection steps bracket t
+        within 2**-_BEZIER_BISECTIONS, then the Newton steps, which are kept in the bracket,
+        polish t to |x(t) - x| < 1e-9 (tested over the grid of VMD's control points).
+        """
+        x1, y1, x2, y2, x = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (x1, y1, x2, y2, x)))
+        x = np.clip(x, 0, 1)
+        lo, hi = np.zeros(x.shape), np.ones(x.shape)
+        for i in range(_BEZIER_BISECTIONS):
+            t = (lo + hi)/2
+            u = 1 - t
+            less = 3*u*u*t*x1 + 3*u*t*t*x2 + t*t*t < x
+            lo = np.where(less, t, lo)
+            hi = np.where(less, hi, t)
+        t = (lo + hi)/2
+        for i in range(_BEZIER_NEWTON_STEPS):
+            u = 1 - t
+            f = 3*u*u*t*x1 + 3*u*t*t*x2 + t*t*t - x
+            lo = np.where(f < 0, t, lo)
+            hi = np.where(f < 0, hi, t)
+            df = 3*u*u*x1 + 6*u*t*(x2 - x1) + 3*t*t*(1 - x2)
+            t_next = t - f/np.where(df > 1e-12, df, np.inf)
+            t = np.where((lo - 1e-9 < t_next) & (t_next < hi + 1e-9), np.clip(t_next, lo, hi), (lo + hi)/2)
+        t = np.where(x <= 0, 0.0, np.where(x >= 1, 1.0, t))
+        u = 1 - t
+        return t, 3*u*u*t*y1 + 3*u*t*t*y2 + t*t*t
+
     def find_critical(self):
         p0, p1, p2, p3 = self._p0.y, self._p1.y, self._p2.y, self._p3.y
         p_min, p_max = (p0, p3) if p0 < p3 else (p3, p0)
@@ -258,11 +386,42 @@ class _FnBezier:
                 yield t
 
 
+def _boneFrameRecords(frameKeys):
+    if isinstance(frameKeys, vmd._TrackTable):
+        return frameKeys.records
+    return vmd.BoneFrameKey.toRecords(frameKeys)
+
+
+def _keyframeEnums():
+    properties = bpy.types.Keyframe.bl_rna.properties
+    ret = {x.identifier:x.value for x in properties['interpolation'].enum_items}
+    ret.update((x.identifier, x.value) for x in properties['handle_left_type'].enum_items)
+    return ret
+
+def _keyframeEnumNames():
+    properties = bpy.types.Keyframe.bl_rna.properties
+    return {k:{x.value:x.identifier for x in properties[k].enum_items} for k in ('interpolation', 'handle_left_type')}
+
+_KEYFRAME_ENUMS = _keyframeEnums()
+_KEYFRAME_ENUM_NAMES = _keyframeEnumNames()
+# foreach_set() is used if the added keys are more than 1/_FOREACH_KEY_RATIO of the existing keys
+_FOREACH_KEY_RATIO = 8
+
+
+def _sortByFrameNumber(frameKeys):
+    if isinstance(frameKeys, list):
+        frameKeys.sort(key=lambda x:x.frame_number)
+    else: # vmd._TrackTable, sorted without creating the frame keys
+        frameKeys.sort()
+
+
 class VMDImporter:
     def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False,
-            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False):
+            convert_mmd_camera=True, convert_mmd_lamp=True, frame_margin=5, use_mirror=False, reducer=None,
+            append_frame=None):
         self.__vmdFile = vmd.File()
-        self.__vmdFile.load(filepath=filepath)
+        # the bone and morph tracks are decoded only if they are assigned
+        self.__vmdFile.load(filepath=filepath, use_mmap=True, lazy=True)
         logging.debug(str(self.__vmdFile.header))
         self.__scale = scale
         self.__convert_mmd_camera = convert_mmd_camera
@@ -271,7 +430,30 @@ class VMDImporter:
         self.__bone_util_cls = BoneConverterPoseMode if use_pose_mode else BoneConverter
         self.__frame_margin = frame_margin + 1
         self.__mirror = use_mirror
+        self.__reducer = reducer # vmd.reducer.KeyframeReducer
+        # append the bone, morph and display motions to the existing actions after append_frame
+        self.__append = append_frame is not None
+        self.__frame_offset = self.__frame_margin + (append_frame or 0)
+
 
+    @staticmethod
+    def findEndFrame(objects):
+        """ Return the last frame of the actions of the objects, which the motions are appended after """
+        end_frame = 0
+        for obj in objects:
+            for owner in (obj, getattr(obj.data, 'shape_keys', None)):
+                action = getattr(getattr(owner, 'animation_data', None), 'action', None)
+                if action:
+                    end_frame = max(end_frame, int(math.ceil(action.frame_range[1])))
+        return end_frame
+
+    def __getAction(self, owner, action_name):
+        animation_data = owner.animation_data_create()
+        if self.__append and animation_data.action:
+            return animation_data.action
+        action = bpy.data.actions.new(name=action_name)
+        animation_data.action = action
+        return action
 
     @staticmethod
     def __minRotationDiff(prev_q, curr_q):
@@ -293,6 +475,84 @@ class VMDImporter:
         kp0.handle_right = kp0.co + Vector((d.x * bezier[0], d.y * bezier[1]))
         kp1.handle_left = kp0.co + Vector((d.x * bezier[2], d.y * bezier[3]))
 
+    @staticmethod
+    def __fillFCurve(fcurve, frames, values, beziers, first_key=None):
+        """ Add the keys of (frames, values) to fcurve by foreach_set()
+
+        The interpolation of key k-1 to key k is beziers[k] of (x1, y1, x2, y2),
+        as __setInterpolation(). first_key is a (frame, value) of a LINEAR key
+        which is added before the keys. The keys are appended after the existing
+        keys of fcurve, which is linear to the first added key.
+        """
+        keyframe_points = fcurve.keyframe_points
+        start = len(keyframe_points)
+        # the keys are added in order after the existing keys, so the fcurve is not sorted by update(),
+        # which would recalculate the auto handles of the existing keys unlike the imported keys
+        keyframe_points.add((0 if first_key is None else 1) + len(frames))
+        count = len(keyframe_points)
+        first = count - len(frames)
+        # foreach_set() writes all keys, so a few keys appended to many keys are set one by one
+        use_foreach = (count - start)*_FOREACH_KEY_RATIO > start
+
+        co = np.empty((count, 2), dtype=np.float32) # float32 arrays are set without conversion
+        handle_left, handle_right = np.empty_like(co), np.empty_like(co)
+        interpolation, handle_left_type, handle_right_type = (np.empty(count, dtype=np.int32) for i in range(3))
+        if start > 0 and use_foreach:
+            # the existing keys, and the default handles and types of the added keys
+            keyframe_points.foreach_get('co', co.ravel())
+            keyframe_points.foreach_get('handle_left', handle_left.ravel())
+            keyframe_points.foreach_get('handle_right', handle_right.ravel())
+            keyframe_points.foreach_get('interpolation', interpolation)
+            keyframe_points.foreach_get('handle_left_type', handle_left_type)
+            keyframe_points.foreach_get('handle_right_type', handle_right_type)
+            interpolation[start-1] = _KEYFRAME_ENUMS['LINEAR']
+        else:
+            # keep the default handles and types of add(), which are changed as the assignments of kp.co and __setInterpolation()
+            kp = keyframe_points[start]
+            handle_left[:], handle_right[:] = kp.handle_left, kp.handle_right
+            interpolation[:] = _KEYFRAME_ENUMS[kp.interpolation]
+            handle_left_type[:] = _KEYFRAME_ENUMS[kp.handle_left_type]
+            handle_right_type[:] = _KEYFRAME_ENUMS[kp.handle_right_type]
+        co[first:, 0], co[first:, 1] = frames, values
+        if first_key is not None:
+            co[start] = first_key
+            interpolation[start] = _KEYFRAME_ENUMS['LINEAR']
+
+        if len(frames) > 1:
+            beziers = np.asarray(beziers[1:], dtype=np.float64)
+            co0, d = co[first:-1], (co[first+1:] - co[first:-1]).astype(np.float64)/127.0
+            handle_right[first:-1] = co0 + d*beziers[:, (0, 1)]
+            handle_left[first+1:] = co0 + d*beziers[:, (2, 3)]
+            is_linear = (beziers[:, 0] == beziers[:, 1]) & (beziers[:, 2] == beziers[:, 3])
+            interpolation[first:-1] = np.where(is_linear, _KEYFRAME_ENUMS['LINEAR'], _KEYFRAME_ENUMS['BEZIER'])
+            handle_right_type[first:-1] = handle_left_type[first+1:] = _KEYFRAME_ENUMS['FREE']
+        # __fixFcurveHandles()
+        if start == 0:
+            handle_left[0], handle_left_type[0] = co[0] + (-1, 0), _KEYFRAME_ENUMS['FREE']
+        handle_right[-1], handle_right_type[-1] = co[-1] + (1, 0), _KEYFRAME_ENUMS['FREE']
+
+        if use_foreach:
+            keyframe_points.foreach_set('co', co.ravel())
+            keyframe_points.foreach_set('handle_left', handle_left.ravel())
+            keyframe_points.foreach_set('handle_right', handle_right.ravel())
+            keyframe_points.foreach_set('interpolation', interpolation)
+            keyframe_points.foreach_set('handle_left_type', handle_left_type)
+            keyframe_points.foreach_set('handle_right_type', handle_right_type)
+        else:
+            keyframe_points[start-1].interpolation = 'LINEAR'
+            interpolations, handle_types = _KEYFRAME_ENUM_NAMES['interpolation'], _KEYFRAME_ENUM_NAMES['handle_left_type']
+            for kp, c, l, r, i, lt, rt in zip(keyframe_points[start:], co[start:].tolist(), handle_left[start:].tolist(),
+                    handle_right[start:].tolist(), interpolation[start:], handle_left_type[start:], handle_right_type[start:]):
+                # the types before the handles, which are recalculated as the types are changed
+                kp.interpolation, kp.handle_left_type, kp.handle_right_type = interpolations[i], handle_types[lt], handle_types[rt]
+                kp.co, kp.handle_left, kp.handle_right = c, l, r
+
+    def __getFCurve(self, action, data_path, index=0, action_group=''):
+        fcurve = action.fcurves.find(data_path, index=index) if self.__append else None
+        if fcurve is None:
+            fcurve = action.fcurves.new(data_path=data_path, index=index, action_group=action_group)
+        return fcurve
+
     @staticmethod
     def __fixFcurveHandles(fcurve):
         kp0 = fcurve.keyframe_points[0]
@@ -308,10 +568,15 @@ class VMDImporter:
         compatible_quaternion = self.__minRotationDiff
         class _ConverterWrap:
             convert_location = converter.convert_location
+            convert_locations = converter.convert_locations
             convert_interpolation = converter.convert_interpolation
             if mode == 'QUATERNION':
                 convert_rotation = converter.convert_rotation
                 compatible_rotation = compatible_quaternion
+                @staticmethod
+                def convert_rotations(rotations, prev_rot=None):
+                    """ Convert an array of (N, 4) rotations, which are compatible with prev_rot and the previous ones """
+                    return quaternions.compatibleQuaternions(converter.convert_rotations(rotations), prev_rot)
             elif mode == 'AXIS_ANGLE':
                 @staticmethod
                 def convert_rotation(rot):
@@ -331,6 +596,17 @@ class VMDImporter:
             else:
                 convert_rotation = lambda rot: converter.convert_rotation(rot).to_euler(mode)
                 compatible_rotation = lambda prev, curr: curr.make_compatible(prev) or curr
+            if mode != 'QUATERNION':
+                @classmethod
+                def convert_rotations(cls, rotations, prev_rot=None):
+                    ret = []
+                    for rot in rotations:
+                        curr_rot = cls.convert_rotation(rot)
+                        if prev_rot is not None:
+                            curr_rot = cls.compatible_rotation(prev_rot, curr_rot)
+                        prev_rot = curr_rot
+                        ret.append(tuple(curr_rot))
+                    return np.array(ret, dtype=np.float64).reshape(-1, 3 if mode != 'AXIS_ANGLE' else 4)
         return _ConverterWrap
 
     def __assignToArmature(self, armObj, action_name=None):
@@ -339,9 +615,7 @@ class VMDImporter:
         if len(boneAnim) < 1:
             return
 
-        action_name = action_name or armObj.name
-        action = bpy.data.actions.new(name=action_name)
-        armObj.animation_data_create().action = action
+        action = self.__getAction(armObj, action_name or armObj.name)
 
         extra_frame = 1 if self.__frame_margin > 1 else 0
 
@@ -354,8 +628,6 @@ class VMDImporter:
             pose_bones = _MirrorMapper(pose_bones)
             _loc, _rot = _MirrorMapper.get_location, _MirrorMapper.get_rotation
 
-        class _Dummy: pass
-        dummy_keyframe_points = iter(lambda: _Dummy, None)
         prop_rot_map = {'QUATERNION':'rotation_quaternion', 'AXIS_ANGLE':'rotation_axis_angle'}
 
         bone_name_table = {}
@@ -367,63 +639,48 @@ class VMDImporter:
             if bone is None:
                 logging.warning('WARNING: not found bone %s (%d frames)', name, len(keyFrames))
                 continue
+            if self.__reducer and num_frame > 2:
+                keyFrames = self.__reducer.reduceBoneKeys(keyFrames)
+                num_frame = len(keyFrames)
             logging.info('(bone) frames:%5d  name: %s', len(keyFrames), name)
             assert(bone_name_table.get(bone.name, name) == name)
             bone_name_table[bone.name] = name
 
-            fcurves = [dummy_keyframe_points]*7 # x, y, z, r0, r1, r2, (r3)
             data_path_rot = prop_rot_map.get(bone.rotation_mode, 'rotation_euler')
             bone_rotation = getattr(bone, data_path_rot)
             default_values = list(bone.location) + list(bone_rotation)
+            fcurves = []
             data_path = 'pose.bones["%s"].location'%bone.name
             for axis_i in range(3):
-                fcurves[axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
+                fcurves.append(self.__getFCurve(action, data_path, axis_i, bone.name))
             data_path = 'pose.bones["%s"].%s'%(bone.name, data_path_rot)
             for axis_i in range(len(bone_rotation)):
-                fcurves[3+axis_i] = action.fcurves.new(data_path=data_path, index=axis_i, action_group=bone.name)
-
-            for i in range(len(default_values)):
-                c = fcurves[i]
-                c.keyframe_points.add(extra_frame+num_frame)
-                kp_iter = iter(c.keyframe_points)
-                if extra_frame:
-                    kp = next(kp_iter)
-                    kp.co = (1, default_values[i])
-                    kp.interpolation = 'LINEAR'
-                fcurves[i] = kp_iter
+                fcurves.append(self.__getFCurve(action, data_path, axis_i, bone.name))
+            # continue from the last keys of the appended fcurves
+            is_appended = [len(c.keyframe_points) > 0 for c in fcurves]
+            prev_rot = bone_rotation if extra_frame else None
+            if all(is_appended[3:]):
+                prev_rot = tuple(c.keyframe_points[-1].co[1] for c in fcurves[3:])
 
+            _sortByFrameNumber(keyFrames)
+            records = _boneFrameRecords(keyFrames)
             converter = self.__getBoneConverter(bone)
-            prev_rot = bone_rotation if extra_frame else None
-            prev_kps, indices = None, tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*len(bone_rotation)
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, x, y, z, r0, r1, r2, r3 in zip(keyFrames, *fcurves):
-                frame = k.frame_number + self.__frame_margin
-                loc = converter.convert_location(_loc(k.location))
-                curr_rot = converter.convert_rotation(_rot(k.rotation))
-                if prev_rot is not None:
-                    curr_rot = converter.compatible_rotation(prev_rot, curr_rot)
-                    #FIXME the rotation interpolation has slightly different result
-                    #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
-                    #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
-                prev_rot = curr_rot
-
-                x.co = (frame, loc[0])
-                y.co = (frame, loc[1])
-                z.co = (frame, loc[2])
-                r0.co = (frame, curr_rot[0])
-                r1.co = (frame, curr_rot[1])
-                r2.co = (frame, curr_rot[2])
-                r3.co = (frame, curr_rot[-1])
-
-                curr_kps = (x, y, z, r0, r1, r2, r3)
-                if prev_kps is not None:
-                    interp = k.interp
-                    for idx, prev_kp, kp in zip(indices, prev_kps, curr_kps):
-                        self.__setInterpolation(interp[idx:idx+16:4], prev_kp, kp)
-                prev_kps = curr_kps
-
-        for c in action.fcurves:
-            self.__fixFcurveHandles(c)
+            locations, rotations = records['location'], records['rotation']
+            if self.__mirror:
+                locations, rotations = _MirrorMapper.get_locations(locations), _MirrorMapper.get_rotations(rotations)
+            #FIXME the rotation interpolation has slightly different result
+            #   Blender: rot(x) = prev_rot*(1 - bezier(t)) + curr_rot*bezier(t)
+            #       MMD: rot(x) = prev_rot.slerp(curr_rot, factor=bezier(t))
+            values = np.concatenate([
+                converter.convert_locations(locations),
+                converter.convert_rotations(rotations, prev_rot),
+                ], axis=1)
+            frames = records['frame_number'] + self.__frame_offset
+            indices = tuple(converter.convert_interpolation((0, 16, 32)))+(48,)*len(bone_rotation)
+            interp = records['interp']
+            for i, (c, idx) in enumerate(zip(fcurves, indices)):
+                first_key = (1, default_values[i]) if extra_frame and not is_appended[i] else None
+                self.__fillFCurve(c, frames, values[:, i], interp[:, idx:idx+16:4], first_key)
 
         # ensure IK's default state
         for b in armObj.pose.bones:
@@ -437,7 +694,7 @@ class VMDImporter:
         logging.info('---- IK animations:%5d  target: %s', len(propertyAnim), armObj.name)
         for keyFrame in propertyAnim:
             logging.debug('(IK) frame:%5d  list: %s', keyFrame.frame_number, keyFrame.ik_states)
-            frame = keyFrame.frame_number + self.__frame_margin
+            frame = keyFrame.frame_number + self.__frame_offset
             for ikName, enable in keyFrame.ik_states:
                 bone = pose_bones.get(ikName, None)
                 if bone:
@@ -451,9 +708,7 @@ class VMDImporter:
         if len(shapeKeyAnim) < 1:
             return
 
-        action_name = action_name or meshObj.name
-        action = bpy.data.actions.new(name=action_name)
-        meshObj.data.shape_keys.animation_data_create().action = action
+        action = self.__getAction(meshObj.data.shape_keys, action_name or meshObj.name)
 
         mirror_map = _MirrorMapper(meshObj.data.shape_keys.key_blocks) if self.__mirror else {}
         shapeKeyDict = {k:mirror_map.get(k, v) for k, v in meshObj.data.shape_keys.key_blocks.items()}
@@ -463,14 +718,20 @@ class VMDImporter:
             if name not in shapeKeyDict:
                 logging.warning('WARNING: not found shape key %s (%d frames)', name, len(keyFrames))
                 continue
+            if self.__reducer and len(keyFrames) > 2:
+                keyFrames = self.__reducer.reduceShapeKeys(keyFrames)
             logging.info('(mesh) frames:%5d  name: %s', len(keyFrames), name)
             shapeKey = shapeKeyDict[name]
-            fcurve = action.fcurves.new(data_path='key_blocks["%s"].value'%shapeKey.name)
+            fcurve = self.__getFCurve(action, 'key_blocks["%s"].value'%shapeKey.name)
+            start = len(fcurve.keyframe_points)
             fcurve.keyframe_points.add(len(keyFrames))
-            keyFrames.sort(key=lambda x:x.frame_number)
-            for k, v in zip(keyFrames, fcurve.keyframe_points):
-                v.co = (k.frame_number+self.__frame_margin, k.weight)
+            _sortByFrameNumber(keyFrames)
+            for k, v in zip(keyFrames, fcurve.keyframe_points[start:]):
+                v.co = (k.frame_number+self.__frame_offset, k.weight)
                 v.interpolation = 'LINEAR'
+            if start > 0:
+                fcurve.keyframe_points[start-1].interpolation = 'LINEAR'
+                fcurve.update()
             weights = tuple(i.weight for i in keyFrames)
             shapeKey.slider_min = min(shapeKey.slider_min, floor(min(weights)))
             shapeKey.slider_max = max(shapeKey.slider_max, ceil(max(weights)))
@@ -482,15 +743,13 @@ class VMDImporter:
         if len(propertyAnim) < 1:
             return
 
-        action_name = action_name or rootObj.name
-        action = bpy.data.actions.new(name=action_name)
-        rootObj.animation_data_create().action = action
+        self.__getAction(rootObj, action_name or rootObj.name)
 
         logging.debug('(Display) list(frame, show): %s', [(keyFrame.frame_number, bool(keyFrame.visible)) for keyFrame in propertyAnim])
         for keyFrame in propertyAnim:
             rootObj.mmd_root.show_meshes = keyFrame.visible
             rootObj.keyframe_insert(data_path='mmd_root.show_meshes',
-                                    frame=keyFrame.frame_number+self.__frame_margin)
+                                    frame=keyFrame.frame_number+self.__frame_offset)
 
 
     @staticmethod
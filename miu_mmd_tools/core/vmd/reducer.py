@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+""" Keyframe reduction of dense vmd bone and morph tracks
+
+A run of keys is replaced by its last key, whose interpolation curves are
+fitted to the removed keys, if the motion of the curves is within the error
+tolerances at every frame between the kept keys. The motion of the source
+keys is evaluated by their own interpolation curves. Each location channel and the
+rotation (the slerp factor) get their own MMD bezier curve, which is found by
+least squares over a grid of the x handles of the curve, then the max error
+of the quantized curve is refined by a pattern search.
+
+Morph keys have no interpolation curves, so they are reduced to the keys of
+linear segments.
+"""
+
+import math
+
+import numpy as np
+
+from miu_mmd_tools.core import vmd
+from miu_mmd_tools.core.vmd import toolkit
+
+_LINEAR_CURVE = (20, 20, 107, 107)
+# the x handles of the candidate curves
+_HANDLE_X = np.array([0, 16, 32, 48, 64, 80, 96, 112, 127])/127.0
+_MAX_FIT_POINTS = 32
+# the curves whose errors are more than this times the tolerance are not refined
+_MAX_REFINED_ERROR = 10
+# the offsets of the neighbor curves in the refinement
+_NEIGHBORS = np.array(np.meshgrid(*[(-1, 0, 1)]*4, indexing='ij')).reshape(4, -1).T
+
+
+def _solve_t(x1, x2, x):
+    """ Return t of the bezier curves at x, x1 and x2 are arrays of (C, 1) and x is an array of (K,)
+
+    A few bisection steps bracket t, then Newton steps which are kept in the bracket refine it.
+    """
+    lo = np.zeros(np.broadcast(x1, x).shape)
+    hi = np.ones_like(lo)
+    for i in range(5):
+        t = (lo + hi)/2
+        u = 1 - t
+        less = 3*u*u*t*x1 + 3*u*t*t*x2 + t*t*t < x
+        lo = np.where(less, t, lo)
+        hi = np.where(less, hi, t)
+    t = (lo + hi)/2
+    for i in range(3):
+        u = 1 - t
+        f = 3*u*u*t*x1 + 3*u*t*t*x2 + t*t*t - x
+        df = 3*u*u*x1 + 6*u*t*(x2 - x1) + 3*t*t*(1 - x2)
+        t = np.clip(t - f/np.maximum(df, 1e-9), lo, hi)
+    return t
+
+def _evaluate(curves, x):
+    """ Return y of the bezier curves (C, 4) of 0-127 at x (K,) as an array of (C, K) """
+    x1, y1, x2, y2 = (curves[:, i:i+1]/127.0 for i in range(4))
+    t = _solve_t(x1, x2, x)
+    u = 1 - t
+    return 3*u*u*t*y1 + 3*u*t*t*y2 + t*t*t
+
+def _evaluate_each(curves, x):
+    """ Return y of each bezier curve (K, 4) of 0-127 at each x (K,) """
+    x1, y1, x2, y2 = (curves[:, i]/127.0 for i in range(4))
+    t = _solve_t(x1, x2, x)
+    u = 1 - t
+    return 3*u*u*t*y1 + 3*u*t*t*y2 + t*t*t
+
+class _CurveFitter:
+    """ Fit MMD bezier curves to the points of the same x (0 < x < 1)
+
+    The candidate curves of the x handle grid are solved once for all values
+    of y. At most _MAX_FIT_POINTS points are fitted, and the errors of the
+    fitted curves are measured at all points.
+    """
+    __GRID_X1, __GRID_X2 = (v.reshape(-1, 1) for v in np.meshgrid(_HANDLE_X, _HANDLE_X, indexing='ij'))
+
+    def __init__(self, x):
+        self.__x = np.asarray(x, dtype=np.float64)
+        self.__fit_x = None
+
+    def __prepare(self):
+        x = self.__x
+        self.__rows = None
+        if len(x) > _MAX_FIT_POINTS:
+            self.__rows = np.linspace(0, len(x) - 1, _MAX_FIT_POINTS).astype(int)
+            x = x[self.__rows]
+        self.__fit_x = x
+        t = _solve_t(self.__GRID_X1, self.__GRID_X2, x)
+        u = 1 - t
+        self.__b1, self.__b2, self.__t3 = 3*u*u*t, 3*u*t*t, t*t*t
+        b1, b2 = self.__b1, self.__b2
+        self.__a11, self.__a12, self.__a22 = (b1*b1).sum(1) + 1e-9, (b1*b2).sum(1), (b2*b2).sum(1) + 1e-9
+
+    def fit(self, y, tolerance=0.0):
+        """ Return ((x1, y1, x2, y2) of 0-127, max error of y)
+
+        The refinement stops when the max error is not more than tolerance.
+        """
+        x, y = self.__x, np.asarray(y, dtype=np.float64)
+        error = float(np.abs(y - x).max())
+        if error < 1e-6:
+            return _LINEAR_CURVE, error
+        # the curves are in the range of 0 - 1
+        error = max(-y.min(), y.max() - 1)
+        if error > tolerance > 0:
+            return _LINEAR_CURVE, error
+
+        if self.__fit_x is None:
+            self.__prepare()
+        fit_x, fit_y = self.__fit_x, (y if self.__rows is None else y[self.__rows])
+        b1, b2, a11, a12, a22 = self.__b1, self.__b2, self.__a11, self.__a12, self.__a22
+        r = fit_y - self.__t3
+        # y1, y2 of each candidate by the normal equations
+        c1, c2 = (b1*r).sum(1), (b2*r).sum(1)
+        det = a11*a22 - a12*a12
+        hy1 = np.rint(np.clip((c1*a22 - c2*a12)/det, 0, 1)*127)
+        hy2 = np.rint(np.clip((c2*a11 - c1*a12)/det, 0, 1)*127)
+        errors = np.abs(b1*(hy1/127)[:, None] + b2*(hy2/127)[:, None] + self.__t3 - fit_y).max(1)
+        best = int(np.argmin(errors))
+        curve = np.array([self.__GRID_X1[best, 0]*127, hy1[best], self.__GRID_X2[best, 0]*127, hy2[best]]).round()
+        error = errors[best]
+        if error <= _MAX_REFINED_ERROR*tolerance or tolerance <= 0:
+            # refine the max error by a pattern search around the best candidate
+            for step in (8, 4, 2, 1):
+                while error > tolerance:
+                    curves = np.clip(curve + step*_NEIGHBORS, 0, 127)
+                    errors = np.abs(_evaluate(curves, fit_x) - fit_y).max(1)
+                    best = int(np.argmin(errors))
+                    if errors[best] >= error:
+                        break
+                    curve, error = curves[best], errors[best]
+        if self.__rows is not None:
+            error = np.abs(_evaluate(curve[None, :], x)[0] - y).max()
+        return tuple(int(v) for v in curve), float(error)
+
+def fitCurve(x, y, tolerance=0.0):
+    """ Fit a MMD bezier curve to the points (x, y) of 0 < x < 1
+
+    Return ((x1, y1, x2, y2) of 0-127, max error of y). The refinement stops
+    when the max error is not more than tolerance.
+    """
+    return _CurveFitter(x).fit(y, tolerance)
+
+
+def _alignQuaternions(rotations):
+    """ Flip the quaternions to be in the same hemisphere as the previous ones """
+    rotations = np.asarray(rotations, dtype=np.float64)
+    if len(rotations) > 1:
+        signs = np.where((rotations[1:]*rotations[:-1]).sum(1) < 0, -1.0, 1.0)
+        rotations = rotations.copy()
+        rotations[1:] *= np.cumprod(signs)[:, None]
+    return rotations
+
+def _angles(q0, q1):
+    """ Return the rotation angles (radians) between the quaternions """
+    return 2*np.arccos(np.clip(np.abs((q0*q1).sum(-1)), 0, 1))
+
+def _slerp_each(q0, q1, factors):
+    """ Return the slerp of each pair of the quaternions (K, 4) by each factor (K,) """
+    dot = (q0*q1).sum(1)
+    q1 = np.where(dot[:, None] < 0, -q1, q1)
+    theta = np.arccos(np.clip(np.abs(dot), 0, 1))
+    s = np.sin(theta)
+    is_small = s < 1e-6
+    s = np.where(is_small, 1.0, s)
+    w0 = np.where(is_small, 1 - factors, np.sin((1 - factors)*theta)/s)
+    w1 = np.where(is_small, factors, np.sin(factors*theta)/s)
+    q = w0[:, None]*q0 + w1[:, None]*q1
+    return q/np.linalg.norm(q, axis=1)[:, None]
+
+def _slerp(q0, q1, factors):
+    theta = _angles(q0, q1)/2
+    if theta < 1e-6:
+        return np.repeat(q0[None, :], len(factors), axis=0)
+    s = math.sin(theta)
+    return (np.sin((1 - factors)*theta)[:, None]*q0 + np.sin(factors*theta)[:, None]*q1)/s
+
+
+class KeyframeReducer:
+    """ Reduce the keys of vmd tracks within the error tolerances
+
+    @param location_tolerance the max error of the bone locations in MMD units
+    @param rotation_tolerance the max error of the bone rotations in degrees
+    @param weight_tolerance the max error of the morph weights
+
+    The numbers of the keys and the max errors of the reduced tracks are
+    summed up by the reducer, see report().
+    """
+    def __init__(self, location_tolerance=0.01, rotation_tolerance=0.5, weight_tolerance=0.005):
+        self.location_tolerance = location_tolerance
+        self.rotation_tolerance = math.radians(rotation_tolerance)
+        self.weight_tolerance = weight_tolerance
+        self.key_count = 0
+        self.reduced_key_count = 0
+        self.max_location_error = 0.0
+        self.max_rotation_error = 0.0 # degrees
+        self.max_weight_error = 0.0
+
+    def compressionRatio(self):
+        return self.key_count/max(1, self.reduced_key_count)
+
+    def report(self):
+        return 'Reduced %d keys to %d keys (%.1fx), max error: location %.4f, rotation %.3f deg, weight %.4f'%(
+            self.key_count, self.reduced_key_count, self.compressionRatio(),
+            self.max_location_error, self.max_rotation_error, self.max_weight_error)
+
+    @staticmethod
+    def __search(count, fits):
+        """ Return the indices of the kept keys, where fits(i, j) tells if the keys i < k < j can be removed """
+        ret = [0]
+        i = 0
+        while i < count - 1:
+            # exponential search of the longest run, then binary search
+            good, step = i + 1, 2
+            bad = None
+            while good < count - 1:
+                j = min(i + step, count - 1)
+                if not fits(i, j):
+                    bad = j
+                    break
+                good = j
+                step *= 2
+            if bad is not None:
+                while bad - good > 1:
+                    j = (good + bad)//2
+                    if fits(i, j):
+                        good = j
+                    else:
+                        bad = j
+            ret.append(good)
+            i = good
+        return ret
+
+    @staticmethod
+    def __boneMotion(records, frames, locations, rotations):
+        """ Return (locations, rotations) of the keys at every frame from the first key to the last key """
+        if len(frames) < 2:
+            return locations, rotations
+        all_frames = np.arange(frames[0], frames[-1] + 1)
+        # the frames in the segments (k-1, k), which are interpolated by the curves of the keys k
+        k = np.clip(np.searchsorted(frames, all_frames), 1, len(frames) - 1)
+        x = (all_frames - frames[k-1])/(frames[k] - frames[k-1])
+        interps = records['interp'][k].astype(np.float64)
+        curves = [interps[:, [indices[0] for indices in toolkit._bone_curve_indices(c)]] for c in range(4)]
+        motion_locations = np.empty((len(all_frames), 3))
+        for c in range(3):
+            motion_locations[:, c] = locations[k-1, c] + (locations[k, c] - locations[k-1, c])*_evaluate_each(curves[c], x)
+        motion_rotations = _slerp_each(rotations[k-1], rotations[k], _evaluate_each(curves[3], x))
+        return motion_locations, motion_rotations
+
+    def __fitBoneSegment(self, frames, locations, rotations, motion, i, j):
+        """ Return (interp, location error, rotation error) of the keys i - j, or None if it is out of the tolerances
+
+        The errors are measured at every frame between the keys i and j.
+        """
+        inner_frames = np.arange(frames[i] + 1, frames[j])
+        inner = (inner_frames - frames[0]).astype(int)
+        x = (inner_frames - frames[i])/(frames[j] - frames[i])
+        fitter = _CurveFitter(x)
+        curves, location_error = [], 0.0
+        for c in range(3):
+            v0, dv = locations[i, c], locations[j, c] - locations[i, c]
+            values = motion[0][inner, c]
+            if abs(dv) < 1e-6:
+                curve, error = _LINEAR_CURVE, float(np.abs(values - v0).max())
+            else:
+                curve, error = fitter.fit((values - v0)/dv, self.location_tolerance/abs(dv))
+                error *= abs(dv)
+            if error > self.location_tolerance:
+                return None
+            curves.append(curve)
+            location_error = max(location_error, error)
+
+        q0, q1, qs = rotations[i], rotations[j], motion[1][inner]
+        theta = _angles(q0, q1)
+        if theta < 1e-6:
+            curve = _LINEAR_CURVE
+            rotation_error = float(_angles(q0[None, :], qs).max())
+        else:
+            factors = _angles(q0[None, :], qs)/theta
+            factors = np.where(((qs - q0)*(q1 - q0)).sum(1) < 0, -factors, factors)
+            curve, _ = fitter.fit(factors, self.rotation_tolerance/theta)
+            fitted = _slerp(q0, q1, _evaluate(np.array([curve], dtype=np.float64), x)[0])
+            rotation_error = float(_angles(fitted, qs).max())
+        if rotation_error > self.rotation_tolerance:
+            return None
+        curves.append(curve)
+
+        interp = np.zeros(64, dtype=np.int8)
+        for channel, curve in enumerate(curves):
+            toolkit._set_curve(interp, toolkit._bone_curve_indices(channel), curve)
+        return interp, location_error, rotation_error
+
+    def reduceBoneKeys(self, frameKeys):
+        """ Return a vmd._TrackTable of the reduced bone keys """
+        records = toolkit._combine_records([toolkit._track_records(vmd.BoneAnimation, frameKeys)], 'LAST')
+        frames = records['frame_number'].astype(np.float64)
+        locations = records['location'].astype(np.float64)
+        rotations = _alignQuaternions(records['rotation'])
+        motion = self.__boneMotion(records, frames, locations, rotations)
+        fitted = {}
+        def __fits(i, j):
+            ret = fitted[(i, j)] = self.__fitBoneSegment(frames, locations, rotations, motion, i, j)
+            return ret is not None
+        kept = self.__search(len(records), __fits)
+
+        ret = records[kept]
+        for k, (i, j) in enumerate(zip(kept[:-1], kept[1:])):
+            if j - i < 2:
+                continue
+            interp, location_error, rotation_error = fitted[(i, j)]
+            ret['interp'][k+1] = interp
+            self.max_location_error = max(self.max_location_error, location_error)
+            self.max_rotation_error = max(self.max_rotation_error, math.degrees(rotation_error))
+        self.key_count += len(frameKeys)
+        self.reduced_key_count += len(ret)
+        return vmd._TrackTable(vmd.BoneFrameKey, ret)
+
+    def reduceShapeKeys(self, frameKeys):
+        """ Return a vmd._TrackTable of the reduced morph keys """
+        records = toolkit._combine_records([toolkit._track_records(vmd.ShapeKeyAnimation, frameKeys)], 'LAST')
+        frames = records['frame_number'].astype(np.float64)
+        weights = records['weight'].astype(np.float64)
+        errors = {}
+        def __fits(i, j):
+            x = (frames[i+1:j] - frames[i])/(frames[j] - frames[i])
+            error = errors[(i, j)] = float(np.abs(weights[i] + (weights[j] - weights[i])*x - weights[i+1:j]).max())
+            return error <= self.weight_tolerance
+        kept = self.__search(len(records), __fits)
+
+        for i, j in zip(kept[:-1], kept[1:]):
+            if j - i >= 2:
+                self.max_weight_error = max(self.max_weight_error, errors[(i, j)])
+        self.key_count += len(frameKeys)
+        self.reduced_key_count += len(kept)
+        return vmd._TrackTable(vmd.ShapeKeyFrameKey, records[kept])
+
+    def reduceAnimation(self, animation):
+        """ Reduce the tracks of a vmd.BoneAnimation or vmd.ShapeKeyAnimation in place """
+        if animation is None:
+            return
+        reduce_track = self.reduceBoneKeys if animation.frameClass() is vmd.BoneFrameKey else self.reduceShapeKeys
+        for name, frameKeys in animation.items():
+            if len(frameKeys) > 2:
+                animation[name] = reduce_track(frameKeys)
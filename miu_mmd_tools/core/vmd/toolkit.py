@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+""" Merge, slice, retime and rename vmd motions without Blender
+
+The functions take vmd.File objects or file paths and return new vmd.File
+objects, whose bone and morph tracks are track tables. File paths are loaded
+lazily one by one, and each track is decoded without being kept by its source
+file, so the memory is about the size of the result.
+
+The interpolation blocks of the frame keys are kept as they are. The keys at
+the cut frames of slice_frames() are evaluated on the interpolation curves,
+and the curves of the cut segments are split at the cut frames.
+"""
+
+import collections
+import logging
+import math
+
+import numpy as np
+
+from miu_mmd_tools.core import vmd
+
+CONFLICT_RULES = ('LAST', 'FIRST', 'ERROR')
+
+_TRACK_SECTIONS = ('boneAnimation', 'shapeKeyAnimation')
+_LIST_SECTIONS = ('cameraAnimation', 'lampAnimation', 'selfShadowAnimation')
+_ANIMATION_CLASSES = {
+    'boneAnimation': vmd.BoneAnimation,
+    'shapeKeyAnimation': vmd.ShapeKeyAnimation,
+    'cameraAnimation': vmd.CameraAnimation,
+    'lampAnimation': vmd.LampAnimation,
+    'selfShadowAnimation': vmd.SelfShadowAnimation,
+    'propertyAnimation': vmd.PropertyAnimation,
+    }
+
+
+class FrameConflictError(Exception):
+    pass
+
+
+#********************************************
+# interpolation curves
+#********************************************
+
+_LINEAR_CURVE = (20, 20, 107, 107)
+
+def _bone_curve_indices(channel):
+    """ Return the indices of (x1, y1, x2, y2) in the 64 bytes of a bone key,
+    each value is repeated in the 4 rows which are shifted by 1 byte.
+    """
+    return [[16*row + channel + 4*i - row for row in range(4) if 0 <= channel + 4*i - row < 16] for i in range(4)]
+
+def _camera_curve_indices(channel):
+    """ Return the indices of (x1, y1, x2, y2) in the 24 bytes of a camera key """
+    return [[4*channel + i] for i in (0, 2, 1, 3)]
+
+def _get_curve(interp, indices):
+    return tuple(int(interp[x[0]]) for x in indices)
+
+def _set_curve(interp, indices, curve):
+    for index_list, value in zip(indices, curve):
+        interp[index_list] = value
+
+def _bezier_points(curve):
+    x1, y1, x2, y2 = (x/127.0 for x in curve)
+    return ((0.0, 0.0), (x1, y1), (x2, y2), (1.0, 1.0))
+
+def _solve_bezier(points, x):
+    """ Return t of the bezier curve at x, the curve is monotonic in x """
+    (_, _), (x1, _), (x2, _), (_, _) = points
+    lo, hi = 0.0, 1.0
+    for i in range(40):
+        t = (lo + hi)/2
+        u = 1 - t
+        if 3*u*u*t*x1 + 3*u*t*t*x2 + t*t*t < x:
+            lo = t
+        else:
+            hi = t
+    return (lo + hi)/2
+
+def _split_bezier(curve, x):
+    """ Return (factor, head curve, tail curve) of the curve cut at x (0 < x < 1) """
+    points = _bezier_points(curve)
+    t = _solve_bezier(points, x)
+    lerp = lambda p, q: (p[0] + (q[0] - p[0])*t, p[1] + (q[1] - p[1])*t)
+    p0, p1, p2, p3 = points
+    p01, p12, p23 = lerp(p0, p1), lerp(p1, p2), lerp(p2, p3)
+    p012, p123 = lerp(p01, p12), lerp(p12, p23)
+    pt = lerp(p012, p123)
+
+    def __normalize(q0, q1, q2, q3):
+        dx, dy = q3[0] - q0[0], q3[1] - q0[1]
+        if abs(dx) < 1e-6 or abs(dy) < 1e-6:
+            return _LINEAR_CURVE
+        values = ((q1[0] - q0[0])/dx, (q1[1] - q0[1])/dy, (q2[0] - q0[0])/dx, (q2[1] - q0[1])/dy)
+        return tuple(max(0, min(127, int(0.5 + v*127))) for v in values)
+
+    return pt[1], __normalize(p0, p01, p012, pt), __normalize(pt, p123, p23, p3)
+
+def _slerp(q0, q1, factor):
+    q0, q1 = np.asarray(q0, dtype=np.float64), np.asarray(q1, dtype=np.float64)
+    dot = np.dot(q0, q1)
+    if dot < 0:
+        q1, dot = -q1, -dot
+    if dot > 0.9995:
+        q = q0 + (q1 - q0)*factor
+    else:
+        theta = math.acos(dot)
+        q = (math.sin((1 - factor)*theta)*q0 + math.sin(factor*theta)*q1)/math.sin(theta)
+    return q/np.linalg.norm(q)
+
+
+# (column, component, interpolation channel) of the interpolated values,
+# the channel None is linear
+_CHANNELS = {
+    vmd.BoneFrameKey: [('location', 0, 0), ('location', 1, 1), ('location', 2, 2), ('rotation', None, 3)],
+    vmd.ShapeKeyFrameKey: [('weight', None, None)],
+    vmd.CameraKeyFrameKey: [('location', 0, 0), ('location', 1, 1), ('location', 2, 2), ('rotation', None, 3),
+                            ('distance', None, 4), ('angle', None, 5)],
+    vmd.LampKeyFrameKey: [('color', None, None), ('direction', None, None)],
+    vmd.SelfShadowFrameKey: [], # constant
+    }
+_CURVE_INDICES = {
+    vmd.BoneFrameKey: _bone_curve_indices,
+    vmd.CameraKeyFrameKey: _camera_curve_indices,
+    }
+
+def _cut(frame_class, records, i, frame):
+    """ Return (record at frame, interpolation of records[i]) of the cut between records[i-1] and records[i] """
+    a, b = records[i-1], records[i]
+    ret = records[i-1:i].copy()
+    ret['frame_number'] = frame
+    x = (frame - int(a['frame_number']))/(int(b['frame_number']) - int(a['frame_number']))
+    tail_interp = b['interp'].copy() if 'interp' in records.dtype.names else None
+    for column, component, channel in _CHANNELS[frame_class]:
+        factor = x
+        if channel is not None:
+            indices = _CURVE_INDICES[frame_class](channel)
+            factor, head, tail = _split_bezier(_get_curve(b['interp'], indices), x)
+            _set_curve(ret['interp'][0], indices, head)
+            _set_curve(tail_interp, indices, tail)
+        if column == 'rotation' and frame_class is vmd.BoneFrameKey:
+            ret[column][0] = _slerp(a[column], b[column], factor)
+        elif component is None:
+            value = a[column] + (b[column] - a[column])*factor
+            ret[column][0] = np.rint(value) if ret.dtype[column].kind in 'iu' else value
+        else:
+            ret[column][0][component] = a[column][component] + (b[column][component] - a[column][component])*factor
+    return ret, tail_interp
+
+def _cut_at(frame_class, records, frame):
+    """ Insert a key at frame if frame is between two keys """
+    frames = records['frame_number']
+    i = int(np.searchsorted(frames, frame, 'left'))
+    if i == 0 or i == len(records) or frames[i] == frame:
+        return records
+    record, tail_interp = _cut(frame_class, records, i, frame)
+    records = np.concatenate([records[:i], record, records[i:]])
+    if tail_interp is not None:
+        records['interp'][i+1] = tail_interp
+    return records
+
+def _sorted(records):
+    return records[np.argsort(records['frame_number'], kind='stable')]
+
+
+#********************************************
+# frame key records
+#********************************************
+
+def _slice_records(frame_class, records, frame_start, frame_end=None):
+    records = _sorted(records)
+    if len(records) < 1:
+        return records
+    frames = records['frame_number']
+    first, last = int(frames[0]), int(frames[-1])
+    records = _cut_at(frame_class, records, frame_start)
+    if frame_end is not None:
+        records = _cut_at(frame_class, records, frame_end)
+    frames = records['frame_number']
+    mask = frames >= frame_start
+    if frame_end is not None:
+        mask &= frames <= frame_end
+    ret = records[mask]
+    if len(ret) < 1 or ret['frame_number'][0] != frame_start:
+        # hold the pose of the last key before the range, or of the first key after the range
+        if last < frame_start or (len(ret) < 1 and first > frame_start):
+            hold = records[-1:] if last < frame_start else records[:1]
+            hold = hold.copy()
+            hold['frame_number'] = frame_start
+            ret = np.concatenate([hold, ret])
+    return ret
+
+def _combine_records(records_list, conflict, name=''):
+    """ Return the records sorted by the frames, and the keys of the same frame are picked by conflict """
+    records = _sorted(np.concatenate(records_list))
+    frames = records['frame_number']
+    changed = frames[1:] != frames[:-1]
+    if changed.all():
+        return records
+    if conflict == 'ERROR':
+        raise FrameConflictError('Frame %d of "%s" has conflicting keys'%(frames[1:][~changed][0], name))
+    if conflict == 'FIRST':
+        return records[np.append(True, changed)]
+    return records[np.append(changed, True)]
+
+def _retime_records(frame_class, records, offset, scale):
+    if offset < 0:
+        records = _slice_records(frame_class, records, int(math.ceil(-offset/scale)))
+    records = records.copy()
+    records['frame_number'] = np.rint(records['frame_number']*scale + offset)
+    return _combine_records([records], 'LAST')
+
+
+#********************************************
+# property keys
+#********************************************
+
+def _copy_property_key(frameKey, frame_number):
+    ret = vmd.PropertyFrameKey()
+    ret.frame_number = frame_number
+    ret.visible = frameKey.visible
+    ret.ik_states = list(frameKey.ik_states)
+    return ret
+
+def _combine_property_keys(frameKeys, conflict):
+    keys = {}
+    for frameKey in frameKeys:
+        if frameKey.frame_number in keys:
+            if conflict == 'ERROR':
+                raise FrameConflictError('Frame %d of property keys has conflicting keys'%frameKey.frame_number)
+            if conflict == 'FIRST':
+                continue
+        keys[frameKey.frame_number] = frameKey
+    return [keys[x] for x in sorted(keys)]
+
+def _slice_property_keys(frameKeys, frame_start, frame_end=None):
+    frameKeys = sorted(frameKeys, key=lambda x: x.frame_number)
+    ret = [x for x in frameKeys if x.frame_number >= frame_start and (frame_end is None or x.frame_number <= frame_end)]
+    before = [x for x in frameKeys if x.frame_number < frame_start]
+    if before and (not ret or ret[0].frame_number != frame_start):
+        ret.insert(0, _copy_property_key(before[-1], frame_start))
+    return ret
+
+
+#********************************************
+# files
+#********************************************
+
+def load(filepath):
+    """ Load a vmd file, whose bone and morph tracks are decoded on demand """
+    ret = vmd.File()
+    ret.load(filepath=filepath, use_mmap=True, lazy=True)
+    return ret
+
+def _load_files(vmd_files):
+    for vmd_file in vmd_files:
+        yield load(vmd_file) if isinstance(vmd_file, str) else vmd_file
+
+def _new_file(model_name=''):
+    ret = vmd.File()
+    ret.header = vmd.Header()
+    ret.header.model_name = model_name
+    for section, animation_cls in _ANIMATION_CLASSES.items():
+        setattr(ret, section, animation_cls())
+    return ret
+
+def _model_name(vmd_file):
+    return vmd_file.header.model_name if vmd_file.header else ''
+
+def _animation(vmd_file, section):
+    return getattr(vmd_file, section, None) or _ANIMATION_CLASSES[section]()
+
+def _track_records(animation, frameKeys):
+    if isinstance(frameKeys, vmd._TrackTable):
+        return frameKeys.readRecords()
+    return animation.frameClass().toRecords(frameKeys)
+
+def _map_records(vmd_file, func, property_func):
+    """ Return a new file of func(frame_class, records) of each track and property_func(frame keys) """
+    ret = _new_file(_model_name(vmd_file))
+    for section in _TRACK_SECTIONS:
+        animation, result = _animation(vmd_file, section), getattr(ret, section)
+        frame_class = animation.frameClass()
+        for name, frameKeys in animation.items():
+            records = func(frame_class, _track_records(animation, frameKeys))
+            if len(records):
+                result[name] = vmd._TrackTable(frame_class, records)
+    for section in _LIST_SECTIONS:
+        animation, result = _animation(vmd_file, section), getattr(ret, section)
+        frame_class = animation.frameClass()
+        result.extend(frame_class.fromRecords(func(frame_class, frame_class.toRecords(animation))))
+    ret.propertyAnimation.extend(property_func(_animation(vmd_file, 'propertyAnimation')))
+    return ret
+
+def merge(vmd_files, conflict='LAST', model_name=None):
+    """ Merge the motions of vmd files
+
+    @param vmd_files vmd.File objects or file paths
+    @param conflict the key of a frame which is in more than one file:
+        'LAST' picks the key of the last file, 'FIRST' picks the first one,
+        and 'ERROR' raises FrameConflictError
+    @param model_name the model name of the result, or the one of the first file
+    """
+    if conflict not in CONFLICT_RULES:
+        raise ValueError('Invalid conflict rule "%s"'%conflict)
+    tracks = {x:collections.defaultdict(list) for x in _TRACK_SECTIONS}
+    lists = {x:[] for x in _LIST_SECTIONS}
+    property_keys = []
+    for vmd_file in _load_files(vmd_files):
+        if model_name is None:
+            model_name = _model_name(vmd_file)
+        for section in _TRACK_SECTIONS:
+            animation = _animation(vmd_file, section)
+            for name, frameKeys in animation.items():
+                tracks[section][name].append(_track_records(animation, frameKeys))
+        for section in _LIST_SECTIONS:
+            animation = _animation(vmd_file, section)
+            lists[section].append(animation.frameClass().toRecords(animation))
+        property_keys.extend(_animation(vmd_file, 'propertyAnimation'))
+        logging.info('Merged "%s"', vmd_file.filepath)
+
+    ret = _new_file(model_name or '')
+    for section, section_tracks in tracks.items():
+        animation = getattr(ret, section)
+        for name, records_list in section_tracks.items():
+            animation[name] = vmd._TrackTable(animation.frameClass(), _combine_records(records_list, conflict, name))
+    for section, records_list in lists.items():
+        animation = getattr(ret, section)
+        if records_list:
+            animation.extend(animation.frameClass().fromRecords(_combine_records(records_list, conflict, section)))
+    ret.propertyAnimation.extend(_combine_property_keys(property_keys, conflict))
+    return ret
+
+def slice_frames(vmd_file, frame_start, frame_end=None, rebase=False):
+    """ Return the motion in the frame range [frame_start, frame_end]
+
+    Keys are added at frame_start and frame_end to keep the motion of the cut
+    segments. The frames start at 0 if rebase is True.
+    """
+    if frame_end is not None and frame_end < frame_start:
+        raise ValueError('Invalid frame range %d - %d'%(frame_start, frame_end))
+    offset = -frame_start if rebase else 0
+    def __slice(frame_class, records):
+        records = _slice_records(frame_class, records, frame_start, frame_end)
+        if offset:
+            records = records.copy()
+            records['frame_number'] = records['frame_number'] + offset
+        return records
+    def __slice_property_keys(frameKeys):
+        frameKeys = _slice_property_keys(frameKeys, frame_start, frame_end)
+        return [_copy_property_key(x, x.frame_number + offset) for x in frameKeys]
+    return _map_records(_first(vmd_file), __slice, __slice_property_keys)
+
+def retime(vmd_file, offset=0, scale=1.0):
+    """ Return the motion whose frame f is moved to round(f*scale + offset)
+
+    The keys before frame 0 are removed, and the keys moved to the same frame
+    are merged to the last one.
+    """
+    if scale <= 0:
+        raise ValueError('Invalid time scale %s'%scale)
+    def __retime(frame_class, records):
+        return _retime_records(frame_class, records, offset, scale)
+    def __retime_property_keys(frameKeys):
+        if offset < 0:
+            frameKeys = _slice_property_keys(frameKeys, int(math.ceil(-offset/scale)))
+        frameKeys = [_copy_property_key(x, int(round(x.frame_number*scale + offset))) for x in frameKeys]
+        return _combine_property_keys(frameKeys, 'LAST')
+    return _map_records(_first(vmd_file), __retime, __retime_property_keys)
+
+def rename_tracks(vmd_file, bone_names=None, shape_key_names=None, conflict='LAST'):
+    """ Return the motion whose tracks are renamed
+
+    @param bone_names, shape_key_names dicts or functions of name to new name,
+        the tracks of None are removed, and the tracks renamed to the same name
+        are merged by the conflict rule of merge()
+    """
+    def __mapper(names):
+        if names is None:
+            return lambda name: name
+        if callable(names):
+            return names
+        return lambda name: names.get(name, name)
+
+    vmd_file = _first(vmd_file)
+    ret = _new_file(_model_name(vmd_file))
+    for section, names in zip(_TRACK_SECTIONS, (bone_names, shape_key_names)):
+        mapper = __mapper(names)
+        animation = _animation(vmd_file, section)
+        tracks = collections.defaultdict(list)
+        for name, frameKeys in animation.items():
+            new_name = mapper(name)
+            if new_name is not None:
+                tracks[new_name].append(_track_records(animation, frameKeys))
+        result = getattr(ret, section)
+        for name, records_list in tracks.items():
+            result[name] = vmd._TrackTable(animation.frameClass(), _combine_records(records_list, conflict, name))
+    for section in _LIST_SECTIONS:
+        getattr(ret, section).extend(_animation(vmd_file, section))
+    mapper = __mapper(bone_names)
+    for frameKey in _animation(vmd_file, 'propertyAnimation'):
+        frameKey = _copy_property_key(frameKey, frameKey.frame_number)
+        frameKey.ik_states = [(mapper(name), state) for name, state in frameKey.ik_states if mapper(name) is not None]
+        ret.propertyAnimation.append(frameKey)
+    return ret
+
+def _first(vmd_file):
+    return next(_load_files([vmd_file]))
@@ -11,10 +11,12 @@ from miu_mmd_tools.core import vpd
 
 
 class VPDImporter:
-    def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False):
+    def __init__(self, filepath, scale=1.0, bone_mapper=None, use_pose_mode=False, vpd_file=None):
         self.__pose_name = bpy.path.display_name_from_filepath(filepath)
-        self.__vpd_file = vpd.File()
-        self.__vpd_file.load(filepath=filepath)
+        self.__vpd_file = vpd_file
+        if self.__vpd_file is None:
+            self.__vpd_file = vpd.File()
+            self.__vpd_file.load(filepath=filepath)
         self.__scale = scale
         self.__bone_mapper = bone_mapper
         if use_pose_mode:
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
 import re
 import traceback
@@ -13,9 +14,12 @@ from bpy_extras.io_utils import ImportHelper, ExportHelper
 
 from miu_mmd_tools import register_wrap
 from miu_mmd_tools import auto_scene_setup
+from miu_mmd_tools.bpyutils import addon_preferences
 from miu_mmd_tools.utils import makePmxBoneMap
 from miu_mmd_tools.core.camera import MMDCamera
 from miu_mmd_tools.core.lamp import MMDLamp
+from miu_mmd_tools.core.model_cache import ModelCache
+from miu_mmd_tools.core.prefetch import prefetch
 from miu_mmd_tools.translations import DictionaryEnum
 
 import miu_mmd_tools.core.pmd.importer as pmd_importer
@@ -23,6 +27,9 @@ import miu_mmd_tools.core.pmx.importer as pmx_importer
 import miu_mmd_tools.core.pmx.exporter as pmx_exporter
 import miu_mmd_tools.core.vmd.importer as vmd_importer
 import miu_mmd_tools.core.vmd.exporter as vmd_exporter
+import miu_mmd_tools.core.vmd.reducer as vmd_reducer
+import miu_mmd_tools.core.vmd.toolkit as vmd_toolkit
+import miu_mmd_tools.core.vpd as vpd
 import miu_mmd_tools.core.vpd.importer as vpd_importer
 import miu_mmd_tools.core.vpd.exporter as vpd_exporter
 import miu_mmd_tools.core.model as mmd_model
@@ -60,6 +67,14 @@ def _update_types(cls, prop):
     if types != cls.types:
         cls.types = types # trigger update
 
+def _importer_cls(filepath):
+    if re.search('\.pmd$', filepath, flags=re.I):
+        return pmd_importer.PMDImporter
+    return pmx_importer.PMXImporter
+
+def _load_model(filepath, **args):
+    return _importer_cls(filepath).load(filepath=filepath, **args)
+
 @register_wrap
 class ImportPmx(Operator, ImportHelper):
     bl_idname = 'miu_mmd_tools.import_model'
@@ -142,6 +157,11 @@ class ImportPmx(Operator, ImportHelper):
         description='The diffuse color factor of texture slot for .spa textures',
         default=1.0,
         )
+    use_model_cache = bpy.props.BoolProperty(
+        name='Use Model Cache',
+        description='Reuse the parsed (and cleaned) data of the model files imported before',
+        default=False,
+        )
     log_level = bpy.props.EnumProperty(
         name='Log level',
         description='Select log level',
@@ -157,29 +177,44 @@ class ImportPmx(Operator, ImportHelper):
     def execute(self, context):
         try:
             self.__translator = DictionaryEnum.get_translator(self.dictionary)
+            self.__model_cache = None
+            if self.use_model_cache:
+                self.__model_cache = ModelCache(
+                    addon_preferences('model_cache_folder', '') or None,
+                    addon_preferences('model_cache_size', 1024) << 20,
+                    )
+            filepaths = []
             if self.directory:
-                for f in self.files:
-                    self.filepath = os.path.join(self.directory, f.name)
-                    self._do_execute(context)
+                filepaths = [os.path.join(self.directory, f.name) for f in self.files]
             elif self.filepath:
-                self._do_execute(context)
+                filepaths = [self.filepath]
+            if self.save_log or len(filepaths) < 2:
+                for self.filepath in filepaths:
+                    self._do_execute(context)
+            else:
+                # parse the next files in worker threads while importing the current one
+                load_func = functools.partial(_load_model,
+                    types=set(self.types),
+                    clean_model=self.clean_model,
+                    remove_doubles=self.remove_doubles,
+                    model_cache=self.__model_cache,
+                    )
+                logging.getLogger().setLevel(self.log_level)
+                for self.filepath, loaded_model in prefetch(load_func, filepaths):
+                    self._do_execute(context, loaded_model)
         except Exception as e:
             err_msg = traceback.format_exc()
             self.report({'ERROR'}, err_msg)
         return {'FINISHED'}
 
-    def _do_execute(self, context):
+    def _do_execute(self, context, loaded_model=None):
         logger = logging.getLogger()
         logger.setLevel(self.log_level)
         if self.save_log:
             handler = log_handler(self.log_level, filepath=self.filepath + '.miu_mmd_tools.import.log')
             logger.addHandler(handler)
         try:
-            importer_cls = pmx_importer.PMXImporter
-            if re.search('\.pmd$', self.filepath, flags=re.I):
-                importer_cls = pmd_importer.PMDImporter
-
-            importer_cls().execute(
+            _importer_cls(self.filepath)().execute(
                 filepath=self.filepath,
                 types=self.types,
                 scale=self.scale,
@@ -193,6 +228,8 @@ class ImportPmx(Operator, ImportHelper):
                 use_mipmap=self.use_mipmap,
                 sph_blend_factor=self.sph_blend_factor,
                 spa_blend_factor=self.spa_blend_factor,
+                model_cache=self.__model_cache,
+                loaded_model=loaded_model,
                 )
             self.report({'INFO'}, 'Imported MMD model from "%s"'%self.filepath)
         except Exception as e:
@@ -206,7 +243,55 @@ class ImportPmx(Operator, ImportHelper):
         return {'FINISHED'}
 
 @register_wrap
-class ImportVmd(Operator, ImportHelper):
+class ClearModelCache(Operator):
+    bl_idname = 'miu_mmd_tools.clear_model_cache'
+    bl_label = 'Clear Model Cache'
+    bl_description = 'Remove all cached model data of imported model files'
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        model_cache = ModelCache(addon_preferences('model_cache_folder', '') or None)
+        count = model_cache.invalidate()
+        self.report({'INFO'}, 'Removed %d cached model(s) from "%s"'%(count, model_cache.directory))
+        return {'FINISHED'}
+
+def _keyframe_reducer(operator):
+    if not operator.use_reduce_keys:
+        return None
+    return vmd_reducer.KeyframeReducer(
+        location_tolerance=operator.reduce_location_tolerance,
+        rotation_tolerance=operator.reduce_rotation_tolerance,
+        )
+
+class _KeyframeReducerOp:
+    """ The options of the keyframe reducer of the VMD operators """
+    use_reduce_keys = bpy.props.BoolProperty(
+        name='Reduce Keyframes',
+        description='Remove the dense keys which can be replaced by the interpolation curves of the other keys',
+        default=False,
+        )
+    reduce_location_tolerance = bpy.props.FloatProperty(
+        name='Location Tolerance',
+        description='The max error of the bone locations of the reduced keys (MMD units)',
+        min=0.0,
+        default=0.01,
+        precision=4,
+        )
+    reduce_rotation_tolerance = bpy.props.FloatProperty(
+        name='Rotation Tolerance',
+        description='The max error of the bone rotations of the reduced keys (degrees)',
+        min=0.0,
+        default=0.5,
+        )
+
+    def draw_reducer(self, layout):
+        layout.prop(self, 'use_reduce_keys')
+        if self.use_reduce_keys:
+            layout.prop(self, 'reduce_location_tolerance')
+            layout.prop(self, 'reduce_rotation_tolerance')
+
+@register_wrap
+class ImportVmd(Operator, ImportHelper, _KeyframeReducerOp):
     bl_idname = 'miu_mmd_tools.import_vmd'
     bl_label = 'Import VMD File (.vmd)'
     bl_description = 'Import a VMD file to selected objects (.vmd)'
@@ -226,6 +311,11 @@ class ImportVmd(Operator, ImportHelper):
         min=0,
         default=5,
         )
+    use_append = bpy.props.BoolProperty(
+        name='Append to Actions',
+        description='Append the bone, morph and display motions after the end of the existing actions, and the margin is the frames between them',
+        default=False,
+        )
     bone_mapper = bpy.props.EnumProperty(
         name='Bone Mapper',
         description='Select bone mapper',
@@ -276,6 +366,7 @@ class ImportVmd(Operator, ImportHelper):
         layout = self.layout
         layout.prop(self, 'scale')
         layout.prop(self, 'margin')
+        layout.prop(self, 'use_append')
 
         layout.prop(self, 'bone_mapper')
         if self.bone_mapper == 'RENAMED_BONES':
@@ -284,6 +375,7 @@ class ImportVmd(Operator, ImportHelper):
             layout.prop(self, 'dictionary')
         layout.prop(self, 'use_pose_mode')
         layout.prop(self, 'use_mirror')
+        self.draw_reducer(layout)
 
         layout.prop(self, 'update_scene_settings')
 
@@ -307,6 +399,7 @@ class ImportVmd(Operator, ImportHelper):
                 translator=DictionaryEnum.get_translator(self.dictionary),
                 ).init
 
+        reducer = _keyframe_reducer(self)
         start_time = time.time()
         importer = vmd_importer.VMDImporter(
             filepath=self.filepath,
@@ -315,11 +408,16 @@ class ImportVmd(Operator, ImportHelper):
             use_pose_mode=self.use_pose_mode,
             frame_margin=self.margin,
             use_mirror=self.use_mirror,
+            reducer=reducer,
+            append_frame=vmd_importer.VMDImporter.findEndFrame(selected_objects) if self.use_append else None,
             )
 
         for i in selected_objects:
             importer.assign(i)
         logging.info(' Finished importing motion in %f seconds.', time.time() - start_time)
+        if reducer:
+            logging.info(' %s', reducer.report())
+            self.report({'INFO'}, reducer.report())
 
         if self.update_scene_settings:
             auto_scene_setup.setupFrameRanges()
@@ -327,6 +425,135 @@ class ImportVmd(Operator, ImportHelper):
         context.scene.frame_set(context.scene.frame_current)
         return {'FINISHED'}
 
+@register_wrap
+class EditVmdFiles(Operator, ImportHelper):
+    bl_idname = 'miu_mmd_tools.edit_vmd_files'
+    bl_label = 'Merge VMD Files (.vmd)'
+    bl_description = 'Merge, slice, retime and rename the motions of VMD files to a new VMD file, without importing them (.vmd)'
+    bl_options = {'REGISTER', 'PRESET'}
+
+    files = bpy.props.CollectionProperty(type=OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory = bpy.props.StringProperty(maxlen=1024, subtype='FILE_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+
+    filename_ext = '.vmd'
+    filter_glob = bpy.props.StringProperty(default='*.vmd', options={'HIDDEN'})
+
+    output_path = bpy.props.StringProperty(
+        name='Output File',
+        description='The VMD file to save the result, default is "<first file>_edited.vmd"',
+        subtype='FILE_PATH',
+        options={'SKIP_SAVE'},
+        )
+    conflict = bpy.props.EnumProperty(
+        name='Conflicting Keys',
+        description='Select the key of a frame which is in more than one file or track',
+        items=[
+            ('LAST', 'Last', 'Use the key of the last file', 0),
+            ('FIRST', 'First', 'Use the key of the first file', 1),
+            ('ERROR', 'Error', 'Cancel if there are conflicting keys', 2),
+            ],
+        default='LAST',
+        )
+    use_frame_range = bpy.props.BoolProperty(
+        name='Frame Range',
+        description='Keep the motion in the frame range only, the keys at the start and end frames are added',
+        default=False,
+        )
+    frame_start = bpy.props.IntProperty(
+        name='Start',
+        min=0,
+        default=0,
+        )
+    frame_end = bpy.props.IntProperty(
+        name='End',
+        min=0,
+        default=250,
+        )
+    rebase = bpy.props.BoolProperty(
+        name='Start at Frame 0',
+        description='Move the sliced motion to start at frame 0',
+        default=False,
+        )
+    frame_offset = bpy.props.IntProperty(
+        name='Frame Offset',
+        description='Move the motion by frames, the keys moved before frame 0 are removed',
+        default=0,
+        )
+    time_scale = bpy.props.FloatProperty(
+        name='Time Scale',
+        description='Scale the time of the motion, the interpolation of the keys is kept',
+        min=0.001,
+        default=1.0,
+        )
+    rename_bones = bpy.props.BoolProperty(
+        name='Rename Bones - L / R Suffix',
+        description='Use Blender naming conventions for Left / Right paired bones',
+        default=False,
+        )
+    use_underscore = bpy.props.BoolProperty(
+        name="Rename Bones - Use Underscore",
+        description='Will not use dot, e.g. if renaming bones, will use _R instead of .R',
+        default=False,
+        )
+    dictionary = bpy.props.EnumProperty(
+        name='Rename Bones To English',
+        items=DictionaryEnum.get_dictionary_items,
+        description='Translate bone names from Japanese to English using selected dictionary',
+        )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'output_path')
+        layout.prop(self, 'conflict')
+
+        layout.prop(self, 'use_frame_range')
+        if self.use_frame_range:
+            row = layout.row(align=True)
+            row.prop(self, 'frame_start')
+            row.prop(self, 'frame_end')
+            layout.prop(self, 'rebase')
+        layout.prop(self, 'frame_offset')
+        layout.prop(self, 'time_scale')
+
+        layout.prop(self, 'rename_bones')
+        layout.prop(self, 'use_underscore')
+        layout.prop(self, 'dictionary')
+
+    def execute(self, context):
+        filepaths = [os.path.join(self.directory, f.name) for f in self.files if f.name] or [self.filepath]
+        output_path = bpy.path.abspath(self.output_path) or os.path.splitext(filepaths[0])[0] + '_edited.vmd'
+        if output_path in filepaths:
+            self.report({'ERROR'}, 'The output file "%s" is one of the input files'%output_path)
+            return {'CANCELLED'}
+
+        start_time = time.time()
+        try:
+            vmd_file = vmd_toolkit.merge(filepaths, conflict=self.conflict)
+            if self.use_frame_range:
+                vmd_file = vmd_toolkit.slice_frames(vmd_file, self.frame_start, max(self.frame_start, self.frame_end), rebase=self.rebase)
+            if self.frame_offset != 0 or self.time_scale != 1.0:
+                vmd_file = vmd_toolkit.retime(vmd_file, offset=self.frame_offset, scale=self.time_scale)
+            translator = DictionaryEnum.get_translator(self.dictionary)
+            if self.rename_bones or translator:
+                bone_mapper = vmd_importer.RenamedBoneMapper(
+                    rename_LR_bones=self.rename_bones,
+                    use_underscore=self.use_underscore,
+                    translator=translator,
+                    )
+                vmd_file = vmd_toolkit.rename_tracks(vmd_file, bone_names=bone_mapper.translate, conflict=self.conflict)
+            vmd_file.save(filepath=output_path)
+        except vmd_toolkit.FrameConflictError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        logging.info(' Finished editing %d motion(s) in %f seconds.', len(filepaths), time.time() - start_time)
+        self.report({'INFO'}, 'Saved "%s"'%output_path)
+        return {'FINISHED'}
+
+def _load_vpd(filepath):
+    ret = vpd.File()
+    ret.load(filepath=filepath)
+    return ret
+
 @register_wrap
 class ImportVpd(Operator, ImportHelper):
     bl_idname = 'miu_mmd_tools.import_vpd'
@@ -412,12 +639,14 @@ class ImportVpd(Operator, ImportHelper):
                 translator=DictionaryEnum.get_translator(self.dictionary),
                 ).init
 
-        for f in self.files:
+        filepaths = [os.path.join(self.directory, f.name) for f in self.files]
+        for filepath, vpd_file in prefetch(_load_vpd, filepaths):
             importer = vpd_importer.VPDImporter(
-                filepath=os.path.join(self.directory, f.name),
+                filepath=filepath,
                 scale=self.scale,
                 bone_mapper=bone_mapper,
                 use_pose_mode=self.use_pose_mode,
+                vpd_file=vpd_file,
                 )
             for i in selected_objects:
                 importer.assign(i)
@@ -558,7 +787,7 @@ class ExportPmx(Operator, ExportHelper):
         return {'FINISHED'}
 
 @register_wrap
-class ExportVmd(Operator, ExportHelper):
+class ExportVmd(Operator, ExportHelper, _KeyframeReducerOp):
     bl_idname = 'miu_mmd_tools.export_vmd'
     bl_label = 'Export VMD File (.vmd)'
     bl_description = 'Export motion data of active object to a VMD file (.vmd)'
@@ -583,6 +812,11 @@ class ExportVmd(Operator, ExportHelper):
         description = 'Export frames only in the frame range of context scene',
         default = False,
         )
+    use_evaluated_pose = bpy.props.BoolProperty(
+        name='Bake Evaluated Pose',
+        description='Export the evaluated bone pose of every frame in the scene frame range, including the constraints, drivers and IK',
+        default=False,
+        )
 
     @classmethod
     def poll(cls, context):
@@ -606,6 +840,8 @@ class ExportVmd(Operator, ExportHelper):
             'use_pose_mode':self.use_pose_mode,
             'use_frame_range':self.use_frame_range,
             'full': False,
+            'use_evaluated_pose':self.use_evaluated_pose,
+            'reducer':_keyframe_reducer(self),
             }
 
         obj = context.active_object
@@ -631,6 +867,9 @@ class ExportVmd(Operator, ExportHelper):
             start_time = time.time()
             vmd_exporter.VMDExporter().export(**params)
             logging.info(' Finished exporting motion in %f seconds.', time.time() - start_time)
+            if params['reducer']:
+                logging.info(' %s', params['reducer'].report())
+                self.report({'INFO'}, params['reducer'].report())
         except Exception as e:
             err_msg = traceback.format_exc()
             logging.error(err_msg)
@@ -639,7 +878,7 @@ class ExportVmd(Operator, ExportHelper):
         return {'FINISHED'}
 
 @register_wrap
-class ExportFullVmd(Operator, ExportHelper):
+class ExportFullVmd(Operator, ExportHelper, _KeyframeReducerOp):
     bl_idname = 'miu_mmd_tools.export_full_vmd'
     bl_label = 'Export VMD File (.vmd)'
     bl_description = 'Export motion data of active object to a VMD file (.vmd)'
@@ -687,6 +926,7 @@ class ExportFullVmd(Operator, ExportHelper):
             'use_pose_mode':self.use_pose_mode,
             'use_frame_range':self.use_frame_range,
             'full': True,
+            'reducer':_keyframe_reducer(self),
             }
 
         obj = context.active_object
@@ -712,6 +952,9 @@ class ExportFullVmd(Operator, ExportHelper):
             start_time = time.time()
             vmd_exporter.VMDExporter().export(**params)
             logging.info(' Finished exporting motion in %f seconds.', time.time() - start_time)
+            if params['reducer']:
+                logging.info(' %s', params['reducer'].report())
+                self.report({'INFO'}, params['reducer'].report())
         except Exception as e:
             err_msg = traceback.format_exc()
             logging.error(err_msg)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+""" Synthetic MMD data for the tests and the benchmark scripts """
+
+import random
+import struct
+
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import vmd
+
+
+def create_pmx_model(vertex_count=100000, bone_count=300, morph_count=100, morph_size=1000, additional_uvs=1, seed=0):
+    rand = random.Random(seed)
+    model = pmx.Model()
+    model.name = model.name_e = 'synthetic'
+    model.comment = model.comment_e = 'synthetic model for benchmarks'
+
+    for i in range(bone_count):
+        b = pmx.Bone()
+        b.name = b.name_e = 'bone%d'%i
+        b.location = (rand.random(), rand.random(), rand.random())
+        b.parent = i - 1
+        model.bones.append(b)
+
+    for i in range(vertex_count):
+        v = pmx.Vertex()
+        v.co = (rand.random(), rand.random(), rand.random())
+        v.normal = (0.0, 1.0, 0.0)
+        v.uv = (rand.random(), rand.random())
+        v.additional_uvs = [(rand.random(), rand.random(), 0.0, 0.0) for k in range(additional_uvs)]
+        v.edge_scale = 1.0
+        w = v.weight = pmx.BoneWeight()
+        w.type = i % 3
+        if w.type == pmx.BoneWeight.BDEF1:
+            w.bones, w.weights = [rand.randrange(bone_count)], []
+        elif w.type == pmx.BoneWeight.BDEF2:
+            w.bones, w.weights = [rand.randrange(bone_count), rand.randrange(bone_count)], [rand.random()]
+        else:
+            w.bones, w.weights = [rand.randrange(bone_count) for k in range(4)], [0.25]*4
+        model.vertices.append(v)
+
+    model.faces = [(i, i+1, i+2) for i in range(0, vertex_count-2, 3)]
+    mat = pmx.Material()
+    mat.name = mat.name_e = 'material'
+    mat.diffuse, mat.specular, mat.ambient, mat.edge_color = (1, 1, 1, 1), (0, 0, 0), (0.5, 0.5, 0.5), (0, 0, 0, 1)
+    mat.vertex_count = len(model.faces) * 3
+    model.materials.append(mat)
+
+    for i in range(morph_count):
+        if i % 4 == 3 and additional_uvs:
+            m = pmx.UVMorph('uv_morph%d'%i, '', 4, type_index=3)
+            offset_class, offset_size = pmx.UVMorphOffset, 4
+        else:
+            m = pmx.VertexMorph('vertex_morph%d'%i, '', 4)
+            offset_class, offset_size = pmx.VertexMorphOffset, 3
+        for index in sorted(rand.sample(range(vertex_count), min(vertex_count, morph_size))):
+            o = offset_class()
+            o.index = index
+            o.offset = tuple(rand.random() for k in range(offset_size))
+            m.offsets.append(o)
+        model.morphs.append(m)
+    return model
+
+def save_pmx_model(path, **args):
+    model = create_pmx_model(**args)
+    pmx.save(path, model, add_uv_count=args.get('additional_uvs', 1))
+    return model
+
+def save_pmd_model(path, vertex_count=100000, bone_count=300, morph_count=100, morph_size=1000, seed=0):
+    rand = random.Random(seed)
+    with open(path, 'wb') as f:
+        f.write(b'Pmd' + struct.pack('<f', 1.0))
+        f.write(struct.pack('<20s256s', b'synthetic', b'synthetic model for benchmarks'))
+        f.write(struct.pack('<I', vertex_count))
+        for i in range(vertex_count):
+            f.write(struct.pack('<8f2HBB', rand.random(), rand.random(), rand.random(), 0, 1, 0, rand.random(), rand.random(),
+                                rand.randrange(bone_count), rand.randrange(bone_count), 50, 0))
+        faces = [i for i in range(vertex_count - vertex_count%3)]
+        f.write(struct.pack('<I', len(faces)))
+        f.write(struct.pack('<%dH'%len(faces), *(i & 0xffff for i in faces)))
+        f.write(struct.pack('<I', 1))
+        f.write(struct.pack('<4ff3f3fbBI20s', 1, 1, 1, 1, 5, 0, 0, 0, 0.5, 0.5, 0.5, -1, 1, len(faces), b''))
+        f.write(struct.pack('<H', bone_count))
+        for i in range(bone_count):
+            f.write(struct.pack('<20sHHBH3f', b'bone%d'%i, (i-1) & 0xffff, 0xffff, 1, 0, rand.random(), rand.random(), rand.random()))
+        f.write(struct.pack('<H', 0)) # IK
+        f.write(struct.pack('<H', morph_count + 1))
+        f.write(struct.pack('<20sIB', b'base', 0, 0))
+        for i in range(morph_count):
+            f.write(struct.pack('<20sIB', b'morph%d'%i, morph_size, 1))
+            for k in range(morph_size):
+                f.write(struct.pack('<I3f', rand.randrange(vertex_count), rand.random(), rand.random(), rand.random()))
+        f.write(struct.pack('<BBI', 0, 0, 0)) # display items
+
+def create_vmd_file(bone_count=300, frame_count=3000, morph_count=50, seed=0):
+    rand = random.Random(seed)
+    vmd_file = vmd.File()
+    vmd_file.header = vmd.Header()
+    vmd_file.header.model_name = 'synthetic'
+    vmd_file.boneAnimation = vmd.BoneAnimation()
+    for i in range(bone_count):
+        keys = vmd_file.boneAnimation['bone%d'%i]
+        for frame in range(frame_count):
+            k = vmd.BoneFrameKey()
+            k.frame_number = frame
+            k.location = [rand.random(), rand.random(), rand.random()]
+            k.rotation = [0.0, 0.0, rand.random(), 1.0]
+            k.interp = [20, 20, 0, 0, 20, 20, 20, 20, 107, 107, 107, 107, 107, 107, 107, 107]*4
+            keys.append(k)
+    vmd_file.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+    for i in range(morph_count):
+        keys = vmd_file.shapeKeyAnimation['morph%d'%i]
+        for frame in range(0, frame_count, 3):
+            k = vmd.ShapeKeyFrameKey()
+            k.frame_number = frame
+            k.weight = rand.random()
+            keys.append(k)
+    return vmd_file
+
+def save_vmd_file(path, **args):
+    vmd_file = create_vmd_file(**args)
+    vmd_file.save(filepath=path)
+    return vmd_file
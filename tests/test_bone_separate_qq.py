@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Quaternion, Vector
+
+from miu_mmd_tools.core import bone
+
+class _Bone:
+    def __init__(self, name, vector, head=(0, 0, 0), children_recursive=()):
+        self.name = name
+        self.vector = Vector(vector)
+        self.head = Vector(head)
+        self.children_recursive = list(children_recursive)
+
+class TestBoneSeparateQQ(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __random_quaternions(self, count=300):
+        rng = np.random.default_rng(0)
+        qqs = rng.normal(size=(count, 4))
+        qqs /= np.linalg.norm(qqs, axis=1)[:, None]
+        qqs[0] = (1, 0, 0, 0)
+        qqs[1] = (0, 1, 0, 0)
+        return qqs
+
+    def __global_x_axis(self, b):
+        """ The axis of get_global_x_axis() by the reference walk of children_recursive """
+        for cbone in b.children_recursive:
+            if cbone.name in bone.DISPLAY_BONE_PAIR.get(b.name, ()):
+                return (cbone.head - b.head).normalized()
+        return b.vector.normalized()
+
+    def __new_armature(self, name):
+        rng = np.random.default_rng(0)
+        obj = bpy.data.objects.new(name, bpy.data.armatures.new(name))
+        bpy.context.scene.collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.mode_set(mode='EDIT')
+        edit_bones = obj.data.edit_bones
+        # the pair bones of 上半身 are in the different distances
+        for name, parent in (('センター', None), ('グルーブ', 'センター'), ('上半身', 'グルーブ'), ('首', '上半身'),
+                             ('上半身2', '首'), ('上半身先', '上半身'), ('下半身', 'グルーブ'), ('左腕', '上半身2')):
+            b = edit_bones.new(name)
+            b.head = rng.normal(size=3)
+            b.tail = np.array(b.head) + rng.normal(size=3)
+            b.parent = edit_bones.get(parent or '')
+        bpy.ops.object.mode_set(mode='OBJECT')
+        for pb in obj.pose.bones:
+            pb.rotation_quaternion = rng.normal(size=4)
+        bpy.context.view_layer.update()
+        return obj
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_separate_local_qqs(self):
+        '''
+        '''
+        qqs = self.__random_quaternions()
+        arm = _Bone('左腕', (1, -0.3, 0.2), children_recursive=[_Bone('左ひじ', (1, 0, 0), head=(2, -1, 0))])
+        for b in (_Bone('arm.R', (1, -0.3, 0.2)), _Bone('arm.L', (-1, 0.1, -0.5)), _Bone('spine', (0.2, 0.1, 1)), _Bone('x', (1, 0, 0)), arm):
+            result = bone.separate_local_qqs(qqs, b)
+            self.assertEqual(len(result), 3)
+            for i, qq in enumerate(qqs):
+                expected = bone.separate_local_qq(Quaternion(qq), b)
+                for r, e in zip(result, expected):
+                    # q and -q are the same rotation
+                    sign = -1 if np.dot(r[i], e) < 0 else 1
+                    self.assertLess(np.abs(r[i]*sign - e).max(), 1e-4, b.name)
+
+        self.assertEqual([x.shape for x in bone.separate_local_qqs([], arm)], [(0, 4)]*3)
+
+    def test_global_x_axes(self):
+        '''
+        '''
+        obj = self.__new_armature('global_x_axes')
+        for bones in (obj.data.bones, obj.pose.bones):
+            for b in bones:
+                self.assertLess((bone.get_global_x_axis(b) - self.__global_x_axis(b)).length, 1e-6, b.name)
+        self.assertEqual(bone.get_display_pair_bone(obj.pose.bones['上半身']).name, '上半身先')
+        self.assertIsNone(bone.get_display_pair_bone(obj.pose.bones['下半身']))
+
+        # the pair bones follow the changed hierarchy
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.mode_set(mode='EDIT')
+        obj.data.edit_bones['上半身先'].parent = obj.data.edit_bones['左腕']
+        bpy.ops.object.mode_set(mode='OBJECT')
+        self.assertEqual(bone.get_display_pair_bone(obj.pose.bones['上半身']).name, '上半身2')
+        for b in obj.data.bones:
+            self.assertLess((bone.get_global_x_axis(b) - self.__global_x_axis(b)).length, 1e-6, b.name)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+from miu_mmd_tools.core import pmd
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestFileReadStream(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __to_data(self, obj):
+        if isinstance(obj, (list, tuple, pmx.MorphOffsetArray)):
+            return [self.__to_data(x) for x in obj]
+        if isinstance(obj, dict):
+            return {k:self.__to_data(v) for k, v in obj.items()}
+        if hasattr(obj, '__slots__'):
+            names = [k for c in type(obj).__mro__ for k in getattr(c, '__slots__', ())]
+            return (obj.__class__.__name__, self.__to_data({k:getattr(obj, k, None) for k in names}))
+        if hasattr(obj, '__dict__'):
+            return (obj.__class__.__name__, self.__to_data(vars(obj)))
+        return obj
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_pmx_mmap(self):
+        '''
+        '''
+        path = self.__output_path('file_read_stream.pmx')
+        synthetic_data.save_pmx_model(path, vertex_count=3000, morph_count=8, morph_size=100)
+        source_model = pmx.load(path)
+        result_model = pmx.load(path, use_mmap=True)
+        self.assertEqual(len(source_model.vertices), 3000)
+        self.assertEqual(self.__to_data(source_model), self.__to_data(result_model))
+
+        result_model = pmx.load(path, vertex_array=True, use_mmap=True)
+        self.assertEqual(self.__to_data(source_model.vertices), self.__to_data(list(result_model.vertices)))
+
+    def test_pmx_mmap_truncated(self):
+        '''
+        '''
+        path = self.__output_path('file_read_stream.pmx')
+        synthetic_data.save_pmx_model(path, vertex_count=300, morph_count=8, morph_size=10)
+        with open(path, 'rb') as f:
+            data = f.read()
+        truncated_path = self.__output_path('file_read_stream_truncated.pmx')
+        with open(truncated_path, 'wb') as f:
+            f.write(data[:len(data)//2])
+        source_model = pmx.load(truncated_path)
+        result_model = pmx.load(truncated_path, use_mmap=True)
+        self.assertEqual(self.__to_data(source_model), self.__to_data(result_model))
+
+    def test_pmd_mmap(self):
+        '''
+        '''
+        path = self.__output_path('file_read_stream.pmd')
+        synthetic_data.save_pmd_model(path, vertex_count=3000, morph_count=8, morph_size=100)
+        source_model = pmd.load(path)
+        result_model = pmd.load(path, use_mmap=True)
+        self.assertEqual(len(source_model.vertices), 3000)
+        self.assertEqual(self.__to_data(source_model), self.__to_data(result_model))
+
+    def test_vmd_mmap(self):
+        '''
+        '''
+        path = self.__output_path('file_read_stream.vmd')
+        synthetic_data.save_vmd_file(path, bone_count=10, frame_count=30, morph_count=5)
+        source_vmd, result_vmd = vmd.File(), vmd.File()
+        source_vmd.load(filepath=path)
+        result_vmd.load(filepath=path, use_mmap=True)
+        self.assertEqual(len(source_vmd.boneAnimation), 10)
+        for name in ('header', 'boneAnimation', 'shapeKeyAnimation', 'cameraAnimation', 'lampAnimation', 'selfShadowAnimation', 'propertyAnimation'):
+            self.assertEqual(self.__to_data(getattr(source_vmd, name)), self.__to_data(getattr(result_vmd, name)), name)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import sys
+import unittest
+
+from miu_mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestFileWriteStream(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_write_packed(self):
+        '''
+        '''
+        path = self.__output_path('file_write_stream.bin')
+        header = pmx.Header()
+        header.vertex_index_size, header.bone_index_size, header.rigid_index_size = 4, 2, 1
+        with pmx.FileWriteStream(path, header) as fs:
+            fs.writePacked('<%(vertex)s%(bone)s%(rigid)sf', 0xffffffff, -2, -1, 0.5)
+            fs.writeVectors((1, 2, 3), (4,))
+            fs.writeStr('abc')
+            for i in range(pmx.FileWriteStream.FLUSH_SIZE//4 + 1):
+                fs.writeInt(i)
+        with open(path, 'rb') as f:
+            data = f.read()
+        expected = struct.pack('<Ihbf', 0xffffffff, -2, -1, 0.5) + struct.pack('<4f', 1, 2, 3, 4)
+        expected += struct.pack('<i', 6) + 'abc'.encode('utf-16-le')
+        self.assertEqual(data[:len(expected)], expected)
+        self.assertEqual(len(data), len(expected) + 4*(pmx.FileWriteStream.FLUSH_SIZE//4 + 1))
+
+        with pmx.FileWriteStream(path, header) as fs:
+            self.assertRaises(struct.error, fs.writePacked, '<%(rigid)s', 128)
+
+    def test_round_trip(self):
+        '''
+        '''
+        path = self.__output_path('file_write_stream.pmx')
+        synthetic_data.save_pmx_model(path, vertex_count=3000, morph_count=8, morph_size=100, additional_uvs=2)
+        output_path = self.__output_path('file_write_stream2.pmx')
+        for vertex_array in (False, True):
+            pmx.save(output_path, pmx.load(path, vertex_array=vertex_array), add_uv_count=2)
+            with open(path, 'rb') as f0, open(output_path, 'rb') as f1:
+                self.assertEqual(f0.read(), f1.read())
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import time
+import unittest
+
+import numpy as np
+
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core.model_cache import ModelCache
+from miu_mmd_tools.core.pmx.importer import load_model
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(TESTS_DIR, 'output', 'model_cache')
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestModelCache(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        self.__path = os.path.join(TESTS_DIR, 'output', 'model_cache.pmx')
+        synthetic_data.save_pmx_model(self.__path, vertex_count=300, bone_count=10, morph_count=4, morph_size=30)
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __counted_loader(self, counter):
+        def __loader(filepath, **options):
+            counter.append(options)
+            return load_model(filepath, **options)
+        return __loader
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_get_put(self):
+        '''
+        '''
+        cache = ModelCache(CACHE_DIR)
+        key = cache.key(self.__path, sections=None)
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {'value':1}, filepath=self.__path)
+        self.assertEqual(cache.get(key), {'value':1})
+        self.assertEqual(len(cache.entries()), 1)
+        self.assertNotEqual(key, cache.key(self.__path, sections=['vertices']))
+
+        # only the values of plain types, numpy arrays and pmx classes are cached
+        value = {(1, 'a'):[None, 1.5, b'\x00\x01'], 'array':np.arange(3), 'coordinate':pmx.Coordinate((1, 0, 0), (0, 0, 1))}
+        cache.put(key, value)
+        result = cache.get(key)
+        self.assertEqual(result[(1, 'a')], [None, 1.5, b'\x00\x01'])
+        self.assertTrue((result['array'] == np.arange(3)).all())
+        self.assertIsInstance(result['coordinate'], pmx.Coordinate)
+        self.assertEqual(result['coordinate'].z_axis, (0, 0, 1))
+        self.assertRaises(TypeError, cache.put, key, {'value':self})
+
+        # a broken entry is removed
+        with open(os.path.join(CACHE_DIR, key + ModelCache.ENTRY_EXT), 'wb') as f:
+            f.write(b'broken')
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(len(cache.entries()), 0)
+
+    def test_load(self):
+        '''
+        '''
+        counter = []
+        loader = self.__counted_loader(counter)
+        cache = ModelCache(CACHE_DIR)
+        model, vertex_map = cache.load(self.__path, loader, clean_model=True, remove_doubles=True)
+        result_model, result_map = cache.load(self.__path, loader, clean_model=True, remove_doubles=True)
+        self.assertEqual(len(counter), 1)
+        self.assertIsInstance(result_model.vertices, pmx.VertexArray)
+        self.assertEqual(len(result_model.vertices), len(model.vertices))
+        self.assertTrue((result_model.vertices.co == model.vertices.co).all())
+        self.assertEqual([len(m.offsets) for m in result_model.morphs], [len(m.offsets) for m in model.morphs])
+        self.assertEqual(result_map, vertex_map)
+
+        # other options are loaded again
+        cache.load(self.__path, loader, clean_model=False)
+        self.assertEqual(len(counter), 2)
+
+        # a changed file is loaded again
+        synthetic_data.save_pmx_model(self.__path, vertex_count=200, bone_count=10, morph_count=4, morph_size=30)
+        model, vertex_map = cache.load(self.__path, loader, clean_model=True, remove_doubles=True)
+        self.assertEqual(len(counter), 3)
+        self.assertEqual(len(cache.entries()), 3)
+
+        self.assertEqual(cache.invalidate(self.__path), 3)
+        self.assertEqual(len(cache.entries()), 0)
+
+    def test_load_sections(self):
+        '''
+        '''
+        counter = []
+        loader = self.__counted_loader(counter)
+        cache = ModelCache(CACHE_DIR)
+        model, vertex_map = cache.load(self.__path, loader, sections={'vertices', 'faces'})
+        morph_count = len(model.morphs)
+
+        # the skipped sections of a cached model are loaded from the requesting file
+        copy_path = os.path.join(TESTS_DIR, 'output', 'model_cache_copy.pmx')
+        shutil.copyfile(self.__path, copy_path)
+        os.remove(self.__path)
+        model, vertex_map = cache.load(copy_path, loader, sections={'vertices', 'faces'})
+        self.assertEqual(len(counter), 1)
+        self.assertEqual(model.filepath, copy_path)
+        self.assertEqual(len(model.morphs), morph_count)
+
+    def test_load_textures(self):
+        '''
+        '''
+        counter = []
+        loader = self.__counted_loader(counter)
+        cache = ModelCache(CACHE_DIR)
+        paths = [os.path.join(TESTS_DIR, 'output', 'model_cache_%s'%x, 'model.pmx') for x in 'ab']
+        shutil.rmtree(os.path.dirname(paths[0]), ignore_errors=True)
+        os.makedirs(os.path.dirname(paths[0]))
+        model = synthetic_data.create_pmx_model(vertex_count=30, bone_count=3, morph_count=0)
+        for name in ('texture.png', os.path.join('sub', 'texture.png')):
+            texture = pmx.Texture()
+            texture.path = os.path.join(os.path.dirname(paths[0]), name)
+            model.textures.append(texture)
+        pmx.save(paths[0], model, add_uv_count=1)
+        shutil.rmtree(os.path.dirname(paths[1]), ignore_errors=True)
+        shutil.copytree(os.path.dirname(paths[0]), os.path.dirname(paths[1]))
+
+        # the texture paths of a cached model are in the folder of the requesting file
+        for path in paths:
+            model, vertex_map = cache.load(path, loader)
+            folder = os.path.dirname(path)
+            self.assertEqual([x.path for x in model.textures],
+                             [os.path.join(folder, 'texture.png'), os.path.join(folder, 'sub', 'texture.png')])
+        self.assertEqual(len(counter), 1)
+
+    def test_evict(self):
+        '''
+        '''
+        cache = ModelCache(CACHE_DIR)
+        for i in range(3):
+            cache.put('key%d'%i, bytes(1000))
+            os.utime(os.path.join(CACHE_DIR, 'key%d%s'%(i, ModelCache.ENTRY_EXT)), (i, i))
+        cache.get('key0') # key0 is the most recently used entry
+        cache.max_size = cache.size()*5//6
+        cache.evict()
+        self.assertEqual(sorted(x[0] for x in cache.entries()), ['key0', 'key2'])
+        self.assertLessEqual(cache.size(), cache.max_size)
+
+        self.assertEqual(cache.invalidate(), 2)
+        self.assertEqual(cache.size(), 0)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
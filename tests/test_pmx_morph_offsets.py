@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import sys
+import unittest
+
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core.pmx.importer import _PMXCleaner
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestPmxMorphOffsets(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __offset_data(self, model):
+        return [(m.name, [(x.index, tuple(x.offset)) for x in m.offsets]) for m in model.morphs]
+
+    def __create_model(self):
+        model = synthetic_data.create_pmx_model(vertex_count=300, bone_count=10, morph_count=8, morph_size=60)
+        # vertices 3k+1 are doubles of vertices 3k
+        for i in range(0, 297, 3):
+            model.vertices[i+1].co, model.vertices[i+1].uv = model.vertices[i].co, model.vertices[i].uv
+        # vertices 297-299 are not used
+        model.faces[-1] = (0, 1, 3)
+        return model
+
+    def __to_lists(self, model):
+        for m in model.morphs:
+            if isinstance(m.offsets, pmx.MorphOffsetArray):
+                m.offsets = list(m.offsets)
+        return model
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_offset_array(self):
+        '''
+        '''
+        offsets = pmx.MorphOffsetArray(pmx.UVMorphOffset, 4)
+        for i in range(100):
+            o = pmx.UVMorphOffset()
+            o.index, o.offset = i*2, (i, 0.5, 0, -i)
+            offsets.append(o)
+        self.assertEqual(len(offsets), 100)
+        self.assertEqual(offsets.index.dtype.name, 'int32')
+        self.assertEqual(offsets.offset.shape, (100, 4))
+        self.assertIsInstance(offsets[-1], pmx.UVMorphOffset)
+        self.assertEqual((offsets[-1].index, offsets[-1].offset), (198, (99.0, 0.5, 0.0, -99.0)))
+        self.assertEqual([x.index for x in offsets[10:13]], [20, 22, 24])
+        self.assertEqual(len(offsets[offsets.index < 10]), 5)
+        self.assertRaises(IndexError, offsets.__getitem__, 100)
+
+        morph = pmx.UVMorph('uv', '', 4)
+        self.assertIsInstance(morph.offsets, pmx.MorphOffsetArray)
+
+    def test_save_load(self):
+        '''
+        '''
+        model = self.__create_model()
+        path = os.path.join(TESTS_DIR, 'output', 'morph_offsets.pmx')
+        pmx.save(path, model, add_uv_count=1)
+        result_model = pmx.load(path)
+        self.assertEqual(self.__offset_data(model), self.__offset_data(result_model))
+
+        # offset arrays and lists of offset objects are saved to the same data
+        output_path = os.path.join(TESTS_DIR, 'output', 'morph_offsets2.pmx')
+        pmx.save(output_path, self.__to_lists(result_model), add_uv_count=1)
+        with open(path, 'rb') as f0, open(output_path, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+        model.morphs[0].offsets.index[0] = len(model.vertices) + 1000000
+        self.assertRaises(struct.error, pmx.save, output_path, model, add_uv_count=1)
+
+    def test_cleaner(self):
+        '''
+        '''
+        path = os.path.join(TESTS_DIR, 'output', 'morph_offsets.pmx')
+        pmx.save(path, self.__create_model(), add_uv_count=1)
+        for mesh_only in (False, True):
+            source_model = self.__to_lists(pmx.load(path))
+            result_model = pmx.load(path)
+            self.assertEqual(self.__offset_data(source_model), self.__offset_data(result_model))
+
+            offset_count = sum(len(m.offsets) for m in result_model.morphs)
+            for model in (source_model, result_model):
+                _PMXCleaner.clean(model, mesh_only)
+                _PMXCleaner.remove_doubles(model, mesh_only)
+            if not mesh_only:
+                self.assertLess(sum(len(m.offsets) for m in result_model.morphs), offset_count)
+            self.assertIsInstance(result_model.morphs[0].offsets, pmx.MorphOffsetArray)
+            self.assertEqual(self.__offset_data(source_model), self.__offset_data(result_model))
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import sys
+import unittest
+
+from miu_mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestPmxSections(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __to_data(self, obj):
+        if isinstance(obj, (list, tuple, pmx.MorphOffsetArray)):
+            return [self.__to_data(x) for x in obj]
+        if isinstance(obj, dict):
+            return {k:self.__to_data(v) for k, v in obj.items()}
+        if hasattr(obj, '__slots__'):
+            names = [k for c in type(obj).__mro__ for k in getattr(c, '__slots__', ())]
+            return (obj.__class__.__name__, self.__to_data({k:getattr(obj, k, None) for k in names}))
+        if hasattr(obj, '__dict__'):
+            return (obj.__class__.__name__, self.__to_data(vars(obj)))
+        return obj
+
+    def __create_model(self):
+        model = synthetic_data.create_pmx_model(vertex_count=600, bone_count=40, morph_count=8, morph_size=50)
+        for i, b in enumerate(model.bones):
+            if i % 3 == 1:
+                b.displayConnection = (0.0, 1.0, 0.0)
+            if i % 5 == 2:
+                b.hasAdditionalRotate = True
+                b.additionalTransform = (0, 0.5)
+            if i % 7 == 3:
+                b.axis = (1.0, 0.0, 0.0)
+            if i % 11 == 4:
+                b.localCoordinate = pmx.Coordinate((1.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+            if i % 13 == 5:
+                b.isIK = True
+                b.target = 0
+                link = pmx.IKLink()
+                link.target = 1
+                link.minimumAngle, link.maximumAngle = (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0)
+                b.ik_links = [link]
+
+        texture = pmx.Texture()
+        texture.path = os.path.join(TESTS_DIR, 'output', 'texture.png')
+        model.textures.append(texture)
+        model.materials[0].texture = 0
+
+        bone_morph = pmx.BoneMorph('bone_morph', '', 4)
+        offset = pmx.BoneMorphOffset()
+        offset.index, offset.location_offset, offset.rotation_offset = 1, (0, 1, 0), (0, 0, 0, 1)
+        bone_morph.offsets.append(offset)
+        group_morph = pmx.GroupMorph('group_morph', '', 4)
+        offset = pmx.GroupMorphOffset()
+        offset.morph, offset.factor = 0, 0.5
+        group_morph.offsets.append(offset)
+        model.morphs += [bone_morph, group_morph]
+
+        display = pmx.Display()
+        display.name = display.name_e = 'items'
+        display.data = [(0, 1), (1, 0)]
+        model.display.append(display)
+
+        for i in range(3):
+            rigid = pmx.Rigid()
+            rigid.name = rigid.name_e = 'rigid%d'%i
+            rigid.bone = i
+            rigid.size, rigid.location, rigid.rotation = (1, 1, 1), (0, i, 0), (0, 0, 0)
+            rigid.velocity_attenuation = rigid.rotation_attenuation = rigid.bounce = rigid.friction = 0.5
+            model.rigids.append(rigid)
+        for i in range(2):
+            joint = pmx.Joint()
+            joint.name = joint.name_e = 'joint%d'%i
+            joint.src_rigid, joint.dest_rigid = i, i + 1
+            joint.location = joint.rotation = joint.spring_constant = joint.spring_rotation_constant = (0, 0, 0)
+            joint.minimum_location = joint.minimum_rotation = (-1, -1, -1)
+            joint.maximum_location = joint.maximum_rotation = (1, 1, 1)
+            model.joints.append(joint)
+        return model
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_sections(self):
+        '''
+        '''
+        path = os.path.join(TESTS_DIR, 'output', 'sections.pmx')
+        pmx.save(path, self.__create_model(), add_uv_count=1)
+        source_model = pmx.load(path)
+        source_data = self.__to_data([getattr(source_model, name) for name in pmx.Model.SECTIONS])
+        self.assertEqual(len(source_model.rigids), 3)
+
+        for use_mmap in (False, True):
+            for name in pmx.Model.SECTIONS:
+                for sections in ((name,), tuple(x for x in pmx.Model.SECTIONS if x != name)):
+                    result_model = pmx.load(path, use_mmap=use_mmap, sections=sections)
+                    for x in pmx.Model.SECTIONS:
+                        self.assertEqual(x in vars(result_model), x in sections, x)
+                    result_data = self.__to_data([getattr(result_model, x) for x in pmx.Model.SECTIONS])
+                    self.assertEqual(source_data, result_data, str(sections))
+
+        # the skipped sections are loaded by saving the model
+        result_model = pmx.load(path, sections=('bones',))
+        output_path = os.path.join(TESTS_DIR, 'output', 'sections2.pmx')
+        pmx.save(output_path, result_model, add_uv_count=1)
+        with open(path, 'rb') as f0, open(output_path, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+        with self.assertRaises(ValueError):
+            pmx.load(path, sections=('bone',))
+
+    def test_skip_morphs(self):
+        '''
+        '''
+        path = os.path.join(TESTS_DIR, 'output', 'morphs.bin')
+        header = pmx.Header()
+        header.rigid_index_size = 2
+        # (type index, count, offset size) of a flip morph and an impulse morph
+        morphs = ((9, 3, 1 + 4), (10, 2, 2 + 25))
+        with open(path, 'wb') as f:
+            for type_index, count, offset_size in morphs:
+                f.write(struct.pack('<iibbi', 0, 0, 4, type_index, count) + bytes(count*offset_size))
+            f.write(struct.pack('<iibbi', 0, 0, 4, 11, 0))
+        with pmx.FileReadStream(path, header) as fs:
+            position = 0
+            for type_index, count, offset_size in morphs:
+                pmx.Morph.skip(fs)
+                position += 14 + count*offset_size
+                self.assertEqual(fs.tell(), position)
+            with self.assertRaises(pmx.InvalidFileError):
+                pmx.Morph.skip(fs)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
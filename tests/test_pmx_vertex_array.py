@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import struct
+import unittest
+
+from miu_mmd_tools.core import pmx
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'samples')
+
+class TestPmxVertexArray(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __list_sample_files(self):
+        ret = []
+        for root, dirs, files in os.walk(os.path.join(SAMPLES_DIR, 'pmx')):
+            for name in files:
+                if name.lower().endswith('.pmx'):
+                    ret.append(os.path.join(root, name))
+        return ret
+
+    def __create_model(self, additional_uvs=2, bone_count=300):
+        model = pmx.Model()
+        model.name = model.name_e = 'vertex_array'
+        for i in range(bone_count):
+            b = pmx.Bone()
+            b.name = b.name_e = 'bone%d'%i
+            b.location = (0, i, 0)
+            b.parent = i - 1
+            model.bones.append(b)
+
+        weight_types = {
+            pmx.BoneWeight.BDEF1: ([-1], []),
+            pmx.BoneWeight.BDEF2: ([1, 299], [0.25]),
+            pmx.BoneWeight.BDEF4: ([3, 2, 1, -1], [0.5, 0.25, 0.25, 0]),
+            pmx.BoneWeight.SDEF: ([5, 4], pmx.BoneWeightSDEF(0.75, (1, 2, 3), (4, 5, 6), (7, 8, 9))),
+            }
+        for i in range(1000):
+            v = pmx.Vertex()
+            v.co = (i, -i, i*0.5)
+            v.normal = (0, 1, 0)
+            v.uv = (i/1000, 1-i/1000)
+            v.additional_uvs = [(i, 0, 0, k) for k in range(additional_uvs)]
+            v.edge_scale = (i % 3)/2
+            v.weight = pmx.BoneWeight()
+            v.weight.type = i % 4
+            v.weight.bones, v.weight.weights = weight_types[v.weight.type]
+            model.vertices.append(v)
+        model.faces = [(i, i+1, i+2) for i in range(0, 999, 3)]
+        return model
+
+    def __vertex_key(self, vertex):
+        weight = vertex.weight
+        weights = weight.weights
+        if isinstance(weights, pmx.BoneWeightSDEF):
+            weights = (weights.weight, weights.c, weights.r0, weights.r1)
+        return (tuple(vertex.co), tuple(vertex.normal), tuple(vertex.uv),
+                [tuple(x) for x in vertex.additional_uvs], vertex.edge_scale,
+                weight.type, list(weight.bones), tuple(weights))
+
+    def __check_vertices(self, filepath):
+        source_model = pmx.load(filepath)
+        result_model = pmx.load(filepath, vertex_array=True)
+        self.assertIsInstance(result_model.vertices, pmx.VertexArray)
+        self.assertEqual(len(source_model.vertices), len(result_model.vertices))
+        self.assertEqual(len(source_model.faces), len(result_model.faces))
+        self.assertEqual(len(source_model.bones), len(result_model.bones))
+        self.assertEqual(len(source_model.morphs), len(result_model.morphs))
+        for i, (v0, v1) in enumerate(zip(source_model.vertices, result_model.vertices)):
+            self.assertEqual(self.__vertex_key(v0), self.__vertex_key(v1), 'vertex %d'%i)
+
+        vertex_array = result_model.vertices
+        self.assertEqual(vertex_array.co.shape, (len(vertex_array), 3))
+        self.assertTrue(vertex_array.co.flags['C_CONTIGUOUS'])
+        self.assertEqual(vertex_array.additional_uvs.shape[1], result_model.header.additional_uvs)
+        return result_model
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_vertex_array(self):
+        '''
+        '''
+        output_pmx = os.path.join(TESTS_DIR, 'output', 'vertex_array.pmx')
+        pmx.save(output_pmx, self.__create_model(), add_uv_count=2)
+        result_model = self.__check_vertices(output_pmx)
+
+        subset = result_model.vertices[[3, 2, 1]]
+        self.assertEqual(len(subset), 3)
+        self.assertEqual(tuple(subset[0].co), tuple(result_model.vertices[3].co))
+
+        # the view can be saved as a sequence of pmx.Vertex
+        output_pmx2 = os.path.join(TESTS_DIR, 'output', 'vertex_array2.pmx')
+        pmx.save(output_pmx2, result_model, add_uv_count=2)
+        with open(output_pmx, 'rb') as f0, open(output_pmx2, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+    def test_from_vertices(self):
+        '''
+        '''
+        model = self.__create_model()
+        output_pmx = os.path.join(TESTS_DIR, 'output', 'vertex_array.pmx')
+        pmx.save(output_pmx, model, add_uv_count=2)
+
+        vertices = pmx.load(output_pmx).vertices
+        model.vertices = pmx.VertexArray.fromVertices(model.vertices, 2)
+        self.assertEqual(len(model.vertices), len(vertices))
+        for i, (v0, v1) in enumerate(zip(vertices, model.vertices)):
+            self.assertEqual(self.__vertex_key(v0), self.__vertex_key(v1), 'vertex %d'%i)
+
+        # the bulk encoder writes the same data as Vertex.save()
+        output_pmx2 = os.path.join(TESTS_DIR, 'output', 'vertex_array2.pmx')
+        pmx.save(output_pmx2, model, add_uv_count=2)
+        with open(output_pmx, 'rb') as f0, open(output_pmx2, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+        model.vertices.bones[0, 0] = 40000
+        self.assertRaises(struct.error, pmx.save, output_pmx2, model, add_uv_count=2)
+
+    def test_vertex_array_samples(self):
+        '''
+        '''
+        for filepath in self.__list_sample_files():
+            self.__check_vertices(filepath)
+
+if __name__ == '__main__':
+    import sys
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
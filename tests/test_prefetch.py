@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+from miu_mmd_tools.core.prefetch import prefetch
+from miu_mmd_tools.core.pmx.importer import PMXImporter
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_order(self):
+        '''
+        '''
+        def __func(x):
+            time.sleep(0.001*(10 - x))
+            return x*x
+        self.assertEqual(list(prefetch(__func, range(10))), [(x, x*x) for x in range(10)])
+        self.assertEqual(list(prefetch(__func, range(10), max_workers=1)), [(x, x*x) for x in range(10)])
+        self.assertEqual(list(prefetch(__func, [])), [])
+
+    def test_bounded(self):
+        '''
+        '''
+        lock = threading.Lock()
+        started = []
+        def __func(x):
+            with lock:
+                started.append(x)
+            return x
+        for item, result in prefetch(__func, range(20), max_workers=2, max_pending=3):
+            time.sleep(0.005)
+            with lock:
+                # the current item and at most max_pending items ahead of it
+                self.assertLessEqual(len(started), item + 1 + 3)
+
+    def test_error(self):
+        '''
+        '''
+        def __func(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        results = []
+        with self.assertRaises(ValueError):
+            for item, result in prefetch(__func, range(10), max_workers=2):
+                results.append(result)
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_load_models(self):
+        '''
+        '''
+        filepaths = []
+        for i in range(3):
+            filepath = os.path.join(TESTS_DIR, 'output', 'prefetch%d.pmx'%i)
+            synthetic_data.save_pmx_model(filepath, vertex_count=300 + i*30, bone_count=10, morph_count=4, morph_size=30)
+            filepaths.append(filepath)
+        args = {'types':{'MESH', 'ARMATURE', 'MORPHS'}, 'clean_model':True, 'remove_doubles':True}
+        for filepath, (model, vertex_map) in prefetch(lambda x: PMXImporter.load(filepath=x, **args), filepaths):
+            source_model, source_map = PMXImporter.load(filepath=filepath, **args)
+            self.assertEqual(model.filepath, filepath)
+            self.assertEqual(len(model.vertices), len(source_model.vertices))
+            self.assertTrue((model.vertices.co == source_model.vertices.co).all())
+            self.assertEqual(model.faces, source_model.faces)
+            self.assertEqual(vertex_map, source_map)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
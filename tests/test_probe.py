@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sys
+import unittest
+
+from miu_mmd_tools.core import pmd
+from miu_mmd_tools.core import pmx
+from miu_mmd_tools.core import scanner
+from miu_mmd_tools.core import vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, *names):
+        return os.path.join(TESTS_DIR, 'output', *names)
+
+    def __check_pmx(self, info, model):
+        self.assertEqual(info['format'], 'pmx')
+        self.assertEqual(info['encoding'], model.header.encoding.charset)
+        self.assertEqual(info['additional_uvs'], model.header.additional_uvs)
+        self.assertEqual(info['bone_index_size'], model.header.bone_index_size)
+        for key in ('name', 'name_e', 'comment', 'comment_e'):
+            self.assertEqual(info[key], getattr(model, key), key)
+        for name in pmx.Model.SECTIONS:
+            self.assertEqual(info[name], len(getattr(model, name)), name)
+
+    def __check_pmd(self, info, model):
+        self.assertEqual(info['format'], 'pmd')
+        for key in ('name', 'name_e', 'comment', 'comment_e'):
+            self.assertEqual(info[key], getattr(model, key), key)
+        for key, name in (('vertices', 'vertices'), ('faces', 'faces'), ('materials', 'materials'), ('bones', 'bones'),
+                          ('iks', 'iks'), ('morphs', 'morphs'), ('rigids', 'rigid_bodies'), ('joints', 'joints')):
+            self.assertEqual(info[key], len(getattr(model, name)), key)
+
+    def __check_vmd(self, info, vmd_file):
+        self.assertEqual(info['format'], 'vmd')
+        self.assertEqual(info['model_name'], vmd_file.header.model_name)
+        self.assertEqual(info['bone_names'], set(vmd_file.boneAnimation.keys()))
+        self.assertEqual(info['shape_key_names'], set(vmd_file.shapeKeyAnimation.keys()))
+        self.assertEqual(info['bone_keys'], sum(len(x) for x in vmd_file.boneAnimation.values()))
+        self.assertEqual(info['shape_keys'], sum(len(x) for x in vmd_file.shapeKeyAnimation.values()))
+        self.assertEqual(info['camera_keys'], len(vmd_file.cameraAnimation))
+        frame_numbers = [k.frame_number for x in vmd_file.boneAnimation.values() for k in x]
+        frame_numbers += [k.frame_number for x in vmd_file.shapeKeyAnimation.values() for k in x]
+        frame_numbers += [k.frame_number for k in vmd_file.cameraAnimation]
+        self.assertEqual(info['frame_range'], (min(frame_numbers), max(frame_numbers)))
+
+    def __create_files(self, directory):
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(os.path.join(directory, 'sub'))
+        synthetic_data.save_pmx_model(os.path.join(directory, 'model.pmx'), vertex_count=500, morph_count=6, morph_size=20)
+        synthetic_data.save_pmd_model(os.path.join(directory, 'sub', 'model.pmd'), vertex_count=500, morph_count=6, morph_size=20)
+        vmd_file = synthetic_data.create_vmd_file(bone_count=5, frame_count=20, morph_count=3)
+        vmd_file.cameraAnimation = vmd.CameraAnimation()
+        for frame in (3, 50):
+            k = vmd.CameraKeyFrameKey()
+            k.frame_number = frame
+            k.location, k.rotation, k.interp, k.angle = [0, 0, 0], [0, 0, 0], [20]*24, 30
+            vmd_file.cameraAnimation.append(k)
+        vmd_file.save(filepath=os.path.join(directory, 'sub', 'motion.vmd'))
+        with open(os.path.join(directory, 'broken.pmx'), 'wb') as f:
+            f.write(b'not a pmx file')
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_probe(self):
+        '''
+        '''
+        directory = self.__output_path('probe')
+        self.__create_files(directory)
+
+        pmx_path = os.path.join(directory, 'model.pmx')
+        for use_mmap in (False, True):
+            self.__check_pmx(pmx.probe(pmx_path, use_mmap=use_mmap), pmx.load(pmx_path))
+
+        pmd_path = os.path.join(directory, 'sub', 'model.pmd')
+        for use_mmap in (False, True):
+            self.__check_pmd(pmd.probe(pmd_path, use_mmap=use_mmap), pmd.load(pmd_path))
+
+        vmd_path = os.path.join(directory, 'sub', 'motion.vmd')
+        vmd_file = vmd.File()
+        vmd_file.load(filepath=vmd_path)
+        for use_mmap in (False, True):
+            self.__check_vmd(vmd.probe(vmd_path, use_mmap=use_mmap), vmd_file)
+
+    def test_scan_directory(self):
+        '''
+        '''
+        directory = self.__output_path('probe')
+        self.__create_files(directory)
+        for use_threads in (True, False):
+            results = {path:(info, error) for path, info, error in scanner.scan_directory(directory, max_workers=2, chunk_size=1, use_threads=use_threads)}
+            self.assertEqual(set(results.keys()), set(scanner.iter_files(directory)))
+            self.assertEqual(len(results), 4)
+            info, error = results[os.path.join(directory, 'broken.pmx')]
+            self.assertIsNone(info)
+            self.assertIsInstance(error, pmx.InvalidFileError)
+            info, error = results[os.path.join(directory, 'sub', 'model.pmd')]
+            self.assertIsNone(error)
+            self.assertEqual(info['vertices'], 500)
+
+        self.assertEqual(list(scanner.iter_files(directory, recursive=False, extensions=['.PMX'])),
+                         [os.path.join(directory, 'broken.pmx'), os.path.join(directory, 'model.pmx')])
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Vector
+
+from miu_mmd_tools.core.vmd import importer
+from miu_mmd_tools.core.vmd.importer import _FnBezier
+
+class TestVmdBezier(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __grid(self, step=8):
+        values = list(range(0, 128, step)) + [127]
+        return [v.ravel()/127.0 for v in np.meshgrid(values, values, values, values, indexing='ij')]
+
+    def __roots(self, x1, x2, x):
+        """ The roots of the scalar solver, which can miss the roots at t=0 and t=1 """
+        bz = _FnBezier(Vector((0, 0)), Vector((x1, 0)), Vector((x2, 0)), Vector((1, 0)))
+        return list(bz._FnBezier__find_roots(1 + 3*(x1 - x2), 3*(x2 - 2*x1), 3*x1, -x))
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_solve(self):
+        '''
+        '''
+        x1, y1, x2, y2 = self.__grid()
+        x = np.linspace(0, 1, 21)
+        t, y = _FnBezier.solve(x1[:, None], y1[:, None], x2[:, None], y2[:, None], x)
+        self.assertEqual(t.shape, (len(x1), len(x)))
+        self.assertTrue(((0 <= t) & (t <= 1)).all())
+        u = 1 - t
+        x_t = 3*u*u*t*x1[:, None] + 3*u*t*t*x2[:, None] + t*t*t
+        self.assertLess(np.abs(x_t - x).max(), 1e-9)
+        self.assertLess(np.abs(3*u*u*t*y1[:, None] + 3*u*t*t*y2[:, None] + t*t*t - y).max(), 1e-12)
+        self.assertTrue((t[:, 0] == 0).all() and (t[:, -1] == 1).all())
+
+        # the t of the scalar solver, the solutions of the triple roots differ more
+        count = 0
+        for i in range(0, len(x1), 97):
+            for j in range(len(x)):
+                roots = self.__roots(x1[i], x2[i], x[j])
+                if roots:
+                    self.assertAlmostEqual(t[i, j], roots[0], delta=2**-importer._BEZIER_BISECTIONS)
+                    count += 1
+        self.assertGreater(count, 0)
+
+    def test_axis_to_ts(self):
+        '''
+        '''
+        bz = _FnBezier(Vector((10, 1)), Vector((15, 3)), Vector((18, -2)), Vector((30, 0)))
+        frames = np.arange(11, 30)
+        ts = bz.axis_to_ts(frames).tolist()
+        for f, t in zip(frames, ts):
+            self.assertAlmostEqual(bz.evaluate(t).x, f, places=4)
+            self.assertAlmostEqual(bz.axis_to_t(f), t)
+
+        # split the rest of the curve at each frame
+        rest, prev_t = bz, 0.0
+        for f, t in zip(frames, ts):
+            head, rest, pt = rest.split((t - prev_t)/(1 - prev_t))
+            prev_t = t
+            self.assertAlmostEqual(pt.x, f, places=4)
+            self.assertAlmostEqual(pt.y, bz.evaluate(t).y, places=4)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Euler, Matrix, Quaternion, Vector
+
+from miu_mmd_tools.core import quaternions
+from miu_mmd_tools.core.vmd import importer
+
+class _PoseBone:
+    def __init__(self, matrix_local, matrix, matrix_basis, location):
+        self.bone = type('Bone', (), {'matrix_local':matrix_local})()
+        self.matrix = matrix
+        self.matrix_basis = matrix_basis
+        self.location = location
+
+class TestVmdBoneConverter(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __pose_bone(self):
+        matrix_local = Matrix.Rotation(0.7, 4, Vector((1, 2, 3)).normalized())
+        matrix = Matrix.Rotation(-1.2, 4, Vector((0.3, -1, 0.5)).normalized())
+        matrix_basis = Euler((0.4, -0.2, 1.1)).to_matrix().to_4x4()
+        return _PoseBone(matrix_local, matrix, matrix_basis, Vector((0.1, -0.5, 2.0)))
+
+    def __random_arrays(self, count=200):
+        rng = np.random.default_rng(0)
+        rotations = rng.normal(size=(count, 4))
+        rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+        rotations[0] = (0, 0, 0, 1)
+        rotations[1] = (0, 0, 0, -1)
+        return rng.normal(size=(count, 3)), rotations
+
+    def __assert_converted(self, converter, locations, rotations):
+        expected = [tuple(converter.convert_location(x)) for x in locations]
+        self.assertLess(np.abs(converter.convert_locations(locations) - expected).max(), 1e-5)
+
+        expected = np.array([tuple(converter.convert_rotation(x)) for x in rotations])
+        result = converter.convert_rotations(rotations)
+        self.assertEqual(result.shape, expected.shape)
+        # q and -q are the same rotation
+        signs = np.where((result*expected).sum(axis=1) < 0, -1, 1)[:, None]
+        self.assertLess(np.abs(result*signs - expected).max(), 1e-5)
+
+        self.assertEqual(converter.convert_locations([]).shape, (0, 3))
+        self.assertEqual(converter.convert_rotations([]).shape, (0, 4))
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_bone_converter(self):
+        '''
+        '''
+        locations, rotations = self.__random_arrays()
+        for invert in (False, True):
+            converter = importer.BoneConverter(self.__pose_bone(), 0.08, invert=invert)
+            self.__assert_converted(converter, locations, rotations)
+
+    def test_bone_converter_pose_mode(self):
+        '''
+        '''
+        locations, rotations = self.__random_arrays()
+        for invert in (False, True):
+            converter = importer.BoneConverterPoseMode(self.__pose_bone(), 0.08, invert=invert)
+            self.__assert_converted(converter, locations, rotations)
+
+    def test_quaternion_products(self):
+        '''
+        '''
+        _, rotations = self.__random_arrays()
+        q0 = quaternions.toQuaternions(rotations)
+        q1 = q0[::-1]
+        expected = [tuple(Quaternion(a) @ Quaternion(b)) for a, b in zip(q0, q1)]
+        self.assertLess(np.abs(quaternions.multiplyQuaternions(q0, q1) - expected).max(), 1e-6)
+
+    def test_compatible_quaternions(self):
+        '''
+        '''
+        _, rotations = self.__random_arrays()
+        q = quaternions.toQuaternions(rotations)
+        prev_rot = Quaternion((0, 0, 0, -1))
+        expected = []
+        for rot in q:
+            curr_rot = Quaternion(rot)
+            t1 = sum((a - b)**2 for a, b in zip(prev_rot, curr_rot))
+            t2 = sum((a + b)**2 for a, b in zip(prev_rot, curr_rot))
+            curr_rot = -curr_rot if t2 < t1 else curr_rot
+            expected.append(tuple(curr_rot))
+            prev_rot = curr_rot
+        result = quaternions.compatibleQuaternions(q, Quaternion((0, 0, 0, -1)))
+        self.assertLess(np.abs(result - expected).max(), 1e-6)
+
+        # without prev_rot, the first rotation is kept
+        result = quaternions.compatibleQuaternions(q)
+        sign = np.sign(np.dot(q[0], expected[0]))
+        self.assertLess(np.abs(result - np.array(expected)*sign).max(), 1e-6)
+
+        # the fixed quaternions are kept, and the next ones are compatible with them
+        fixed = np.zeros(len(q), dtype=bool)
+        fixed[5::7] = True
+        prev_rot = None
+        expected = []
+        for rot, is_fixed in zip(q, fixed):
+            curr_rot = Quaternion(rot)
+            if not is_fixed and prev_rot is not None and np.dot(prev_rot, curr_rot) < 0:
+                curr_rot = -curr_rot
+            expected.append(tuple(curr_rot))
+            prev_rot = curr_rot
+        result = quaternions.compatibleQuaternions(q, fixed=fixed)
+        self.assertLess(np.abs(result - expected).max(), 1e-6)
+        self.assertTrue((result[fixed] == q[fixed]).all())
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+
+from miu_mmd_tools.core.vmd import importer
+from miu_mmd_tools.operators.view import FlipPose
+from miu_mmd_tools.translations import MMDTranslator
+
+class TestVmdBoneMapper(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __translator(self, rows):
+        translator = MMDTranslator()
+        translator.load_from_stream(['"%s","%s"\n'%row for row in rows])
+        return translator
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_renamed_bone_mapper(self):
+        '''
+        '''
+        names = ['左腕', '右ひじ', '腕_L', '頭', 'センター']
+        translator = self.__translator([('腕', 'arm'), ('頭', 'head')])
+        mapper = importer.RenamedBoneMapper(rename_LR_bones=True, translator=translator)
+        expected = [mapper._RenamedBoneMapper__translate(x) for x in names]
+        self.assertEqual([mapper.translate(x) for x in names], expected)
+        self.assertEqual([mapper.translate(x) for x in names], expected)
+        self.assertEqual(mapper.translate('左腕'), 'arm.L')
+
+        # the mappers of the same options and dictionary share the translated names
+        other = importer.RenamedBoneMapper(rename_LR_bones=True, translator=self.__translator([('腕', 'arm'), ('頭', 'head')]))
+        self.assertIs(other._RenamedBoneMapper__name_table, mapper._RenamedBoneMapper__name_table)
+
+        # a changed dictionary or options make a new table
+        other = importer.RenamedBoneMapper(rename_LR_bones=True, translator=self.__translator([('腕', 'ARM')]))
+        self.assertEqual(other.translate('左腕'), 'ARM.L')
+        other = importer.RenamedBoneMapper(rename_LR_bones=True, use_underscore=True, translator=translator)
+        self.assertEqual(other.translate('左腕'), 'arm_L')
+        other = importer.RenamedBoneMapper(rename_LR_bones=False)
+        self.assertEqual(other.translate('左腕'), '左腕')
+        self.assertEqual(mapper.translate('左腕'), 'arm.L')
+
+        # the number of the tables is limited
+        for i in range(20):
+            importer.RenamedBoneMapper(translator=self.__translator([('腕', 'arm%d'%i)]))
+        self.assertLessEqual(len(importer.RenamedBoneMapper._RenamedBoneMapper__name_tables), 8)
+        self.assertEqual(mapper.translate('左腕'), 'arm.L')
+
+    def test_mirror_mapper(self):
+        '''
+        '''
+        data_map = {'左腕':1, '右腕':2, 'arm.L':3, 'head':4}
+        mapper = importer._MirrorMapper(data_map)
+        for name in ('左腕', '右腕', 'arm.R', 'arm.L', 'head', 'unknown'):
+            self.assertEqual(importer._MirrorMapper.flip_name(name), FlipPose.flip_name(name))
+        self.assertEqual(mapper.get('左腕'), 2)
+        self.assertEqual(mapper.get('arm.R'), 3)
+        self.assertEqual(mapper.get('head'), 4)
+        self.assertEqual(mapper.get('unknown', 0), 0)
+
+        for i in range(5000):
+            importer._MirrorMapper.flip_name('bone%d.L'%i)
+        self.assertLessEqual(importer._MirrorMapper.flip_name.cache_info().currsize, 4096)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
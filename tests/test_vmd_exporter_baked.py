@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Quaternion
+
+from miu_mmd_tools.core import quaternions
+from miu_mmd_tools.core.vmd import exporter
+
+class TestVmdExporterBaked(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __new_armature(self, name, count=6):
+        rng = np.random.default_rng(0)
+        obj = bpy.data.objects.new(name, bpy.data.armatures.new(name))
+        bpy.context.scene.collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+        bpy.ops.object.mode_set(mode='EDIT')
+        edit_bones = obj.data.edit_bones
+        for i in range(count):
+            b = edit_bones.new('bone%d'%i)
+            b.head = rng.normal(size=3)
+            b.tail = np.array(b.head) + rng.normal(size=3)
+            b.roll = rng.normal()
+            if i % 3:
+                b.parent = edit_bones[i-1]
+        bpy.ops.object.mode_set(mode='OBJECT')
+        for pb in obj.pose.bones:
+            pb.rotation_quaternion = rng.normal(size=4)
+            pb.location = rng.normal(size=3)
+        bpy.context.view_layer.update()
+        return obj
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_pose_basis_matrices(self):
+        '''
+        '''
+        obj = self.__new_armature('baked_pose')
+        pose_bones = obj.pose.bones
+        matrices = np.empty(len(pose_bones)*16, dtype=np.float32)
+        pose_bones.foreach_get('matrix', matrices)
+        matrices = matrices.reshape(1, -1, 4, 4).transpose(0, 1, 3, 2).astype(np.float64)
+        bone_indices = {b.name:i for i, b in enumerate(pose_bones)}
+        parents = [bone_indices[b.parent.name] if b.parent else -1 for b in pose_bones]
+        rest_matrices = np.array([b.bone.matrix_local for b in pose_bones])
+
+        result = exporter._poseBasisMatrices(matrices, rest_matrices, parents)
+        self.assertEqual(result.shape, matrices.shape)
+        for i, pb in enumerate(pose_bones):
+            self.assertLess(np.abs(result[0, i] - np.array(pb.matrix_basis)).max(), 1e-5, pb.name)
+
+        rotations = quaternions.matrixQuaternions(result[0, :, :3, :3])
+        for i, pb in enumerate(pose_bones):
+            expected = np.array(pb.rotation_quaternion.normalized())
+            self.assertLess(np.abs(rotations[i]*np.sign(np.dot(rotations[i], expected)) - expected).max(), 1e-5)
+
+    def test_matrix_quaternions(self):
+        '''
+        '''
+        rng = np.random.default_rng(1)
+        rotations = rng.normal(size=(1000, 4))
+        rotations[:10, 0] = 0 # 180 degrees
+        rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+        scales = rng.uniform(0.5, 2, size=(len(rotations), 1, 3))
+        matrices = np.array([Quaternion(x).to_matrix() for x in rotations]) * scales
+
+        result = quaternions.matrixQuaternions(matrices)
+        expected = np.array([tuple(Quaternion(x).to_matrix().to_quaternion()) for x in rotations])
+        self.assertTrue((result[:, 0] >= 0).all())
+        # q and -q are the same rotation
+        signs = np.where((result*expected).sum(axis=1) < 0, -1, 1)[:, None]
+        self.assertLess(np.abs(result*signs - expected).max(), 1e-5)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
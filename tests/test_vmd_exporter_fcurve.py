@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+
+from miu_mmd_tools.core.vmd.exporter import _FCurve
+
+class TestVmdExporterFCurve(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __new_fcurve(self, name, keys):
+        obj = bpy.data.objects.new(name, None)
+        obj.keyframe_insert(data_path='location', index=0, frame=1)
+        action = obj.animation_data.action
+        fcurves = getattr(action, 'fcurves', None)
+        if fcurves is None: # layered actions
+            fcurves = action.layers[0].strips[0].channelbag(action.slots[0]).fcurves
+        fcurve = fcurves[0]
+        fcurve.keyframe_points.clear()
+        fcurve.keyframe_points.add(len(keys))
+        # unsorted key frames
+        for kp, (frame, value, interpolation) in zip(fcurve.keyframe_points, reversed(keys)):
+            kp.co = (frame, value)
+            kp.interpolation = interpolation
+        fcurve.update()
+        return fcurve
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_frame_numbers(self):
+        '''
+        '''
+        keys = [(3, 0.0, 'CONSTANT'), (10, 1.0, 'LINEAR'), (20, 2.0, 'BEZIER'), (40, -1.0, 'CONSTANT'), (40.2, 0.5, 'BEZIER')]
+        curve = _FCurve(0.0)
+        self.assertEqual(curve.frameNumbers().tolist(), [])
+        curve.setFCurve(self.__new_fcurve('frame_numbers', keys))
+        frame_numbers = curve.frameNumbers().tolist()
+        # the constant curve adds the frame before the next key
+        self.assertEqual(frame_numbers[:4], [3, 9, 10, 20])
+        self.assertEqual(frame_numbers[-1], 40)
+        self.assertEqual(frame_numbers, sorted(set(frame_numbers)))
+
+    def test_sample_frames(self):
+        '''
+        '''
+        keys = [(3, 0.0, 'CONSTANT'), (10, 1.0, 'LINEAR'), (20, 2.0, 'BEZIER'), (40, -1.0, 'CONSTANT'), (40.2, 0.5, 'BEZIER')]
+        fcurve = self.__new_fcurve('sample_frames', keys)
+        curve = _FCurve(0.0)
+        curve.setFCurve(fcurve)
+        frame_numbers = sorted(set(curve.frameNumbers().tolist()) | set(range(0, 50, 3)))
+        samples = list(curve.sampleFrames(frame_numbers))
+        self.assertEqual(len(samples), len(frame_numbers))
+        for f, (value, interp) in zip(frame_numbers, samples):
+            if f <= 3:
+                self.assertEqual(value, 0.0)
+            elif f >= 40:
+                # the first key of the same frame number, and the last key after the last frame
+                self.assertEqual(value, -1.0 if f == 40 else 0.5)
+            else:
+                self.assertAlmostEqual(value, fcurve.evaluate(f), places=4)
+            self.assertEqual(len(interp), 2)
+
+        self.assertEqual(list(_FCurve(1.5).sampleFrames([1, 2])), [[1.5, ((20, 20), (107, 107))]]*2)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Matrix, Vector
+
+from miu_mmd_tools.core.vmd import exporter
+from miu_mmd_tools.core.vmd.importer import BoneConverter
+
+class _PoseBone:
+    def __init__(self, matrix_local):
+        self.bone = type('Bone', (), {'matrix_local':matrix_local})()
+
+class TestVmdExporterInterp(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __bone_interpolation(self, x_axis, y_axis, z_axis, rotation):
+        """ The layout of a VMD bone interpolation block """
+        x_x1, x_y1, x_x2, x_y2 = x_axis
+        y_x1, y_y1, y_x2, y_y2 = y_axis
+        z_x1, z_y1, z_x2, z_y2 = z_axis
+        r_x1, r_y1, r_x2, r_y2 = rotation
+        return [
+            x_x1, y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,
+            y_x1, z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,
+            z_x1, r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,
+            r_x1, x_y1, y_y1, z_y1, r_y1, x_x2, y_x2, z_x2, r_x2, x_y2, y_y2, z_y2, r_y2,    0,    0,    0,
+            ]
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_bone_interpolations(self):
+        '''
+        '''
+        rng = np.random.default_rng(0)
+        control_points = rng.integers(0, 128, size=(100, 4, 4))
+        result = exporter._vmdBoneInterpolations(control_points)
+        self.assertEqual(result.shape, (100, 64))
+        self.assertEqual(result.dtype, np.uint8)
+        self.assertEqual(result.tolist(), [self.__bone_interpolation(*x) for x in control_points.tolist()])
+        self.assertEqual(exporter._vmdBoneInterpolations([]).shape, (0, 64))
+
+        # the interpolations of the exported axes are read back by the importer
+        pose_bone = _PoseBone(Matrix.Rotation(2.0, 4, Vector((1, 2, 3)).normalized()))
+        export_converter = BoneConverter(pose_bone, 1, invert=True)
+        import_converter = BoneConverter(pose_bone, 1)
+        exported = [list(export_converter.convert_interpolation(x[:3])) + [x[3]] for x in control_points.tolist()]
+        interp = exporter._vmdBoneInterpolations(exported)
+        indices = tuple(import_converter.convert_interpolation((0, 16, 32))) + (48,)
+        for i, idx in enumerate(indices):
+            self.assertEqual(interp[:, idx:idx+16:4].tolist(), control_points[:, i].tolist())
+
+    def test_control_points(self):
+        '''
+        '''
+        rng = np.random.default_rng(1)
+        count = 500
+        co = np.stack([np.cumsum(rng.uniform(0, 10, count)), rng.normal(size=count)], axis=1)
+        co[5::50, 1] = co[4::50, 1] # flat curves
+        handle_left = co - rng.uniform(-1, 8, size=(count, 2))*(1, 0.5)
+        handle_right = co + rng.uniform(-1, 8, size=(count, 2))*(1, 0.5)
+        co, handle_left, handle_right = (x.astype(np.float32).astype(np.float64) for x in (co, handle_left, handle_right))
+
+        result = exporter._vmdControlPoints(*exporter._fcurveBezierPoints(co, handle_right, handle_left))
+        self.assertEqual(result.shape, (count - 1, 4))
+        for i, points in enumerate(result.tolist()):
+            kp0 = exporter._KeyFrame(co[i], handle_left[i], handle_right[i], 'BEZIER')
+            kp1 = exporter._KeyFrame(co[i+1], handle_left[i+1], handle_right[i+1], 'BEZIER')
+            (x1, y1), (x2, y2) = exporter._FCurve.getVMDControlPoints(kp0, kp1)
+            # the rounding of float32 and float64 can differ
+            self.assertLessEqual(np.abs(np.array(points) - (x1, y1, x2, y2)).max(), 1)
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
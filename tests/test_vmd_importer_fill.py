@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+
+import bpy
+import numpy as np
+from mathutils import Euler, Matrix, Quaternion, Vector
+
+from miu_mmd_tools.core.vmd.importer import BoneConverter, VMDImporter
+
+class _PoseBone:
+    def __init__(self, matrix_local, rotation_mode='QUATERNION'):
+        self.bone = type('Bone', (), {'matrix_local':matrix_local})()
+        self.rotation_mode = rotation_mode
+
+class TestVmdImporterFill(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __new_fcurve(self, name):
+        obj = bpy.data.objects.new(name, None)
+        obj.keyframe_insert(data_path='location', index=0, frame=1)
+        action = obj.animation_data.action
+        fcurves = getattr(action, 'fcurves', None)
+        if fcurves is None: # layered actions
+            fcurves = action.layers[0].strips[0].channelbag(action.slots[0]).fcurves
+        fcurve = fcurves[0]
+        fcurve.keyframe_points.clear()
+        return fcurve
+
+    def __keyframe_data(self, fcurve):
+        return [(tuple(kp.co), tuple(kp.handle_left), tuple(kp.handle_right),
+                 kp.interpolation, kp.handle_left_type, kp.handle_right_type) for kp in fcurve.keyframe_points]
+
+    def __converter(self, rotation_mode='QUATERNION'):
+        importer = object.__new__(VMDImporter)
+        importer._VMDImporter__bone_util_cls = BoneConverter
+        importer._VMDImporter__scale = 0.08
+        pose_bone = _PoseBone(Matrix.Rotation(0.7, 4, Vector((1, 2, 3)).normalized()), rotation_mode)
+        return importer._VMDImporter__getBoneConverter(pose_bone)
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_convert_arrays(self):
+        '''
+        '''
+        rng = np.random.default_rng(0)
+        rotations = rng.normal(size=(200, 4))
+        rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+        rotations[0] = (0, 0, 0, 1)
+        locations = rng.normal(size=(200, 3))
+        defaults = {'QUATERNION':Quaternion(), 'XYZ':Euler(), 'AXIS_ANGLE':(0, 0, 1, 0)}
+        for mode, prev_rot in defaults.items():
+            converter = self.__converter(mode)
+            expected = []
+            for rot in rotations:
+                curr_rot = converter.compatible_rotation(prev_rot, converter.convert_rotation(rot))
+                expected.append(tuple(curr_rot))
+                prev_rot = curr_rot
+            result = converter.convert_rotations(rotations, defaults[mode])
+            self.assertLess(np.abs(result - expected).max(), 1e-5, mode)
+
+        expected = [tuple(converter.convert_location(x)) for x in locations]
+        self.assertLess(np.abs(converter.convert_locations(locations) - expected).max(), 1e-5)
+
+    def test_fill_fcurve(self):
+        '''
+        '''
+        rng = np.random.default_rng(0)
+        count = 500
+        frames = np.sort(rng.choice(5000, count, replace=False)) + 6
+        values = rng.normal(size=count)
+        beziers = rng.integers(0, 128, size=(count, 4))
+        beziers[::3] = (20, 20, 107, 107)
+
+        # the keys added one by one
+        fcurve = self.__new_fcurve('fcurve_keys')
+        fcurve.keyframe_points.add(count + 1)
+        kp_iter = iter(fcurve.keyframe_points)
+        kp = next(kp_iter)
+        kp.co = (1, 0.5)
+        kp.interpolation = 'LINEAR'
+        prev_kp = None
+        for frame, value, bezier, kp in zip(frames, values, beziers, kp_iter):
+            kp.co = (frame, value)
+            if prev_kp is not None:
+                VMDImporter._VMDImporter__setInterpolation(tuple(bezier), prev_kp, kp)
+            prev_kp = kp
+        VMDImporter._VMDImporter__fixFcurveHandles(fcurve)
+
+        result = self.__new_fcurve('fcurve_arrays')
+        VMDImporter._VMDImporter__fillFCurve(result, frames, values, beziers, (1, 0.5))
+
+        expected_data, result_data = self.__keyframe_data(fcurve), self.__keyframe_data(result)
+        self.assertEqual(len(expected_data), len(result_data))
+        for expected, data in zip(expected_data, result_data):
+            for a, b in zip(expected[:3], data[:3]):
+                self.assertLess(np.abs(np.array(a) - b).max(), 1e-3)
+            self.assertEqual(expected[3:], data[3:])
+
+    def test_append_fcurve(self):
+        '''
+        '''
+        rng = np.random.default_rng(1)
+        clips = []
+        # the second clip is set by foreach_set(), and the third clip is set key by key
+        for frame_offset, count in ((6, 40), (120, 40), (300, 4)):
+            frames = np.sort(rng.choice(100, count, replace=False)) + frame_offset
+            clips.append((frames, rng.normal(size=count), rng.integers(0, 128, size=(count, 4))))
+
+        result = self.__new_fcurve('fcurve_append')
+        for i, (frames, values, beziers) in enumerate(clips):
+            VMDImporter._VMDImporter__fillFCurve(result, frames, values, beziers, (1, 0.5) if i == 0 else None)
+        result_data = self.__keyframe_data(result)
+        self.assertEqual(len(result_data), 85)
+        self.assertEqual([x[0][0] for x in result_data], [1] + [f for c in clips for f in c[0].tolist()])
+
+        start = 1
+        for i, (frames, values, beziers) in enumerate(clips):
+            expected = self.__new_fcurve('fcurve_clip_%d'%i)
+            VMDImporter._VMDImporter__fillFCurve(expected, frames, values, beziers)
+            expected_data = self.__keyframe_data(expected)
+            data = result_data[start:start+len(frames)]
+            start += len(frames)
+            # the keys between the clips are linear, and the inner keys are the same as the clips
+            if i < len(clips) - 1:
+                self.assertEqual(data[-1][3], 'LINEAR')
+            for k, (a, b) in enumerate(zip(expected_data, data)):
+                self.assertEqual(a[0], b[0])
+                if k < len(frames) - 1:
+                    self.assertEqual(a[2], b[2])
+                    self.assertEqual(a[3], b[3])
+                if k > 0:
+                    self.assertEqual(a[1], b[1])
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
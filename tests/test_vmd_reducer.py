@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import math
+import sys
+import unittest
+
+import numpy as np
+
+from miu_mmd_tools.core import vmd
+from miu_mmd_tools.core.vmd import reducer
+from miu_mmd_tools.core.vmd import toolkit
+
+class TestVmdReducer(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __dense_track(self, count=301):
+        frames = np.arange(count)
+        s = (frames%100)/100.0
+        locations = np.zeros((count, 3))
+        locations[:, 0] = np.floor(frames/100)*10 + 10*s*s*(3 - 2*s) # ease in/out
+        locations[:, 1] = np.sin(frames/30.0)
+        angles = frames/100.0
+        rotations = np.stack([np.sin(angles/2), 0*angles, 0*angles, np.cos(angles/2)], axis=1)
+        animation = vmd.BoneAnimation()
+        return animation.setTrack('bone', frame_number=frames, location=locations, rotation=rotations)
+
+    def __max_errors(self, source, result):
+        """ Evaluate the reduced keys at the frames of the source keys """
+        records = result.records
+        location_error = rotation_error = 0
+        for row in source.records:
+            cut = toolkit._cut_at(vmd.BoneFrameKey, records, int(row['frame_number']))
+            key = cut[cut['frame_number'] == row['frame_number']][0]
+            location_error = max(location_error, np.abs(key['location'] - row['location']).max())
+            q0, q1 = key['rotation'].astype(np.float64), row['rotation'].astype(np.float64)
+            rotation_error = max(rotation_error, math.degrees(2*math.acos(min(1, abs(np.dot(q0, q1))))))
+        return location_error, rotation_error
+
+    def __dense_errors(self, source, result):
+        """ Evaluate both keys at every frame of the source keys """
+        location_error = rotation_error = 0
+        for frame in range(int(source['frame_number'][0]), int(source['frame_number'][-1]) + 1):
+            keys = []
+            for records in (source.records, result.records):
+                cut = toolkit._cut_at(vmd.BoneFrameKey, records, frame)
+                keys.append(cut[cut['frame_number'] == frame][0])
+            location_error = max(location_error, np.abs(keys[0]['location'] - keys[1]['location']).max())
+            q0, q1 = keys[0]['rotation'].astype(np.float64), keys[1]['rotation'].astype(np.float64)
+            rotation_error = max(rotation_error, math.degrees(2*math.acos(min(1, abs(np.dot(q0, q1))))))
+        return location_error, rotation_error
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_fit_curve(self):
+        '''
+        '''
+        x = np.arange(1, 20)/20.0
+        for curve in ((20, 20, 107, 107), (64, 0, 64, 127), (10, 90, 40, 127)):
+            y = reducer._evaluate(np.array([curve], dtype=np.float64), x)[0]
+            result, error = reducer.fitCurve(x, y)
+            self.assertLess(error, 0.005)
+        self.assertEqual(reducer.fitCurve(x, x), ((20, 20, 107, 107), 0.0))
+        self.assertGreater(reducer.fitCurve(x, np.sin(x*10))[1], 0.1)
+
+    def test_bone_keys(self):
+        '''
+        '''
+        track = self.__dense_track()
+        keyframe_reducer = reducer.KeyframeReducer(location_tolerance=0.01, rotation_tolerance=0.5)
+        result = keyframe_reducer.reduceBoneKeys(track)
+        self.assertLess(len(result), len(track)/4)
+        self.assertEqual(result['frame_number'][0], 0)
+        self.assertEqual(result['frame_number'][-1], 300)
+        self.assertEqual((keyframe_reducer.key_count, keyframe_reducer.reduced_key_count), (len(track), len(result)))
+        self.assertLessEqual(keyframe_reducer.max_location_error, 0.01)
+        self.assertLessEqual(keyframe_reducer.max_rotation_error, 0.5)
+
+        location_error, rotation_error = self.__max_errors(track, result)
+        self.assertLess(location_error, 0.011)
+        self.assertLess(rotation_error, 0.55)
+
+        # the keys of random motion are kept
+        animation = vmd.BoneAnimation()
+        locations = np.random.default_rng(0).normal(size=(50, 3))
+        track = animation.setTrack('bone', frame_number=range(50), location=locations)
+        self.assertGreater(len(keyframe_reducer.reduceBoneKeys(track)), 45)
+
+    def test_sparse_eased_keys(self):
+        '''
+        '''
+        locations = np.zeros((3, 3))
+        locations[:, 0] = (0, 5, 10)
+        rotations = np.tile([0, 0, 0, 1], (3, 1))
+        animation = vmd.BoneAnimation()
+        track = animation.setTrack('bone', frame_number=[0, 30, 60], location=locations, rotation=rotations)
+        for k in (1, 2):
+            toolkit._set_curve(track['interp'][k], toolkit._bone_curve_indices(0), (127, 0, 0, 127))
+
+        keyframe_reducer = reducer.KeyframeReducer(location_tolerance=0.01, rotation_tolerance=0.5)
+        result = keyframe_reducer.reduceBoneKeys(track)
+        location_error, rotation_error = self.__dense_errors(track, result)
+        self.assertLessEqual(location_error, 0.011)
+        self.assertLessEqual(keyframe_reducer.max_location_error, 0.01)
+        # the eased segments can not be merged into one curve
+        self.assertEqual(list(result['frame_number']), [0, 30, 60])
+
+        track = self.__dense_track()
+        keyframe_reducer = reducer.KeyframeReducer(location_tolerance=0.01, rotation_tolerance=0.5)
+        result = keyframe_reducer.reduceBoneKeys(track)
+        location_error, rotation_error = self.__dense_errors(track, result)
+        self.assertLess(location_error, 0.011)
+        self.assertLess(rotation_error, 0.55)
+
+    def test_shape_keys(self):
+        '''
+        '''
+        animation = vmd.ShapeKeyAnimation()
+        weights = np.concatenate([np.linspace(0, 1, 11), np.linspace(1, 0.5, 11)[1:], np.full(10, 0.5)])
+        animation.setTrack('morph', frame_number=range(len(weights)), weight=weights)
+        keyframe_reducer = reducer.KeyframeReducer()
+        keyframe_reducer.reduceAnimation(animation)
+        self.assertEqual(animation['morph']['frame_number'].tolist(), [0, 10, 20, 30])
+        self.assertLessEqual(keyframe_reducer.max_weight_error, 0.005)
+        self.assertAlmostEqual(keyframe_reducer.compressionRatio(), len(weights)/4)
+        self.assertIn('%d keys to 4 keys'%len(weights), keyframe_reducer.report())
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import unittest
+
+from miu_mmd_tools.core import vmd
+from miu_mmd_tools.core.vmd import toolkit
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class TestVmdToolkit(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __bone_key(self, frame_number, location=(0, 0, 0), rotation=(0, 0, 0, 1), curve=(20, 20, 107, 107)):
+        frameKey = vmd.BoneFrameKey()
+        frameKey.frame_number = frame_number
+        frameKey.location = location
+        frameKey.rotation = rotation
+        interp = [0]*64
+        for channel in range(4):
+            for indices, value in zip(toolkit._bone_curve_indices(channel), curve):
+                for i in indices:
+                    interp[i] = value
+        frameKey.interp = tuple(interp)
+        return frameKey
+
+    def __shape_key(self, frame_number, weight):
+        frameKey = vmd.ShapeKeyFrameKey()
+        frameKey.frame_number = frame_number
+        frameKey.weight = weight
+        return frameKey
+
+    def __create_file(self, bone_keys=(), shape_keys=(), model_name='model'):
+        ret = toolkit._new_file(model_name)
+        for name, frameKeys in bone_keys:
+            ret.boneAnimation[name] = list(frameKeys)
+        for name, frameKeys in shape_keys:
+            ret.shapeKeyAnimation[name] = list(frameKeys)
+        return ret
+
+    def __frames(self, frameKeys):
+        return [x.frame_number for x in frameKeys]
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_merge(self):
+        '''
+        '''
+        file0 = self.__create_file([('a', [self.__bone_key(0, (0, 0, 0)), self.__bone_key(10, (1, 0, 0))])],
+                                   [('m', [self.__shape_key(5, 0.5)])])
+        file1 = self.__create_file([('a', [self.__bone_key(10, (2, 0, 0)), self.__bone_key(20, (3, 0, 0))]),
+                                    ('b', [self.__bone_key(0)])])
+        path = os.path.join(TESTS_DIR, 'output', 'toolkit_merge.vmd')
+        file1.save(filepath=path)
+
+        result = toolkit.merge([file0, path])
+        self.assertEqual(list(result.boneAnimation.keys()), ['a', 'b'])
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [0, 10, 20])
+        self.assertEqual(result.boneAnimation['a'][1].location, (2, 0, 0))
+        self.assertEqual(len(result.shapeKeyAnimation['m']), 1)
+        self.assertEqual(result.header.model_name, 'model')
+
+        result = toolkit.merge([file0, path], conflict='FIRST')
+        self.assertEqual(result.boneAnimation['a'][1].location, (1, 0, 0))
+        self.assertRaises(toolkit.FrameConflictError, toolkit.merge, [file0, path], conflict='ERROR')
+        self.assertRaises(ValueError, toolkit.merge, [file0], conflict='UNKNOWN')
+
+        # the result can be saved and loaded
+        result.save(filepath=path)
+        result = toolkit.load(path)
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [0, 10, 20])
+
+    def test_slice(self):
+        '''
+        '''
+        vmd_file = self.__create_file([
+            ('a', [self.__bone_key(0, (0, 0, 0)), self.__bone_key(10, (10, 0, 0)), self.__bone_key(20, (20, 0, 0), curve=(64, 0, 64, 127))]),
+            ('before', [self.__bone_key(0, (5, 0, 0))]),
+            ('after', [self.__bone_key(50, (5, 0, 0))]),
+            ], [('m', [self.__shape_key(0, 0.0), self.__shape_key(10, 1.0)])])
+
+        result = toolkit.slice_frames(vmd_file, 5, 15)
+        track = result.boneAnimation['a']
+        self.assertEqual(self.__frames(track), [5, 10, 15])
+        self.assertAlmostEqual(track[0].location[0], 5, places=3) # linear
+        y = self.__bezier_y(toolkit._bezier_points((64, 0, 64, 127)), 0.5)
+        self.assertAlmostEqual(track[2].location[0], 10 + 10*y, places=3)
+        self.assertEqual(self.__frames(result.boneAnimation['before']), [5])
+        self.assertEqual(self.__frames(result.boneAnimation['after']), [5])
+        self.assertAlmostEqual(result.shapeKeyAnimation['m'][0].weight, 0.5, places=3)
+
+        # the split curves make the same motion as the source curve
+        curve = (64, 0, 64, 127)
+        for x in (0.25, 0.5, 0.8):
+            y, head, tail = toolkit._split_bezier(curve, x)
+            for s in (0.3, 0.7):
+                points = toolkit._bezier_points(curve)
+                expected = self.__bezier_y(points, s*x)
+                self.assertAlmostEqual(self.__bezier_y(toolkit._bezier_points(head), s)*y, expected, delta=0.02)
+                expected = self.__bezier_y(points, x + s*(1 - x))
+                self.assertAlmostEqual(y + self.__bezier_y(toolkit._bezier_points(tail), s)*(1 - y), expected, delta=0.02)
+
+        result = toolkit.slice_frames(vmd_file, 10, rebase=True)
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [0, 10])
+        self.assertEqual(result.boneAnimation['a'][1].interp, vmd_file.boneAnimation['a'][2].interp)
+        self.assertRaises(ValueError, toolkit.slice_frames, vmd_file, 10, 5)
+
+    def __bezier_y(self, points, x):
+        t = toolkit._solve_bezier(points, x)
+        (_, _), (_, y1), (_, y2), (_, _) = points
+        u = 1 - t
+        return 3*u*u*t*y1 + 3*u*t*t*y2 + t*t*t
+
+    def test_retime(self):
+        '''
+        '''
+        vmd_file = self.__create_file([('a', [self.__bone_key(x*10, (x, 0, 0), curve=(30, 10, 90, 120)) for x in range(5)])])
+        result = toolkit.retime(vmd_file, offset=5, scale=2.0)
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [5, 25, 45, 65, 85])
+        self.assertEqual([x.interp for x in result.boneAnimation['a']], [x.interp for x in vmd_file.boneAnimation['a']])
+
+        result = toolkit.retime(vmd_file, offset=-15)
+        track = result.boneAnimation['a']
+        self.assertEqual(self.__frames(track), [0, 5, 15, 25])
+        self.assertAlmostEqual(track[1].location[0], 2, places=3)
+
+        result = toolkit.retime(vmd_file, scale=0.1)
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [0, 1, 2, 3, 4])
+        self.assertRaises(ValueError, toolkit.retime, vmd_file, scale=0)
+
+    def test_rename(self):
+        '''
+        '''
+        vmd_file = self.__create_file([('a', [self.__bone_key(0)]), ('b', [self.__bone_key(10)]), ('c', [self.__bone_key(0)])],
+                                      [('m', [self.__shape_key(0, 1.0)])])
+        frameKey = vmd.PropertyFrameKey()
+        frameKey.ik_states = [('a', True), ('c', False)]
+        vmd_file.propertyAnimation.append(frameKey)
+
+        result = toolkit.rename_tracks(vmd_file, bone_names={'b':'a', 'c':None}, shape_key_names=str.upper)
+        self.assertEqual(list(result.boneAnimation.keys()), ['a'])
+        self.assertEqual(self.__frames(result.boneAnimation['a']), [0, 10])
+        self.assertEqual(list(result.shapeKeyAnimation.keys()), ['M'])
+        self.assertEqual(result.propertyAnimation[0].ik_states, [('a', True)])
+        self.assertEqual(vmd_file.propertyAnimation[0].ik_states, [('a', True), ('c', False)])
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import struct
+import sys
+import unittest
+
+from miu_mmd_tools.core import vmd
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, TESTS_DIR)
+import synthetic_data
+
+class TestVmdTrackTable(unittest.TestCase):
+
+    def setUp(self):
+        '''
+        '''
+        import logging
+        logger = logging.getLogger()
+        logger.setLevel('ERROR')
+
+    #********************************************
+    # Utils
+    #********************************************
+
+    def __output_path(self, name):
+        return os.path.join(TESTS_DIR, 'output', name)
+
+    def __key_data(self, frameKey):
+        return tuple(getattr(frameKey, x) for x in frameKey.__slots__)
+
+    def __animation_data(self, animation):
+        if isinstance(animation, dict):
+            return {k:[self.__key_data(x) for x in v] for k, v in animation.items()}
+        return [self.__key_data(x) for x in animation]
+
+    def __create_file(self):
+        vmd_file = synthetic_data.create_vmd_file(bone_count=12, frame_count=30, morph_count=5)
+        # keys of the tracks are not sorted by frame numbers
+        vmd_file.boneAnimation['bone1'].reverse()
+        vmd_file.boneAnimation['bone2'][3].rotation = (0, 0, 0, 0)
+        vmd_file.cameraAnimation = vmd.CameraAnimation()
+        vmd_file.lampAnimation = vmd.LampAnimation()
+        vmd_file.selfShadowAnimation = vmd.SelfShadowAnimation()
+        for frame in (50, 3, 20):
+            k = vmd.CameraKeyFrameKey()
+            k.frame_number, k.distance, k.angle, k.persp = frame, -45.0, 30, frame != 3
+            k.location, k.rotation, k.interp = (0.5, 10.0, 0.0), (0.25, 0.0, 0.0), tuple(range(24))
+            vmd_file.cameraAnimation.append(k)
+            k = vmd.LampKeyFrameKey()
+            k.frame_number, k.color, k.direction = frame, (0.5, 0.5, 0.5), (-0.5, -1.0, 0.5)
+            vmd_file.lampAnimation.append(k)
+            k = vmd.SelfShadowFrameKey()
+            k.frame_number, k.mode, k.distance = frame, 1, 8875.0
+            vmd_file.selfShadowAnimation.append(k)
+        path = self.__output_path('track_table.vmd')
+        vmd_file.save(filepath=path)
+        return path
+
+    #********************************************
+    # Test Function
+    #********************************************
+
+    def test_load(self):
+        '''
+        '''
+        path = self.__create_file()
+        for use_mmap in (False, True):
+            source_vmd, result_vmd = vmd.File(), vmd.File()
+            source_vmd.load(filepath=path, use_mmap=use_mmap)
+            result_vmd.load(filepath=path, use_mmap=use_mmap, use_arrays=True)
+            self.assertEqual(list(result_vmd.boneAnimation.keys()), list(source_vmd.boneAnimation.keys()))
+            self.assertEqual(len(result_vmd.cameraAnimation), 3)
+            for name in ('boneAnimation', 'shapeKeyAnimation', 'cameraAnimation', 'lampAnimation', 'selfShadowAnimation'):
+                self.assertEqual(self.__animation_data(getattr(source_vmd, name)), self.__animation_data(getattr(result_vmd, name)), name)
+
+        track = result_vmd.boneAnimation['bone1']
+        self.assertIsInstance(track, vmd._TrackTable)
+        self.assertEqual(track['frame_number'].tolist(), list(range(29, -1, -1)))
+        self.assertEqual(track['location'].shape, (30, 3))
+        self.assertEqual(self.__key_data(track[-1]), self.__key_data(source_vmd.boneAnimation['bone1'][-1]))
+        self.assertEqual(len(track[2:5]), 3)
+        self.assertRaises(IndexError, track.__getitem__, 30)
+        self.assertEqual(result_vmd.boneAnimation['bone2'][3].rotation, (0, 0, 0, 1))
+
+        track.sort()
+        self.assertEqual(track['frame_number'].tolist(), list(range(30)))
+        track.sort(key=lambda x:-x.frame_number)
+        self.assertEqual([x.frame_number for x in track], list(range(29, -1, -1)))
+
+    def test_lazy(self):
+        '''
+        '''
+        path = self.__create_file()
+        source_vmd = vmd.File()
+        source_vmd.load(filepath=path)
+        for use_mmap in (False, True):
+            result_vmd = vmd.File()
+            result_vmd.load(filepath=path, use_mmap=use_mmap, lazy=True)
+            bone_anim = result_vmd.boneAnimation
+            self.assertEqual(list(bone_anim.keys()), list(source_vmd.boneAnimation.keys()))
+            self.assertEqual([len(x) for x in bone_anim.values()], [len(x) for x in source_vmd.boneAnimation.values()])
+            self.assertFalse(any(x.loaded for x in bone_anim.values()))
+
+            track = bone_anim['bone2']
+            self.assertEqual(track[3].rotation, (0, 0, 0, 1))
+            self.assertTrue(track.loaded)
+            self.assertEqual([x.loaded for x in bone_anim.values()].count(True), 1)
+            self.assertEqual(self.__animation_data(source_vmd.boneAnimation), self.__animation_data(bone_anim))
+            self.assertEqual(self.__animation_data(source_vmd.shapeKeyAnimation), self.__animation_data(result_vmd.shapeKeyAnimation))
+
+    def test_save(self):
+        '''
+        '''
+        path = self.__create_file()
+        # the tables and the frame key objects are saved to the same data
+        object_vmd = vmd.File()
+        object_vmd.load(filepath=path)
+        object_path = self.__output_path('track_table1.vmd')
+        object_vmd.save(filepath=object_path)
+        source_vmd = vmd.File()
+        source_vmd.load(filepath=path, use_arrays=True)
+        output_path = self.__output_path('track_table2.vmd')
+        source_vmd.save(filepath=output_path)
+        with open(object_path, 'rb') as f0, open(output_path, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+        # renamed tracks are saved with the new names
+        source_vmd.shapeKeyAnimation['renamed'] = source_vmd.shapeKeyAnimation.pop('morph0')
+        source_vmd.save(filepath=output_path)
+        result_vmd = vmd.File()
+        result_vmd.load(filepath=output_path, use_arrays=True)
+        self.assertEqual(set(result_vmd.shapeKeyAnimation.keys()), {'renamed', 'morph1', 'morph2', 'morph3', 'morph4'})
+        self.assertEqual(result_vmd.shapeKeyAnimation['renamed']['weight'].tolist(), source_vmd.shapeKeyAnimation['renamed']['weight'].tolist())
+
+    def test_set_track(self):
+        '''
+        '''
+        source_vmd = synthetic_data.create_vmd_file(bone_count=3, frame_count=20, morph_count=2)
+        result_vmd = vmd.File()
+        result_vmd.header = source_vmd.header
+        result_vmd.boneAnimation = vmd.BoneAnimation()
+        for name, frameKeys in source_vmd.boneAnimation.items():
+            result_vmd.boneAnimation.setTrack(name,
+                frame_number=[x.frame_number for x in frameKeys],
+                location=[x.location for x in frameKeys],
+                rotation=[x.rotation for x in frameKeys],
+                interp=[x.interp for x in frameKeys],
+                )
+        result_vmd.shapeKeyAnimation = vmd.ShapeKeyAnimation()
+        for name, frameKeys in source_vmd.shapeKeyAnimation.items():
+            track = result_vmd.shapeKeyAnimation.setTrack(name, frame_number=[x.frame_number for x in frameKeys])
+            track['weight'][:] = [x.weight for x in frameKeys]
+        result_vmd.shapeKeyAnimation.setTrack('empty')
+        source_vmd.shapeKeyAnimation['empty'] = []
+
+        source_path, result_path = self.__output_path('set_track1.vmd'), self.__output_path('set_track2.vmd')
+        source_vmd.save(filepath=source_path)
+        result_vmd.save(filepath=result_path)
+        with open(source_path, 'rb') as f0, open(result_path, 'rb') as f1:
+            self.assertEqual(f0.read(), f1.read())
+
+    def test_records(self):
+        '''
+        '''
+        path = self.__create_file()
+        source_vmd = vmd.File()
+        source_vmd.load(filepath=path)
+        # the records are the same data as the frame keys saved one by one
+        for name in ('cameraAnimation', 'lampAnimation', 'selfShadowAnimation'):
+            animation = getattr(source_vmd, name)
+            f = io.BytesIO()
+            for frameKey in animation:
+                frameKey.save(f)
+            self.assertEqual(animation.frameClass().toRecords(animation).tobytes(), f.getvalue(), name)
+        frameKeys = source_vmd.boneAnimation['bone1']
+        f = io.BytesIO()
+        for frameKey in frameKeys:
+            f.write(b'bone1'.ljust(15, b'\x00'))
+            frameKey.save(f)
+        records = vmd.BoneFrameKey.toRecords(frameKeys)
+        records['name'] = b'bone1'
+        self.assertEqual(records.tobytes(), f.getvalue())
+
+        frameKeys[0].interp = (128,)*64
+        self.assertRaises(struct.error, vmd.BoneFrameKey.toRecords, frameKeys)
+
+        records = vmd.SelfShadowFrameKey.toRecords(source_vmd.selfShadowAnimation)
+        records['mode'][-1] = 3
+        with self.assertRaisesRegex(struct.error, 'invalid self shadow mode 3 at frame %d'%records['frame_number'][-1]):
+            vmd.SelfShadowFrameKey.fromRecords(records)
+
+        # the frame numbers out of the range of '<L' are not written
+        frameKeys[0].interp = (0,)*64
+        frameKeys[0].frame_number = -1
+        self.assertRaises(struct.error, vmd.BoneFrameKey.toRecords, frameKeys)
+        shapeKeys = source_vmd.shapeKeyAnimation['morph1']
+        shapeKeys[-1].frame_number = 1 << 32
+        self.assertRaises(struct.error, vmd.ShapeKeyFrameKey.toRecords, shapeKeys)
+        self.assertRaises(struct.error, vmd.BoneAnimation().setTrack, 'bone', frame_number=[0, -1])
+
+    def test_decoded_names(self):
+        '''
+        '''
+        path = self.__output_path('track_table_names.vmd')
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<30s20sL', vmd.Header.VMD_SIGN, b'names', 3))
+            for name, frame in ((b'bone\x00abc', 5), (b'bone', 3), (b'bone\x00xyz', 1)):
+                f.write(struct.pack('<15sL3f4f64b', name, frame, 0, 0, 0, 0, 0, 0, 1, *([20]*64)))
+            f.write(struct.pack('<L', 0))
+        source_vmd, result_vmd = vmd.File(), vmd.File()
+        source_vmd.load(filepath=path)
+        result_vmd.load(filepath=path, use_arrays=True)
+        self.assertEqual(list(result_vmd.boneAnimation.keys()), ['bone'])
+        self.assertEqual(result_vmd.boneAnimation['bone']['frame_number'].tolist(), [5, 3, 1])
+        self.assertEqual(self.__animation_data(source_vmd.boneAnimation), self.__animation_data(result_vmd.boneAnimation))
+
+if __name__ == '__main__':
+    sys.argv = [__file__] + (sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else [])
+    unittest.main()